@@ -0,0 +1,38 @@
+"""Add lease_token to triplets
+
+Revision ID: 72c1ba7fb746
+Revises: 535b046814a0
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "72c1ba7fb746"
+down_revision: Union[str, None] = "535b046814a0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "triplet",
+        sa.Column("lease_token", sa.Uuid(), nullable=True),
+        schema=config.db_schema,
+    )
+    op.add_column(
+        "validation_triplet",
+        sa.Column("lease_token", sa.Uuid(), nullable=True),
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("validation_triplet", "lease_token", schema=config.db_schema)
+    op.drop_column("triplet", "lease_token", schema=config.db_schema)
@@ -0,0 +1,81 @@
+"""Index unlabeled triplets for the dispatch
+
+Revision ID: b2ac325430e6
+Revises: 72c1ba7fb746
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "b2ac325430e6"
+down_revision: Union[str, None] = "72c1ba7fb746"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE_NAMES = ["triplet", "validation_triplet"]
+# These single-column indexes are not used by the dispatch and stats queries, but are maintained on each insert and label write
+REDUNDANT_INDEXED_COLUMNS = ["id", "label", "user_id", "retrieved_at"]
+
+
+# The indexes are built concurrently so that the triplet tables are not locked while they are built, which requires running outside of the migration transaction
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table_name in TABLE_NAMES:
+            op.create_index(
+                f"ix_{table_name}_unlabeled_id",
+                table_name,
+                ["id"],
+                schema=config.db_schema,
+                postgresql_include=["retrieved_at"],
+                postgresql_where=sa.text("label IS NULL"),
+                postgresql_concurrently=True,
+            )
+            op.create_index(
+                f"ix_{table_name}_unlabeled_user_id_id",
+                table_name,
+                ["user_id", "id"],
+                schema=config.db_schema,
+                postgresql_include=["retrieved_at"],
+                postgresql_where=sa.text("label IS NULL"),
+                postgresql_concurrently=True,
+            )
+            for column_name in REDUNDANT_INDEXED_COLUMNS:
+                op.drop_index(
+                    f"ix_{config.db_schema}_{table_name}_{column_name}",
+                    table_name=table_name,
+                    schema=config.db_schema,
+                    postgresql_concurrently=True,
+                    if_exists=True,
+                )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table_name in TABLE_NAMES:
+            for column_name in REDUNDANT_INDEXED_COLUMNS:
+                op.create_index(
+                    f"ix_{config.db_schema}_{table_name}_{column_name}",
+                    table_name,
+                    [column_name],
+                    schema=config.db_schema,
+                    postgresql_concurrently=True,
+                )
+            op.drop_index(
+                f"ix_{table_name}_unlabeled_user_id_id",
+                table_name=table_name,
+                schema=config.db_schema,
+                postgresql_concurrently=True,
+            )
+            op.drop_index(
+                f"ix_{table_name}_unlabeled_id",
+                table_name=table_name,
+                schema=config.db_schema,
+                postgresql_concurrently=True,
+            )
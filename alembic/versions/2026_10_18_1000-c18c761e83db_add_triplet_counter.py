@@ -0,0 +1,45 @@
+"""Add triplet_counter
+
+Revision ID: c18c761e83db
+Revises: b2ac325430e6
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "c18c761e83db"
+down_revision: Union[str, None] = "b2ac325430e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "triplet_counter",
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("slot", sa.Integer(), nullable=False),
+        sa.Column("labeled", sa.BigInteger(), nullable=False),
+        sa.Column("unlabeled", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("table_name", "slot"),
+        schema=config.db_schema,
+    )
+    # The counters start from the current content of the triplet tables
+    for table_name in ("triplet", "validation_triplet"):
+        op.execute(
+            f"""
+            INSERT INTO {config.db_schema}.triplet_counter (table_name, slot, labeled, unlabeled)
+            SELECT '{table_name}', 0, count(*) FILTER (WHERE label IS NOT NULL), count(*) FILTER (WHERE label IS NULL)
+            FROM {config.db_schema}.{table_name}
+            """,
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("triplet_counter", schema=config.db_schema)
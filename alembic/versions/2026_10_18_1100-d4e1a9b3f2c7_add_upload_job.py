@@ -0,0 +1,64 @@
+"""Add upload_job
+
+Revision ID: d4e1a9b3f2c7
+Revises: c18c761e83db
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "d4e1a9b3f2c7"
+down_revision: Union[str, None] = "c18c761e83db"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+upload_job_status = sa.Enum(
+    "QUEUED",
+    "RUNNING",
+    "SUCCEEDED",
+    "FAILED",
+    name="uploadjobstatus",
+    schema=config.db_schema,
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "upload_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("status", upload_job_status, nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        schema=config.db_schema,
+    )
+    op.create_index(
+        op.f(f"ix_{config.db_schema}_upload_job_status"),
+        "upload_job",
+        ["status"],
+        unique=False,
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f(f"ix_{config.db_schema}_upload_job_status"),
+        table_name="upload_job",
+        schema=config.db_schema,
+    )
+    op.drop_table("upload_job", schema=config.db_schema)
+    upload_job_status.drop(op.get_bind())
@@ -0,0 +1,73 @@
+"""Add upload_job_phase, replacing all_triplets_upload_status
+
+Revision ID: e7b2c5d8a1f4
+Revises: d4e1a9b3f2c7
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b2c5d8a1f4"
+down_revision: Union[str, None] = "d4e1a9b3f2c7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+upload_phase = sa.Enum(
+    "EXTRACT",
+    "VALIDATE",
+    "ITEMS",
+    "TRIPLETS",
+    "VALIDATION_TRIPLETS",
+    "IMAGES",
+    name="uploadphase",
+    schema=config.db_schema,
+)
+ALL_TRIPLETS_UPLOAD_STATUS_COLUMNS = ["id", "to_upload_count", "uploaded_count"]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "upload_job_phase",
+        sa.Column("job_id", sa.Integer(), nullable=False),
+        sa.Column("phase", upload_phase, nullable=False),
+        sa.Column("total_count", sa.BigInteger(), nullable=True),
+        sa.Column("done_count", sa.BigInteger(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["job_id"],
+            [f"{config.db_schema}.upload_job.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("job_id", "phase"),
+        schema=config.db_schema,
+    )
+    op.drop_table("all_triplets_upload_status", schema=config.db_schema)
+
+
+def downgrade() -> None:
+    op.create_table(
+        "all_triplets_upload_status",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("to_upload_count", sa.Integer(), nullable=True),
+        sa.Column("uploaded_count", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        schema=config.db_schema,
+    )
+    for column_name in ALL_TRIPLETS_UPLOAD_STATUS_COLUMNS:
+        op.create_index(
+            f"ix_{config.db_schema}_all_triplets_upload_status_{column_name}",
+            "all_triplets_upload_status",
+            [column_name],
+            schema=config.db_schema,
+        )
+    op.drop_table("upload_job_phase", schema=config.db_schema)
+    upload_phase.drop(op.get_bind())
@@ -0,0 +1,43 @@
+"""Add upload_session
+
+Revision ID: f3a8d6c2b9e5
+Revises: e7b2c5d8a1f4
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a8d6c2b9e5"
+down_revision: Union[str, None] = "e7b2c5d8a1f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "upload_session",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=True),
+        sa.Column("chunks_count", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("job_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["job_id"],
+            [f"{config.db_schema}.upload_job.id"],
+            ondelete="SET NULL",
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("upload_session", schema=config.db_schema)
@@ -0,0 +1,40 @@
+"""Add the vectors of the items, when enabled
+
+Revision ID: a9c4e7f1d3b6
+Revises: f3a8d6c2b9e5
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "a9c4e7f1d3b6"
+down_revision: Union[str, None] = "f3a8d6c2b9e5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Adding a value to an enum cannot be undone, the downgrade leaves it
+def upgrade() -> None:
+    op.execute(
+        f"ALTER TYPE {config.db_schema}.uploadphase ADD VALUE IF NOT EXISTS 'VECTORS' AFTER 'ITEMS'",
+    )
+    # The column needs the pgvector extension, it is only added when the vectors are enabled
+    if config.items_vectors:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        op.add_column(
+            "item",
+            sa.Column("vector", Vector(config.vector_dimension), nullable=True),
+            schema=config.db_schema,
+        )
+
+
+def downgrade() -> None:
+    op.execute(f"ALTER TABLE {config.db_schema}.item DROP COLUMN IF EXISTS vector")
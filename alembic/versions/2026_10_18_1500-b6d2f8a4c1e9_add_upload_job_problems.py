@@ -0,0 +1,32 @@
+"""Add the problems found by the validation of the datapacks to the upload jobs
+
+Revision ID: b6d2f8a4c1e9
+Revises: a9c4e7f1d3b6
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "b6d2f8a4c1e9"
+down_revision: Union[str, None] = "a9c4e7f1d3b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "upload_job",
+        sa.Column("problems", sa.JSON(), nullable=True),
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("upload_job", "problems", schema=config.db_schema)
@@ -0,0 +1,106 @@
+"""Add the natural keys of the triplets and the datapack_file table
+
+Revision ID: c7e3a9f5d2b8
+Revises: b6d2f8a4c1e9
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "c7e3a9f5d2b8"
+down_revision: Union[str, None] = "b6d2f8a4c1e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NATURAL_KEYS = {
+    "triplet": ["reference_id", "left_id", "right_id", "encoder_id"],
+    "validation_triplet": [
+        "reference_id",
+        "left_id",
+        "left_encoder_id",
+        "right_id",
+        "right_encoder_id",
+    ],
+}
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    for table_name, key_columns in NATURAL_KEYS.items():
+        same_key = " AND ".join(
+            f"duplicate.{column_name} = original.{column_name}"
+            for column_name in key_columns
+        )
+        # The unlabeled duplicates are removed, keeping the labeled triplet or else the first one. The labeled duplicates hold labels, they have to be dealt with by hand
+        op.execute(
+            f"""
+            DELETE FROM {config.db_schema}.{table_name} AS duplicate
+            USING {config.db_schema}.{table_name} AS original
+            WHERE duplicate.label IS NULL AND {same_key}
+            AND (original.label IS NOT NULL OR original.id < duplicate.id)
+            """,
+        )
+        labeled_duplicates_count = connection.execute(
+            sa.text(
+                f"""
+                SELECT count(*) FROM (
+                    SELECT 1 FROM {config.db_schema}.{table_name}
+                    GROUP BY {", ".join(key_columns)} HAVING count(*) > 1
+                ) AS duplicates
+                """,
+            ),
+        ).scalar_one()
+        if labeled_duplicates_count:
+            msg = f"{labeled_duplicates_count} triplets of the {table_name} table have several labeled copies, they have to be deduplicated before upgrading."
+            raise RuntimeError(msg)
+        op.create_unique_constraint(
+            f"uq_{table_name}_natural_key",
+            table_name,
+            key_columns,
+            schema=config.db_schema,
+        )
+        # The counters start again from the content of the table
+        op.execute(
+            f"DELETE FROM {config.db_schema}.triplet_counter WHERE table_name = '{table_name}'",
+        )
+        op.execute(
+            f"""
+            INSERT INTO {config.db_schema}.triplet_counter (table_name, slot, labeled, unlabeled)
+            SELECT '{table_name}', 0, count(*) FILTER (WHERE label IS NOT NULL), count(*) FILTER (WHERE label IS NULL)
+            FROM {config.db_schema}.{table_name}
+            """,
+        )
+
+    op.create_table(
+        "datapack_file",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.Column("rows_count", sa.BigInteger(), nullable=False),
+        sa.Column("job_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["job_id"],
+            [f"{config.db_schema}.upload_job.id"],
+            ondelete="SET NULL",
+        ),
+        sa.PrimaryKeyConstraint("name", "sha256"),
+        schema=config.db_schema,
+    )
+
+
+# The removed duplicates are not restored
+def downgrade() -> None:
+    op.drop_table("datapack_file", schema=config.db_schema)
+    for table_name in NATURAL_KEYS:
+        op.drop_constraint(
+            f"uq_{table_name}_natural_key",
+            table_name,
+            schema=config.db_schema,
+        )
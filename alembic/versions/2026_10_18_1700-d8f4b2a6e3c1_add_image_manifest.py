@@ -0,0 +1,39 @@
+"""Add the image table, the manifest of the stored images
+
+The manifest of an existing images folder is filled by running `make scan-images` once upgraded.
+
+Revision ID: d8f4b2a6e3c1
+Revises: c7e3a9f5d2b8
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "d8f4b2a6e3c1"
+down_revision: Union[str, None] = "c7e3a9f5d2b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "image",
+        sa.Column("item_id", sa.String(), nullable=False),
+        sa.Column("canonical", sa.Boolean(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("mtime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("item_id", "canonical"),
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("image", schema=config.db_schema)
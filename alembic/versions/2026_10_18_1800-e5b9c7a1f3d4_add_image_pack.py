@@ -0,0 +1,50 @@
+"""Add the place of the images in their packs to the manifest
+
+Revision ID: e5b9c7a1f3d4
+Revises: d8f4b2a6e3c1
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from backend.config.config import config
+
+# revision identifiers, used by Alembic.
+revision: str = "e5b9c7a1f3d4"
+down_revision: Union[str, None] = "d8f4b2a6e3c1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "image",
+        sa.Column("pack", sa.Integer(), nullable=True),
+        schema=config.db_schema,
+    )
+    op.add_column(
+        "image",
+        sa.Column("offset", sa.BigInteger(), nullable=True),
+        schema=config.db_schema,
+    )
+    op.create_index(
+        op.f(f"ix_{config.db_schema}_image_pack"),
+        "image",
+        ["pack"],
+        unique=False,
+        schema=config.db_schema,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f(f"ix_{config.db_schema}_image_pack"),
+        table_name="image",
+        schema=config.db_schema,
+    )
+    op.drop_column("image", "offset", schema=config.db_schema)
+    op.drop_column("image", "pack", schema=config.db_schema)
@@ -0,0 +1,30 @@
+"""Add the vectors of the items when they were enabled after they were added
+
+Revision ID: b7d3f9a2c6e8
+Revises: e5b9c7a1f3d4
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+from backend.config.config import config
+from backend.core.database.manage import create_items_vector_column
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d3f9a2c6e8"
+down_revision: Union[str, None] = "e5b9c7a1f3d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The column is only added by a9c4e7f1d3b6 when the vectors were enabled then, the app adds it at startup when they are enabled later
+def upgrade() -> None:
+    if config.items_vectors:
+        create_items_vector_column(op.get_bind())
+
+
+# The column is dropped by the downgrade of a9c4e7f1d3b6
+def downgrade() -> None:
+    pass
@@ -3,6 +3,14 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from backend.images_utils.enums import (
+    ImageFormat,
+    ImagesBackend,
+    ImagesLayout,
+    ImagesOffload,
+)
+from backend.upload.enums import CsvEngine, IngestMethod
+
 load_dotenv()
 
 
@@ -16,9 +24,65 @@ class Config:
             cls._instance.setup_config()
         return cls._instance
 
+    # The storage of the images, their variants and how they are served
+    def setup_images_config(self, workspace_dir: Path) -> None:
+        self.images_path = workspace_dir / "data" / "images"
+        # The sharded layout keeps the folders small when there are millions of images, an existing flat folder is migrated by `make shard-images`
+        self.images_layout = ImagesLayout(os.environ.get("IMAGES_LAYOUT", "flat"))
+        # The packs store millions of images in a few large files, served from the offsets of the images in them. A pack is not appended to above the maximum size in bytes, and is rewritten by `make compact-images` once less than the given ratio of it is still used
+        self.images_backend = ImagesBackend(os.environ.get("IMAGES_BACKEND", "files"))
+        self.images_packs_path = workspace_dir / "data" / "packs"
+        self.images_pack_max_size = int(
+            os.environ.get("IMAGES_PACK_MAX_SIZE", 1024**3),
+        )
+        self.images_packs_compaction_ratio = 0.5
+        # The images of an id never change, the browsers keep them for a year
+        self.images_cache_max_age_in_seconds = 365 * 24 * 60 * 60
+        # Resized or transcoded copies of the images, generated once with Pillow and kept in a cache whose least recently used variants are removed above its maximum size in bytes. The requested widths are rounded up to one of the given widths, which bounds the number of variants of an image
+        self.images_variants_path = workspace_dir / "data" / "variants"
+        self.images_variants_widths = [128, 256, 512, 1024]
+        self.images_variants_max_size = int(
+            os.environ.get("IMAGES_VARIANTS_MAX_SIZE", 10 * 1024**3),
+        )
+        self.images_variants_workers = int(
+            os.environ.get("IMAGES_VARIANTS_WORKERS", 2),
+        )
+        self.images_variants_quality = 80
+        # The variants generated while the images are uploaded, as width:format pairs like 256:webp
+        pregenerated_variants = os.environ.get("IMAGES_PREGENERATED_VARIANTS", "")
+        self.images_pregenerated_variants = [
+            (int(width), ImageFormat(image_format))
+            for width, image_format in (
+                variant.split(":")
+                for variant in pregenerated_variants.split(",")
+                if variant
+            )
+        ]
+        # The most requested images are kept in the memory of each process of the app, within this budget in bytes, 0 disabling it. The larger images are always read from the disk
+        self.images_memory_cache_size = int(
+            os.environ.get("IMAGES_MEMORY_CACHE_SIZE", 256 * 1024**2),
+        )
+        self.images_memory_cache_max_entry_size = 4 * 1024**2
+        # How long the listener of the changes of the images waits before reconnecting to the database
+        self.images_changes_retry_in_seconds = 5
+        # The files of the images and of their variants can be sent by the reverse proxy in front of the app, the workers only answering with a header naming them. With nginx, each prefix is an internal location aliasing its folder. The packed images are always sent by the app
+        self.images_offload = ImagesOffload(os.environ.get("IMAGES_OFFLOAD", "none"))
+        self.images_offload_prefixes = {
+            self.images_path: os.environ.get(
+                "IMAGES_OFFLOAD_PREFIX",
+                "/internal/images/",
+            ),
+            self.images_variants_path: os.environ.get(
+                "IMAGES_VARIANTS_OFFLOAD_PREFIX",
+                "/internal/variants/",
+            ),
+        }
+
     def setup_config(self) -> None:
         workspace_dir = Path(os.environ["WORKSPACE_DIR"])
-        self.images_path = workspace_dir / "data" / "images"
+        self.setup_images_config(workspace_dir)
+        self.uploads_path = workspace_dir / "data" / "uploads"
+        self.upload_sessions_path = self.uploads_path / "sessions"
 
         self.dev_mod = bool(os.environ.get("DEV_MOD", False))
 
@@ -33,7 +97,49 @@ class Config:
         self.db_schema = os.environ["DB_SCHEMA"]
 
         self.lock_timeout_in_seconds = 30
+        self.max_lease_batch_size = 50
+        self.max_labels_batch_size = 500
+        self.triplet_counter_slots = 8
+
+        # The uploaded data is written to the database by chunks, each of them being committed
+        self.ingest_method = IngestMethod(os.environ.get("INGEST_METHOD", "copy"))
+        self.ingest_chunk_size = 50_000
+        self.csv_engine = CsvEngine(os.environ.get("CSV_ENGINE", "c"))
+        # The pyarrow engine reads the csv files by blocks of this size in bytes rather than by number of rows
+        self.csv_block_size = 4 * 1024 * 1024
+        # The images are moved by chunks too, so that the upload progress is updated regularly
+        self.images_chunk_size = 1_000
+        # The images of a chunk are written by a bounded pool of threads, each of them decompressing, checking and hashing its images. The pool is bounded by the cores, beyond which the decompression does not go faster
+        self.images_workers = int(
+            os.environ.get("IMAGES_WORKERS", min(4, os.cpu_count() or 1)),
+        )
+        # The signatures and the checksums of the chunks of the images are checked while they are written, so that a corrupt image is never stored nor served
+        self.images_check_png = True
+        # The uploaded files are streamed by chunks of this size in bytes, which bounds the memory used whatever their size
+        self.upload_chunk_size = 1024 * 1024
+        self.max_upload_size = int(os.environ.get("MAX_UPLOAD_SIZE", 50 * 1024**3))
+        # Large datapacks can be uploaded by chunks in an upload session, which can be resumed until it expires
+        self.max_upload_chunk_size = 64 * 1024 * 1024
+        self.upload_session_ttl_in_hours = 48
+        # Protect against zip bombs, whose uncompressed content would fill the disk
+        self.max_datapack_size = int(os.environ.get("MAX_DATAPACK_SIZE", 100 * 1024**3))
+        self.max_datapack_members = 5_000_000
+        self.max_datapack_compression_ratio = 100
+        # A datapack is validated as a whole before anything is written, only the first problems found are reported
+        self.max_reported_problems = 100
+
+        # The uploads are processed by worker processes, at most this number of uploads run at the same time across the whole app
+        self.max_concurrent_uploads = int(os.environ.get("MAX_CONCURRENT_UPLOADS", 1))
+        self.upload_job_heartbeat_in_seconds = 10
+        # A running upload job whose heartbeat is older than this is considered interrupted
+        self.upload_job_stale_timeout_in_seconds = 60
+        # Running a job again only writes what the interrupted run did not, thanks to the natural keys of the triplets and the recorded files
+        self.upload_job_max_attempts = 3
+        # The vectors of the items can be uploaded in the datapacks when enabled, which requires the pgvector extension
+        self.items_vectors = bool(os.environ.get("ITEMS_VECTORS", False))
         self.vector_dimension = 1280
+        # The vectors are much larger than the other rows, so they are written by smaller chunks
+        self.vectors_chunk_size = 2_000
 
 
 config = Config()
@@ -15,6 +15,7 @@ def get_config() -> JSONResponse:
     return JSONResponse(
         content={
             "lock_timeout_in_seconds": config.lock_timeout_in_seconds,
+            "max_lease_batch_size": config.max_lease_batch_size,
         },
         status_code=status.HTTP_200_OK,
     )
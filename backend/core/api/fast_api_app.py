@@ -1,4 +1,8 @@
+from __future__ import annotations
+
+import contextlib
 import logging
+from typing import TYPE_CHECKING
 
 from fastapi import FastAPI
 
@@ -6,13 +10,25 @@ from backend import APP_VERSION
 from backend.config.routes import router as config_router
 from backend.core.api.logging import setup_logging
 from backend.core.api.middlewares import RequestContextLogMiddleware
-from backend.core.database.core import engine
+from backend.core.database.core import SessionLocal, engine
 from backend.core.database.manage import create_all_tables
+from backend.images_utils.listener import ImagesChangesListener
+from backend.images_utils.memory_cache import images_cache
+from backend.images_utils.responses import is_offloaded
 from backend.images_utils.routes import router as images_router
 from backend.similarity.routes import router as similarity_router
 from backend.triplets.routes import router as triplets_router
+from backend.upload import crud as upload_crud
+from backend.upload.jobs import (
+    schedule_upload_jobs_recovery,
+    shutdown_upload_workers,
+    submit_upload_jobs,
+)
 from backend.upload.routes import router as upload_router
 
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
 description = """
 backend API.
 """
@@ -20,6 +36,30 @@ backend API.
 ROOT_PATH = "/api/labelizer/v1"
 
 
+# The upload jobs left by a previous run of the app are resumed at startup, and once more when the jobs it left running are stale. The cache of the images is kept up to date with the changes of the images while the app runs
+@contextlib.asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    db = SessionLocal()
+    upload_jobs_recovery = None
+    try:
+        if upload_crud.has_unfinished_upload_jobs(db):
+            submit_upload_jobs()
+            upload_jobs_recovery = schedule_upload_jobs_recovery()
+    finally:
+        db.close()
+    images_changes_listener = None
+    # The memory cache is not used when the proxy sends the images
+    if images_cache.enabled and not is_offloaded():
+        images_changes_listener = ImagesChangesListener(images_cache)
+        images_changes_listener.start()
+    yield
+    if images_changes_listener is not None:
+        images_changes_listener.stop()
+    if upload_jobs_recovery is not None:
+        upload_jobs_recovery.cancel()
+    shutdown_upload_workers()
+
+
 def setup_app() -> FastAPI:
     """Initialize fastapi app."""
     setup_logging(logging.DEBUG)
@@ -33,6 +73,7 @@ def setup_app() -> FastAPI:
         openapi_url=ROOT_PATH + "/openapi.json",
         docs_url=ROOT_PATH + "/docs",
         redoc_url=None,
+        lifespan=lifespan,
         # responses={
         #     "default": {"message": "Response on failure", "model": ErrorReponse}
         # },
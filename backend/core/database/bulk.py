@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import queue
+import struct
+import threading
+from typing import TYPE_CHECKING, TypeVar
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator, Sequence
+
+    from sqlalchemy import Table
+    from sqlalchemy.orm import Session
+
+T = TypeVar("T")
+
+
+# Loads a dataframe into a table with "COPY FROM STDIN", which is much faster than inserting the rows one by one. The copy happens in the transaction of the session, and the columns of the dataframe have to be named after the columns of the table
+def copy_dataframe(
+    db: Session,
+    table: Table | str,
+    dataframe: pd.DataFrame,
+) -> None:
+    table_name = table if isinstance(table, str) else table.fullname
+    columns = ", ".join(f'"{column_name}"' for column_name in dataframe.columns)
+    buffer = io.StringIO()
+    # Missing values are written as unquoted empty strings, which are read as NULL by COPY in the csv format
+    dataframe.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+# Loads pgvector vectors along with their ids with the binary format of "COPY FROM STDIN". The rows are built for the whole chunk at once from the arrays, instead of formatting each value as text. The rows are grouped by the length of their id, which is fixed in the structured array of a group, so they are not copied in their order
+def copy_vectors(
+    db: Session,
+    table_name: str,
+    ids: Sequence[str],
+    vectors: np.ndarray,
+    id_column_name: str = "id",
+    vector_column_name: str = "vector",
+) -> None:
+    dimension = vectors.shape[1]
+    encoded_ids = pd.Series(ids, dtype=object).astype(str).str.encode("utf-8")
+    ids_lengths = encoded_ids.str.len().to_numpy()
+    encoded_ids = encoded_ids.to_numpy()
+
+    buffer = io.BytesIO()
+    buffer.write(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    for id_length in np.unique(ids_lengths):
+        # The number of fields of the row, then each field preceded by its size. The binary representation of a pgvector vector is its dimension, an unused field and its values as big-endian floats
+        row_dtype = np.dtype(
+            [
+                ("fields_count", ">i2"),
+                ("id_size", ">i4"),
+                ("id", f"S{id_length}"),
+                ("vector_size", ">i4"),
+                ("dimension", ">i2"),
+                ("unused", ">i2"),
+                ("values", ">f4", (dimension,)),
+            ],
+        )
+        indexes = np.flatnonzero(ids_lengths == id_length)
+        rows = np.empty(len(indexes), dtype=row_dtype)
+        rows["fields_count"] = 2
+        rows["id_size"] = id_length
+        rows["id"] = encoded_ids[indexes]
+        rows["vector_size"] = 4 + 4 * dimension
+        rows["dimension"] = dimension
+        rows["unused"] = 0
+        rows["values"] = vectors[indexes]
+        buffer.write(memoryview(rows).cast("B"))
+    buffer.write(struct.pack(">h", -1))
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY {table_name} ("{id_column_name}", "{vector_column_name}") FROM STDIN WITH (FORMAT binary)',
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+# Creates a temporary table with the given columns of the given table, dropped at the end of the transaction. Useful to copy rows before inserting them with an "ON CONFLICT" clause, which COPY does not support. The defaults are not copied, so that the rows copied to the staging table do not take values from the sequences of the table
+def create_staging_table(db: Session, table: Table, columns: Iterable[str]) -> str:
+    staging_table_name = f"{table.name}_staging"
+    columns = ", ".join(f'"{column_name}"' for column_name in columns)
+    db.execute(
+        text(
+            # The names are the ones of the columns of the table
+            f"CREATE TEMPORARY TABLE {staging_table_name} ON COMMIT DROP AS SELECT {columns} FROM {table.fullname} WITH NO DATA",  # noqa: S608
+        ),
+    )
+    return staging_table_name
+
+
+# Accepts a dataframe or a stream of dataframes, which are split into chunks of at most chunk_size rows
+def iter_chunks(
+    dataframes: pd.DataFrame | Iterable[pd.DataFrame],
+    chunk_size: int,
+) -> Iterator[pd.DataFrame]:
+    if isinstance(dataframes, pd.DataFrame):
+        dataframes = [dataframes]
+    for dataframe in dataframes:
+        for start in range(0, len(dataframe), chunk_size):
+            yield dataframe.iloc[start : start + chunk_size]
+
+
+# Waits for room in the buffer until the consumer stops. Returns whether the item was put
+def _put_until_stopped(
+    buffer: queue.Queue,
+    item: object,
+    stop_event: threading.Event,
+) -> bool:
+    while not stop_event.is_set():
+        with contextlib.suppress(queue.Full):
+            buffer.put(item, timeout=0.1)
+            return True
+    return False
+
+
+# The items are put in the buffer, followed by the error raised while producing them or by the end marker
+def _produce(
+    items: Iterable[object],
+    buffer: queue.Queue,
+    stop_event: threading.Event,
+    done: object,
+) -> None:
+    try:
+        for item in items:
+            if not _put_until_stopped(buffer, item, stop_event):
+                return
+    except BaseException as e:  # noqa: BLE001
+        _put_until_stopped(buffer, e, stop_event)
+    else:
+        _put_until_stopped(buffer, done, stop_event)
+
+
+# The items are produced by a background thread while the previous ones are consumed, so that parsing the next chunk overlaps with writing the current one. At most depth items wait in memory
+def prefetch(items: Iterable[T], depth: int = 2) -> Iterator[T]:
+    done = object()
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_produce,
+        args=(items, buffer, stop_event, done),
+        daemon=True,
+    )
+    thread.start()
+    try:
+        while (item := buffer.get()) is not done:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Also stops the producer when the consumer stops early
+        stop_event.set()
+        thread.join()
+
+
+# Missing values are represented as NaN by pandas, while the database driver expects None
+def to_records(dataframe: pd.DataFrame) -> list[dict]:
+    return dataframe.astype(object).where(dataframe.notna(), None).to_dict("records")
@@ -1,5 +1,8 @@
 import logging
 
+from sqlalchemy import Connection, text
+
+from backend.config.config import config
 from backend.core.database.core import Base, SessionLocal
 
 logging.basicConfig(level=logging.INFO)
@@ -11,8 +14,24 @@ def drop_all_tables(engine) -> None:
     Base.metadata.drop_all(bind=engine)
 
 
+# The column of the vectors needs the pgvector extension, it is added to the existing table once the vectors are enabled, whenever that happens
+def create_items_vector_column(connection: Connection) -> None:
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    connection.execute(
+        text(
+            f"ALTER TABLE {config.db_schema}.item ADD COLUMN IF NOT EXISTS vector vector({config.vector_dimension})",
+        ),
+    )
+
+
 def create_all_tables(engine) -> None:
+    if config.items_vectors:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
     Base.metadata.create_all(bind=engine)
+    if config.items_vectors:
+        with engine.begin() as connection:
+            create_items_vector_column(connection)
 
 
 def get_db() -> SessionLocal:
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import logging
+import uuid
+from typing import TYPE_CHECKING
+
+import anyio
+from starlette.responses import StreamingResponse
+
+from backend.images_utils import crud
+from backend.images_utils.storage import images_storage
+from backend.images_utils.utils import get_image_name
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterable
+
+    from sqlalchemy.orm import Session
+
+    from backend.images_utils.models import Image
+
+logger = logging.getLogger()
+
+BUNDLE_CHUNK_SIZE = 64 * 1024
+
+
+def _get_part_headers(image: Image, boundary: str) -> bytes:
+    name = get_image_name(image.item_id, image.canonical)
+    return (
+        f"--{boundary}\r\n"
+        "Content-Type: image/png\r\n"
+        f'Content-Disposition: inline; name="{image.item_id}"; filename="{name}"\r\n'
+        f"Content-Length: {image.size}\r\n"
+        f'ETag: "{image.sha256}"\r\n'
+        "\r\n"
+    ).encode()
+
+
+# Each image is read from the storage while the bundle is sent, so that only one chunk of a file is held in memory
+async def iter_images_bundle(
+    images: list[Image],
+    boundary: str,
+) -> AsyncIterator[bytes]:
+    for image in images:
+        try:
+            file = anyio.wrap_file(
+                await anyio.to_thread.run_sync(images_storage.open_image, image),
+            )
+        except FileNotFoundError:
+            logger.warning(
+                "Image %s is in the manifest but not stored.",
+                get_image_name(image.item_id, image.canonical),
+            )
+            continue
+        async with file:
+            yield _get_part_headers(image, boundary)
+            while chunk := await file.read(BUNDLE_CHUNK_SIZE):
+                yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+# The images of the given items are sent in a single multipart/mixed response, each of them once even when an item is in several triplets. Each part is named after the item and the file of its image, the images which are not stored being left out
+def get_images_bundle_response(
+    db: Session,
+    item_ids: Iterable[str],
+    canonical: bool = False,
+) -> StreamingResponse:
+    item_ids = list(dict.fromkeys(item_ids))
+    stored_images = {
+        (image.item_id, image.canonical): image
+        for image in crud.get_images(db, item_ids)
+    }
+    images = [
+        stored_images[item_id, is_canonical]
+        for item_id in item_ids
+        for is_canonical in ([False, True] if canonical else [False])
+        if (item_id, is_canonical) in stored_images
+    ]
+    boundary = uuid.uuid4().hex
+    return StreamingResponse(
+        iter_images_bundle(images, boundary),
+        media_type=f"multipart/mixed; boundary={boundary}",
+    )
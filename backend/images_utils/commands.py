@@ -0,0 +1,179 @@
+# Maintenance commands of the images, run with `python -m backend.images_utils.commands <command>`
+from __future__ import annotations
+
+import argparse
+import datetime
+import hashlib
+import itertools
+import logging
+import os
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+# The models referenced by the triplets have to be imported for their relationships to be resolved
+import backend.items.models  # noqa: F401
+from backend.config.config import config
+from backend.core.database.core import SessionLocal, engine
+from backend.images_utils import crud
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.storage import ImagesStorage, PacksStorage, images_storage
+from backend.images_utils.utils import (
+    get_image_name,
+    get_image_path,
+    iter_images_files,
+    parse_image_name,
+)
+from backend.images_utils.variants import evict_variants
+from backend.upload.crud import has_unfinished_upload_jobs, hold_upload_jobs_lock
+
+logger = logging.getLogger()
+
+
+def get_image_entry(entry: os.DirEntry) -> dict:
+    digest = hashlib.sha256()
+    with Path(entry.path).open("rb") as image_file:
+        while data := image_file.read(config.upload_chunk_size):
+            digest.update(data)
+    file_stat = entry.stat()
+    item_id, canonical = parse_image_name(entry.name)
+    return {
+        "item_id": item_id,
+        "canonical": canonical,
+        "size": file_stat.st_size,
+        "mtime": datetime.datetime.fromtimestamp(
+            file_stat.st_mtime,
+            datetime.timezone.utc,
+        ),
+        "sha256": digest.hexdigest(),
+    }
+
+
+# Fills the manifest from the images folder, for the images written before the manifest existed
+def scan() -> None:
+    if isinstance(images_storage, PacksStorage):
+        logger.error("The packs are only written along with the manifest.")
+        return
+    db = SessionLocal()
+    images_count = 0
+    try:
+        for chunk in itertools.batched(
+            iter_images_files(),
+            config.images_chunk_size,
+        ):
+            crud.upsert_images(db, [get_image_entry(entry) for entry in chunk])
+            db.commit()
+            images_count += len(chunk)
+    finally:
+        db.close()
+    logger.info("%s images added to the manifest.", images_count)
+
+
+# Deletes the images of the items which are not in any triplet. The entries are removed from the manifest before the files, so that an image is never listed without its file. The space of the packed images is reclaimed by the compaction of their packs. The lock of the claims of the upload jobs is held for the whole collection, so that no upload starts once it is checked that none is in progress
+def gc(storage: ImagesStorage = images_storage) -> int:
+    images_count = 0
+    with (
+        engine.connect() as connection,
+        hold_upload_jobs_lock(connection),
+        Session(bind=connection) as db,
+    ):
+        # The images of an upload in progress may be referenced by the triplets it has not written yet
+        if has_unfinished_upload_jobs(db):
+            logger.error("An upload is in progress, the images are not collected.")
+            return 0
+        while images := crud.delete_unreferenced_images(db, config.images_chunk_size):
+            for item_id, canonical in images:
+                storage.delete_image(item_id, canonical)
+            images_count += len(images)
+    logger.info("%s unreferenced images deleted.", images_count)
+    return images_count
+
+
+# Moves the images of a flat images folder into the sharded layout, in place. It is run while the app is stopped, and can be run again if interrupted
+def shard() -> None:
+    db = SessionLocal()
+    try:
+        if has_unfinished_upload_jobs(db):
+            logger.error("An upload is in progress, the images are not moved.")
+            return
+    finally:
+        db.close()
+    # The names are listed before any image is moved, the folder being changed by the moves
+    with os.scandir(config.images_path) as entries:
+        names = [
+            entry.name
+            for entry in entries
+            if not entry.name.startswith(".") and entry.is_file()
+        ]
+    for name in names:
+        destination = get_image_path(name, config.images_path, ImagesLayout.SHARDED)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        (config.images_path / name).rename(destination)
+    logger.info(
+        "%s images moved, the app can be started with IMAGES_LAYOUT=%s.",
+        len(names),
+        ImagesLayout.SHARDED.value,
+    )
+
+
+# Copies the images still used in the packs which are mostly unused to the last pack, and removes those packs. The last pack, which is being appended to, is never compacted. It can be run while the app is serving the images, their entries being moved to their copies before the packs are removed
+def compact(
+    db: Session | None = None,
+    storage: ImagesStorage = images_storage,
+) -> int:
+    if not isinstance(storage, PacksStorage):
+        logger.error("The images are not stored in packs.")
+        return 0
+    if db is None:
+        with SessionLocal() as session:
+            return compact(session, storage)
+    if has_unfinished_upload_jobs(db):
+        logger.error("An upload is in progress, the packs are not compacted.")
+        return 0
+    packs_count, reclaimed_size = 0, 0
+    usage = crud.get_packs_usage(db)
+    packs = storage.get_packs()
+    for pack, pack_size in list(packs.items())[:-1]:
+        if usage.get(pack, 0) > pack_size * config.images_packs_compaction_ratio:
+            continue
+        # The moved images are no longer in the pack, the next ones are read from the manifest until none is left
+        while images := crud.get_pack_images(db, pack, config.images_chunk_size):
+            moves = []
+            for image in images:
+                stored = storage.write_image(
+                    get_image_name(image.item_id, image.canonical),
+                    [storage.read_image(image)],
+                )
+                moves.append((image, stored.pack, stored.offset))
+            crud.move_packed_images(db, moves)
+            db.commit()
+        storage.delete_pack(pack)
+        packs_count += 1
+        reclaimed_size += pack_size - usage.get(pack, 0)
+    logger.info(
+        "%s packs compacted, %s bytes reclaimed.",
+        packs_count,
+        reclaimed_size,
+    )
+    return packs_count
+
+
+COMMANDS = {
+    "scan": scan,
+    "gc": gc,
+    "shard": shard,
+    "evict-variants": evict_variants,
+    "compact": compact,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Images maintenance commands.")
+    parser.add_argument("command", choices=COMMANDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, delete, exists, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.config.config import config
+from backend.images_utils import models
+from backend.triplets.models import Triplet, ValidationTriplet
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from sqlalchemy.orm import Session
+
+logger = logging.getLogger()
+
+# The processes of the app are notified of the images written again or deleted, to invalidate their caches. The notifications are sent on commit, their payload being limited to 8000 bytes
+IMAGES_CHANNEL = f"{config.db_schema}_images"
+NOTIFICATION_MAX_SIZE = 7_000
+
+
+def notify_images_changed(db: Session, item_ids: Iterable[str]) -> None:
+    batch, batch_size = [], 0
+    for item_id in item_ids:
+        batch.append(item_id)
+        batch_size += len(item_id) + 4
+        if batch_size >= NOTIFICATION_MAX_SIZE:
+            db.execute(select(func.pg_notify(IMAGES_CHANNEL, json.dumps(batch))))
+            batch, batch_size = [], 0
+    if batch:
+        db.execute(select(func.pg_notify(IMAGES_CHANNEL, json.dumps(batch))))
+
+
+def get_image(
+    db: Session,
+    item_id: str,
+    canonical: bool = False,
+) -> models.Image | None:
+    return db.get(models.Image, (item_id, canonical))
+
+
+# Returns the images of the given items which are stored, as pairs of item id and canonical flag
+def get_existing_images(db: Session, item_ids: Iterable[str]) -> set[tuple[str, bool]]:
+    return set(
+        db.execute(
+            select(models.Image.item_id, models.Image.canonical).where(
+                models.Image.item_id.in_(list(item_ids)),
+            ),
+        ).tuples(),
+    )
+
+
+# The sizes and the hashes of the stored images of the given items, by their item ids and canonical flags
+def get_images_hashes(
+    db: Session,
+    item_ids: Iterable[str],
+) -> dict[tuple[str, bool], tuple[int, str]]:
+    return {
+        (item_id, canonical): (size, sha256)
+        for item_id, canonical, size, sha256 in db.execute(
+            select(
+                models.Image.item_id,
+                models.Image.canonical,
+                models.Image.size,
+                models.Image.sha256,
+            ).where(models.Image.item_id.in_(list(item_ids))),
+        ).tuples()
+    }
+
+
+def get_images(db: Session, item_ids: Iterable[str]) -> list[models.Image]:
+    return list(
+        db.scalars(
+            select(models.Image).where(models.Image.item_id.in_(list(item_ids))),
+        ),
+    )
+
+
+# An image written again replaces the previous one, its entry is updated. The caller commits, along with the progress of the upload
+def upsert_images(db: Session, images: list[dict]) -> None:
+    if not images:
+        return
+    statement = insert(models.Image).values(images)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["item_id", "canonical"],
+            set_={
+                "size": statement.excluded.size,
+                "mtime": statement.excluded.mtime,
+                "sha256": statement.excluded.sha256,
+                "pack": statement.excluded.pack,
+                "offset": statement.excluded.offset,
+            },
+        ),
+    )
+    notify_images_changed(db, {image["item_id"] for image in images})
+
+
+# Deletes the entries of at most limit images whose item is not in any triplet, and returns them so that their files can be removed once committed
+def delete_unreferenced_images(db: Session, limit: int) -> list[tuple[str, bool]]:
+    unreferenced = and_(
+        *(
+            ~exists().where(column == models.Image.item_id)
+            for model in (Triplet, ValidationTriplet)
+            for column in (model.reference_id, model.left_id, model.right_id)
+        ),
+    )
+    images = db.execute(
+        delete(models.Image)
+        .where(
+            tuple_(models.Image.item_id, models.Image.canonical).in_(
+                select(models.Image.item_id, models.Image.canonical)
+                .where(unreferenced)
+                .limit(limit),
+            ),
+        )
+        .returning(models.Image.item_id, models.Image.canonical),
+    ).tuples().all()
+    notify_images_changed(db, {item_id for item_id, _ in images})
+    db.commit()
+    return images
+
+
+# The bytes of each pack which are still used by the images in the manifest
+def get_packs_usage(db: Session) -> dict[int, int]:
+    return dict(
+        db.execute(
+            select(models.Image.pack, func.sum(models.Image.size))
+            .where(models.Image.pack.is_not(None))
+            .group_by(models.Image.pack),
+        )
+        .tuples()
+        .all(),
+    )
+
+
+def get_pack_images(db: Session, pack: int, limit: int) -> list[models.Image]:
+    return list(
+        db.scalars(
+            select(models.Image)
+            .where(models.Image.pack == pack)
+            .order_by(models.Image.offset)
+            .limit(limit),
+        ),
+    )
+
+
+# Points the entries of the images copied out of a pack to their new places, unless they have been written again meanwhile. Their content is unchanged, the caches are not notified
+def move_packed_images(
+    db: Session,
+    moves: Iterable[tuple[models.Image, int, int]],
+) -> None:
+    for image, pack, offset in moves:
+        db.execute(
+            update(models.Image)
+            .where(
+                models.Image.item_id == image.item_id,
+                models.Image.canonical == image.canonical,
+                models.Image.pack == image.pack,
+                models.Image.offset == image.offset,
+            )
+            .values(pack=pack, offset=offset),
+        )
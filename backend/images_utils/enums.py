@@ -0,0 +1,32 @@
+from enum import Enum
+
+
+class ImagesLayout(str, Enum):
+    # All the images in the images folder
+    FLAT = "flat"
+    # The images in two levels of subfolders, named after the first hex digits of a hash of their item id
+    SHARDED = "sharded"
+
+
+class ImagesBackend(str, Enum):
+    # Each image in its own file of the images folder
+    FILES = "files"
+    # The images appended to large pack files, their places being recorded in the manifest
+    PACKS = "packs"
+
+
+# The header of the responses which has the reverse proxy in front of the app send the files of the images
+class ImagesOffload(str, Enum):
+    # The app sends the files itself
+    NONE = "none"
+    # nginx, the header naming the file under an internal location
+    ACCEL_REDIRECT = "x-accel-redirect"
+    # Apache and lighttpd, the header giving the path of the file
+    SENDFILE = "x-sendfile"
+
+
+# The formats of the variants of the images
+class ImageFormat(str, Enum):
+    PNG = "png"
+    WEBP = "webp"
+    AVIF = "avif"
@@ -0,0 +1,3 @@
+# Raised when a variant of an image is asked for but cannot be generated by this installation, Pillow being missing or lacking the format
+class ImageVariantsUnavailableError(RuntimeError):
+    pass
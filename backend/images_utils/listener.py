@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+import logging
+import select
+import threading
+from typing import TYPE_CHECKING
+
+import psycopg2
+
+from backend.config.config import config
+from backend.images_utils.crud import IMAGES_CHANNEL
+
+if TYPE_CHECKING:
+    from backend.images_utils.memory_cache import ImagesMemoryCache
+
+logger = logging.getLogger()
+
+# The listener checks this often whether it is stopped
+POLL_TIMEOUT_IN_SECONDS = 1.0
+
+
+# Invalidates the images of the cache of the process which are written again or deleted by the uploads and the maintenance commands, through the notifications of the database. The whole cache is cleared whenever the notifications may have been missed
+class ImagesChangesListener(threading.Thread):
+    def __init__(self, cache: ImagesMemoryCache) -> None:
+        super().__init__(name="images-changes-listener", daemon=True)
+        self.cache = cache
+        self.stopped = threading.Event()
+
+    def _listen(self) -> None:
+        connection = psycopg2.connect(config.db_url)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{IMAGES_CHANNEL}"')
+            self.cache.clear()
+            while not self.stopped.is_set():
+                readable, _, _ = select.select(
+                    [connection],
+                    [],
+                    [],
+                    POLL_TIMEOUT_IN_SECONDS,
+                )
+                if not readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    self.cache.invalidate(json.loads(notification.payload))
+        finally:
+            connection.close()
+
+    # The connection is made again after a while when it is lost
+    def _listen_or_wait(self) -> None:
+        try:
+            self._listen()
+        except psycopg2.Error:
+            logger.exception("The changes of the images are not listened to.")
+            self.cache.clear()
+            self.stopped.wait(config.images_changes_retry_in_seconds)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self._listen_or_wait()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import collections
+import logging
+import threading
+from typing import TYPE_CHECKING, NamedTuple
+
+from backend.config.config import config
+from backend.images_utils import schemas
+
+if TYPE_CHECKING:
+    import datetime
+    from collections.abc import Iterable
+
+    from backend.images_utils.variants import ImageVariant
+
+logger = logging.getLogger()
+
+
+class CachedImage(NamedTuple):
+    headers: dict[str, str]
+    mtime: datetime.datetime
+    media_type: str
+    content: bytes
+
+
+# The images and their variants are cached by item id, canonical flag and variant
+CacheKey = tuple[str, bool, "ImageVariant | None"]
+
+
+# Least recently used images kept in the memory of the process, within a budget in bytes. An image is served from it without querying the manifest nor opening its file, its entries being invalidated when it is written again
+class ImagesMemoryCache:
+    def __init__(self, max_size: int, max_entry_size: int) -> None:
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.entries: collections.OrderedDict[CacheKey, CachedImage] = (
+            collections.OrderedDict()
+        )
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Incremented by each invalidation, so that an image read before it is not cached after it
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: CacheKey) -> CachedImage | None:
+        with self.lock:
+            image = self.entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: CacheKey, image: CachedImage, generation: int) -> None:
+        size = len(image.content)
+        if size > self.max_entry_size:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.content)
+            self.entries[key] = image
+            self.size += size
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.content)
+                self.evictions += 1
+
+    def invalidate(self, item_ids: Iterable[str]) -> None:
+        item_ids = set(item_ids)
+        with self.lock:
+            keys = [key for key in self.entries if key[0] in item_ids]
+            for key in keys:
+                self.size -= len(self.entries.pop(key).content)
+            self.invalidations += len(keys)
+            self.generation += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.generation += 1
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self) -> schemas.ImagesCacheStats:
+        with self.lock:
+            return schemas.ImagesCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+                count=len(self.entries),
+                size=self.size,
+                max_size=self.max_size,
+            )
+
+
+images_cache = ImagesMemoryCache(
+    config.images_memory_cache_size,
+    config.images_memory_cache_max_entry_size,
+)
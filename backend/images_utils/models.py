@@ -0,0 +1,17 @@
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String
+
+from backend.core.database.core import Base
+
+
+# The manifest of the stored images, filled when the images are written so that their existence is known without looking at the images folder
+class Image(Base):
+    __tablename__ = "image"
+
+    item_id = Column(String, primary_key=True)
+    canonical = Column(Boolean, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(DateTime(timezone=True), nullable=False)
+    sha256 = Column(String, nullable=False)
+    # The place of the image in its pack, when the images are stored in packs
+    pack = Column(Integer, nullable=True, index=True)
+    offset = Column(BigInteger, nullable=True)
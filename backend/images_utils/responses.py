@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import datetime
+import email.utils
+import urllib.parse
+from typing import TYPE_CHECKING
+
+import anyio
+from fastapi import HTTPException, status
+from starlette.responses import FileResponse, Response
+
+from backend.config.config import config
+from backend.images_utils.enums import ImagesOffload
+from backend.images_utils.memory_cache import CachedImage, images_cache
+from backend.images_utils.storage import FilesStorage, images_storage
+from backend.images_utils.variants import get_variant_file, read_variant_file
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from starlette.datastructures import Headers
+    from starlette.types import Receive, Scope, Send
+
+    from backend.images_utils.models import Image
+    from backend.images_utils.variants import ImageVariant
+
+# The browsers keep the images without asking for them again. They are only served to logged in users, hence not stored by shared caches
+IMAGES_CACHE_CONTROL = (
+    f"private, max-age={config.images_cache_max_age_in_seconds}, immutable"
+)
+
+IMAGE_MEDIA_TYPE = "image/png"
+
+
+# The validators of an image come from the manifest, so that they are known without opening its file. Those of a variant are derived from them
+def get_image_etag(image: Image, variant: ImageVariant | None = None) -> str:
+    if variant is None:
+        return f'"{image.sha256}"'
+    return f'"{image.sha256}-{variant.width or "full"}-{variant.format.value}"'
+
+
+def get_image_headers(
+    image: Image,
+    variant: ImageVariant | None = None,
+) -> dict[str, str]:
+    return {
+        "etag": get_image_etag(image, variant),
+        "last-modified": email.utils.format_datetime(
+            image.mtime.astimezone(datetime.timezone.utc),
+            usegmt=True,
+        ),
+        "cache-control": IMAGES_CACHE_CONTROL,
+        "accept-ranges": "bytes" if variant is None else "none",
+    }
+
+
+def _parse_etags(header: str) -> list[str]:
+    return [etag.strip().removeprefix("W/") for etag in header.split(",")]
+
+
+# If-None-Match takes precedence over If-Modified-Since, the dates only having a precision of one second
+def is_not_modified(
+    request_headers: Headers,
+    etag: str,
+    mtime: datetime.datetime,
+) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = _parse_etags(if_none_match)
+        return "*" in etags or etag in etags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        modified_since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if modified_since.tzinfo is None:
+        return False
+    return mtime.replace(microsecond=0) <= modified_since
+
+
+# Returns the first and the last bytes of the requested range, or None when the whole image is to be sent. Only single ranges are served, a client asking for several of them gets the whole image, which is allowed
+def get_range(
+    request_headers: Headers,
+    image: Image,
+    etag: str,
+) -> tuple[int, int] | None:
+    range_header = request_headers.get("range")
+    if range_header is None or not range_header.startswith("bytes="):
+        return None
+    # A range of an image which has changed since the client got its first part is not served
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        return None
+    ranges = range_header.removeprefix("bytes=").split(",")
+    if len(ranges) != 1:
+        return None
+    first, _, last = ranges[0].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(image.size - int(last), 0), image.size - 1
+        else:
+            start = int(first)
+            end = min(int(last), image.size - 1) if last else image.size - 1
+    except ValueError:
+        return None
+    if start < 0 or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"content-range": f"bytes */{image.size}"},
+        )
+    return start, end
+
+
+def get_range_headers(
+    headers: dict[str, str],
+    start: int,
+    end: int,
+    size: int,
+) -> dict[str, str]:
+    return {
+        **headers,
+        "content-range": f"bytes {start}-{end}/{size}",
+        "content-length": str(end - start + 1),
+    }
+
+
+# Starlette 0.37 only serves whole files, the bytes of a part of a file are read by chunks from its offset, like the images in their packs
+class FilePartResponse(FileResponse):
+    def __init__(
+        self,
+        path: Path,
+        offset: int,
+        length: int,
+        headers: dict[str, str],
+        status_code: int = status.HTTP_200_OK,
+        media_type: str | None = None,
+    ) -> None:
+        super().__init__(
+            path,
+            status_code=status_code,
+            headers={**headers, "content-length": str(length)},
+            media_type=media_type,
+        )
+        self.offset = offset
+        self.length = length
+
+    async def __call__(self, scope: Scope, _receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            },
+        )
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.length
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                # The file is shorter than the manifest tells, which ends the response early rather than hanging
+                remaining = remaining - len(chunk) if chunk else 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": bool(remaining),
+                    },
+                )
+
+
+# The requested range of an image, whose bytes start at the given offset of the file
+class FileRangeResponse(FilePartResponse):
+    def __init__(
+        self,
+        path: Path,
+        start: int,
+        end: int,
+        size: int,
+        headers: dict[str, str],
+        offset: int = 0,
+        media_type: str | None = None,
+    ) -> None:
+        super().__init__(
+            path,
+            offset + start,
+            end - start + 1,
+            get_range_headers(headers, start, end, size),
+            status.HTTP_206_PARTIAL_CONTENT,
+            media_type,
+        )
+
+
+# The images in their own files are sent by the proxy, the memory cache being of no use to the workers then
+def is_offloaded() -> bool:
+    return config.images_offload != ImagesOffload.NONE and isinstance(
+        images_storage,
+        FilesStorage,
+    )
+
+
+# The header which has the proxy send the file, or None when the file is not in one of the folders it serves
+def get_offload_headers(path: Path) -> dict[str, str] | None:
+    if config.images_offload == ImagesOffload.SENDFILE:
+        return {"x-sendfile": str(path.absolute())}
+    if config.images_offload == ImagesOffload.ACCEL_REDIRECT:
+        for root, prefix in config.images_offload_prefixes.items():
+            if path.is_relative_to(root):
+                location = urllib.parse.quote(path.relative_to(root).as_posix())
+                return {"x-accel-redirect": f"{prefix}{location}"}
+    return None
+
+
+# The whole content of an image or of its variant, read without blocking the event loop
+async def read_image_content(
+    image: Image,
+    variant: ImageVariant | None,
+    path: Path | None,
+) -> bytes:
+    if variant is not None:
+        return await read_variant_file(image, variant, path)
+    if path is not None:
+        return await anyio.Path(path).read_bytes()
+    return await anyio.to_thread.run_sync(images_storage.read_image, image)
+
+
+# Sends an image from the file holding it, or returns None when the image has to be read whole to be kept in the memory cache. The images in their own files are sent whole by starlette, the packed ones by chunks from their offsets in their packs, like the ranges of both
+def get_image_file_response(
+    request_headers: Headers,
+    image: Image,
+    headers: dict[str, str],
+    *,
+    cached: bool,
+) -> Response | None:
+    location = images_storage.get_file_location(image)
+    if location is None:
+        return None
+    path, offset = location
+    image_range = get_range(request_headers, image, headers["etag"])
+    if image_range is not None:
+        return FileRangeResponse(
+            path,
+            *image_range,
+            image.size,
+            headers,
+            offset,
+            IMAGE_MEDIA_TYPE,
+        )
+    if cached:
+        return None
+    if path == images_storage.get_file_path(image):
+        return FileResponse(path, headers=headers, media_type=IMAGE_MEDIA_TYPE)
+    return FilePartResponse(
+        path,
+        offset,
+        image.size,
+        headers,
+        media_type=IMAGE_MEDIA_TYPE,
+    )
+
+
+# Answers the conditional and the range requests of an image, from its entry in the manifest. The variants are only generated when the client does not have them already, and are served whole from memory, so that a variant evicted while it is served is generated again rather than failing the response. Given the generation of the cache when the manifest was read, the image is kept in the memory cache. The images are sent from their files, those kept in the memory cache being read whole in a thread, where reading pages which are not in memory does not block the event loop. When the files are offloaded, the proxy sends them and answers their ranges, the response of the app having no body
+async def get_image_response(
+    request_headers: Headers,
+    image: Image,
+    variant: ImageVariant | None = None,
+    generation: int | None = None,
+) -> Response:
+    headers = get_image_headers(image, variant)
+    if is_not_modified(request_headers, headers["etag"], image.mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    media_type = IMAGE_MEDIA_TYPE
+    if variant is not None:
+        path = await get_variant_file(image, variant)
+        media_type = f"image/{variant.format.value}"
+    else:
+        path = images_storage.get_file_path(image)
+    offload_headers = get_offload_headers(path) if path is not None else None
+    if offload_headers is not None:
+        return Response(headers={**headers, **offload_headers}, media_type=media_type)
+    cached = (
+        generation is not None
+        and images_cache.enabled
+        and (variant is not None or image.size <= images_cache.max_entry_size)
+    )
+    if variant is None:
+        file_response = get_image_file_response(
+            request_headers,
+            image,
+            headers,
+            cached=cached,
+        )
+        if file_response is not None:
+            return file_response
+    content = await read_image_content(image, variant, path)
+    if cached:
+        images_cache.put(
+            (image.item_id, image.canonical, variant),
+            CachedImage(headers, image.mtime, media_type, content),
+            generation,
+        )
+    return Response(content, headers=headers, media_type=media_type)
+
+
+# A cached image is served without querying the manifest nor opening its file
+def get_cached_image_response(
+    request_headers: Headers,
+    cached_image: CachedImage,
+) -> Response:
+    if is_not_modified(
+        request_headers,
+        cached_image.headers["etag"],
+        cached_image.mtime,
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=cached_image.headers,
+        )
+    return Response(
+        cached_image.content,
+        headers=cached_image.headers,
+        media_type=cached_image.media_type,
+    )
@@ -1,10 +1,25 @@
+from __future__ import annotations
+
 import logging
 
-from fastapi import APIRouter, status
-from starlette.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from starlette.responses import Response
 
-from backend.config.config import config
-from backend.core.api.auth.core import UserSession
+from backend.core.api.auth.core import AdminUserSession, UserSession
+from backend.core.database.manage import get_db
+from backend.images_utils import crud, schemas
+from backend.images_utils.enums import ImageFormat
+from backend.images_utils.exceptions import ImageVariantsUnavailableError
+from backend.images_utils.memory_cache import images_cache
+from backend.images_utils.responses import (
+    get_cached_image_response,
+    get_image_response,
+    is_offloaded,
+)
+from backend.images_utils.utils import get_image_name
+from backend.images_utils.variants import get_variant
 
 router = APIRouter(tags=["Images"])
 
@@ -13,14 +28,55 @@ logger = logging.getLogger()
 
 @router.get(
     "/images/{image_id}",
-    summary="Retrieve an image by its id. Does not need the extension. If you need the canonical image, provide 'canonical=true' as a query parameter.",
+    summary="Retrieve an image by its id. Does not need the extension. If you need the canonical image, provide 'canonical=true' as a query parameter. The images can be cached forever, they are revalidated by their ETag and can be fetched by byte ranges. A resized or transcoded variant is given by the 'w' and 'format' query parameters, the width being rounded up to one of the widths of the variants.",
     status_code=status.HTTP_200_OK,
 )
 async def get_image(
     user: UserSession,
+    request: Request,
     image_id: str,
     canonical: bool = False,
-) -> FileResponse:
-    suffix = "_canonical" if canonical else ""
-    logger.info("Image %s%s retrieved.", image_id, suffix)
-    return FileResponse(f"{config.images_path}/{image_id}{suffix}.stp.png")
+    w: int | None = Query(default=None, ge=1),
+    image_format: ImageFormat | None = Query(default=None, alias="format"),
+    db: Session = Depends(get_db),
+) -> Response:
+    variant = None
+    if w is not None or image_format is not None:
+        variant = get_variant(w, image_format or ImageFormat.PNG)
+    # The hot images are served from the memory of the process, the ranges being read from the disk. Only the manifest is read when the proxy sends the files
+    use_cache = (
+        images_cache.enabled
+        and not is_offloaded()
+        and "range" not in request.headers
+    )
+    if use_cache:
+        cached_image = images_cache.get((image_id, canonical, variant))
+        if cached_image is not None:
+            return get_cached_image_response(request.headers, cached_image)
+    generation = images_cache.generation if use_cache else None
+    # The manifest tells whether the image exists, without looking at the images folder. It is queried in a thread, so as not to block the event loop
+    image = await run_in_threadpool(crud.get_image, db, image_id, canonical)
+    if image is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found.",
+        )
+    logger.info("Image %s retrieved.", get_image_name(image_id, canonical))
+    try:
+        return await get_image_response(request.headers, image, variant, generation)
+    except ImageVariantsUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e),
+        ) from e
+
+
+# The cache is in the memory of each process of the app, the statistics are those of the process answering
+@router.get(
+    "/images/cache/stats",
+    summary="Get the hits, misses and size of the cache of the images in memory of the process answering.",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.ImagesCacheStats,
+)
+async def get_images_cache_stats(user: AdminUserSession) -> schemas.ImagesCacheStats:
+    return images_cache.get_stats()
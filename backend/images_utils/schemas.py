@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class ImagesCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    count: int
+    size: int
+    max_size: int
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import contextlib
+import datetime
+import fcntl
+import io
+import mmap
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import IO, TYPE_CHECKING, NamedTuple, override
+
+from backend.config.config import config
+from backend.images_utils.enums import ImagesBackend, ImagesLayout
+from backend.images_utils.utils import get_image_name, get_image_path
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from pathlib import Path
+
+    from backend.images_utils.models import Image
+
+PACK_EXTENSION = ".pack"
+# The packs are appended to by a single writer at a time across the processes, which holds the lock on this file
+PACKS_LOCK_NAME = ".lock"
+
+
+# Where an image has been written, recorded in its entry of the manifest. The images in their own files have no pack
+class StoredImage(NamedTuple):
+    size: int
+    mtime: datetime.datetime
+    pack: int | None = None
+    offset: int | None = None
+
+
+# The images are written, read and deleted through the backend chosen in the config, given their entries of the manifest
+class ImagesStorage(ABC):
+    @abstractmethod
+    def prepare(self) -> None: ...
+
+    # Writes an image given by the chunks of its content, replacing the previous image of the same name
+    @abstractmethod
+    def write_image(self, name: str, chunks: Iterable[bytes]) -> StoredImage: ...
+
+    # The file of the image when it is stored in its own file, which is sent from the disk rather than read by the app
+    @abstractmethod
+    def get_file_path(self, image: Image) -> Path | None: ...
+
+    # The file holding the image and the offset of the image in it, from which the image is sent by chunks without being read whole
+    def get_file_location(self, image: Image) -> tuple[Path, int] | None:
+        path = self.get_file_path(image)
+        return None if path is None else (path, 0)
+
+    # Returns length bytes of the image from start, the whole image by default
+    @abstractmethod
+    def read_image(
+        self,
+        image: Image,
+        start: int = 0,
+        length: int | None = None,
+    ) -> bytes: ...
+
+    def open_image(self, image: Image) -> IO[bytes]:
+        return io.BytesIO(self.read_image(image))
+
+    @abstractmethod
+    def delete_image(self, item_id: str, canonical: bool) -> None: ...
+
+
+# The images folder, in the layout chosen in the config
+class FilesStorage(ImagesStorage):
+    def __init__(
+        self,
+        images_path: Path = config.images_path,
+        layout: ImagesLayout = config.images_layout,
+    ) -> None:
+        self.images_path = images_path
+        self.layout = layout
+
+    def prepare(self) -> None:
+        self.images_path.mkdir(parents=True, exist_ok=True)
+
+    def get_path(self, item_id: str, canonical: bool) -> Path:
+        return get_image_path(
+            get_image_name(item_id, canonical),
+            self.images_path,
+            self.layout,
+        )
+
+    # The image is written to a temporary name in its folder first, so that it is moved into place by an atomic rename and a partially written image is never served
+    def write_image(self, name: str, chunks: Iterable[bytes]) -> StoredImage:
+        destination = get_image_path(name, self.images_path, self.layout)
+        if self.layout != ImagesLayout.FLAT:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = destination.parent / f".{destination.name}.{uuid.uuid4().hex}.tmp"
+        try:
+            with tmp_path.open("wb") as target:
+                for chunk in chunks:
+                    target.write(chunk)
+                target.flush()
+                file_stat = os.fstat(target.fileno())
+            tmp_path.replace(destination)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return StoredImage(
+            file_stat.st_size,
+            datetime.datetime.fromtimestamp(file_stat.st_mtime, datetime.timezone.utc),
+        )
+
+    def get_file_path(self, image: Image) -> Path:
+        return self.get_path(image.item_id, image.canonical)
+
+    def read_image(
+        self,
+        image: Image,
+        start: int = 0,
+        length: int | None = None,
+    ) -> bytes:
+        with self.get_file_path(image).open("rb") as image_file:
+            image_file.seek(start)
+            return image_file.read(-1 if length is None else length)
+
+    def open_image(self, image: Image) -> IO[bytes]:
+        return self.get_file_path(image).open("rb")
+
+    def delete_image(self, item_id: str, canonical: bool) -> None:
+        self.get_path(item_id, canonical).unlink(missing_ok=True)
+
+
+# The images are appended to the last pack until it is full, and served from their offsets in their pack, without a file per image. They are read whole from a memory map of their pack, for the memory cache and the variants. An image written again or deleted leaves its bytes in its pack, until the pack is compacted. The images written before the packs were used have no pack in the manifest, they are still read from the images folder
+class PacksStorage(ImagesStorage):
+    def __init__(
+        self,
+        packs_path: Path = config.images_packs_path,
+        max_pack_size: int = config.images_pack_max_size,
+        files_storage: FilesStorage | None = None,
+    ) -> None:
+        self.packs_path = packs_path
+        self.max_pack_size = max_pack_size
+        self.files_storage = files_storage or FilesStorage()
+        self._write_lock = threading.Lock()
+        self._pack: int | None = None
+        self._pack_file: IO[bytes] | None = None
+        self._maps_lock = threading.Lock()
+        self._maps: dict[int, mmap.mmap] = {}
+
+    def prepare(self) -> None:
+        self.packs_path.mkdir(parents=True, exist_ok=True)
+
+    def get_pack_path(self, pack: int) -> Path:
+        return self.packs_path / f"{pack:08d}{PACK_EXTENSION}"
+
+    # The packs and their sizes, in the order in which they were written
+    def get_packs(self) -> dict[int, int]:
+        if not self.packs_path.exists():
+            return {}
+        with os.scandir(self.packs_path) as entries:
+            packs = {
+                int(entry.name.removesuffix(PACK_EXTENSION)): entry.stat().st_size
+                for entry in entries
+                if entry.name.endswith(PACK_EXTENSION)
+            }
+        return dict(sorted(packs.items()))
+
+    @contextlib.contextmanager
+    def _lock_packs(self) -> Iterator[None]:
+        with (
+            self._write_lock,
+            (self.packs_path / PACKS_LOCK_NAME).open("a") as lock_file,
+        ):
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _open_pack(self, pack: int) -> None:
+        if self._pack_file is not None:
+            self._pack_file.close()
+        self._pack = pack
+        self._pack_file = self.get_pack_path(pack).open("ab")
+
+    # The image is appended to the pack left open by the process, unless it has been removed by a compaction or is full. Another process may have started a new pack meanwhile, which is appended to rather than starting yet another one
+    def _append(self, content: bytes) -> tuple[int, int]:
+        with self._lock_packs():
+            if (
+                self._pack_file is None
+                or os.fstat(self._pack_file.fileno()).st_nlink == 0
+            ):
+                self._open_pack(max(self.get_packs(), default=1))
+            while True:
+                offset = os.fstat(self._pack_file.fileno()).st_size
+                if not offset or offset + len(content) <= self.max_pack_size:
+                    break
+                last_pack = max(self.get_packs(), default=self._pack)
+                self._open_pack(last_pack + 1 if last_pack <= self._pack else last_pack)
+            self._pack_file.write(content)
+            self._pack_file.flush()
+            # The manifest is committed once the images are written, it never points past the end of a pack after a crash
+            os.fsync(self._pack_file.fileno())
+            return self._pack, offset
+
+    # The image is held in memory while it is appended, the lock of the packs being only taken once it has been fully read and checked
+    @override
+    def write_image(self, name: str, chunks: Iterable[bytes]) -> StoredImage:
+        content = b"".join(chunks)
+        pack, offset = self._append(content)
+        return StoredImage(
+            len(content),
+            datetime.datetime.now(datetime.timezone.utc),
+            pack,
+            offset,
+        )
+
+    # A pack is mapped again once it has grown past the bytes which were mapped. The maps of the packs removed by a compaction are released then, the slices being copies which do not keep them alive
+    def _get_pack_map(self, pack: int, end: int) -> mmap.mmap:
+        with self._maps_lock:
+            pack_map = self._maps.get(pack)
+            if pack_map is None or len(pack_map) < end:
+                for mapped_pack in list(self._maps):
+                    if not self.get_pack_path(mapped_pack).exists():
+                        del self._maps[mapped_pack]
+                with self.get_pack_path(pack).open("rb") as pack_file:
+                    pack_map = mmap.mmap(
+                        pack_file.fileno(),
+                        0,
+                        access=mmap.ACCESS_READ,
+                    )
+                self._maps[pack] = pack_map
+            return pack_map
+
+    def get_file_path(self, image: Image) -> Path | None:
+        if image.pack is None:
+            return self.files_storage.get_file_path(image)
+        return None
+
+    def get_file_location(self, image: Image) -> tuple[Path, int] | None:
+        if image.pack is None:
+            return self.files_storage.get_file_location(image)
+        return self.get_pack_path(image.pack), image.offset
+
+    def read_image(
+        self,
+        image: Image,
+        start: int = 0,
+        length: int | None = None,
+    ) -> bytes:
+        if image.pack is None:
+            return self.files_storage.read_image(image, start, length)
+        if length is None:
+            length = image.size - start
+        begin = image.offset + start
+        return self._get_pack_map(image.pack, begin + length)[begin : begin + length]
+
+    def open_image(self, image: Image) -> IO[bytes]:
+        if image.pack is None:
+            return self.files_storage.open_image(image)
+        return super().open_image(image)
+
+    # The bytes of a deleted image are reclaimed by the compaction of its pack, only the file of an image written before the packs is removed
+    def delete_image(self, item_id: str, canonical: bool) -> None:
+        self.files_storage.delete_image(item_id, canonical)
+
+    def delete_pack(self, pack: int) -> None:
+        with self._lock_packs():
+            self.get_pack_path(pack).unlink(missing_ok=True)
+
+
+images_storage: ImagesStorage = (
+    PacksStorage() if config.images_backend == ImagesBackend.PACKS else FilesStorage()
+)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import TYPE_CHECKING
+
+from backend.config.config import config
+from backend.images_utils.enums import ImagesLayout
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+# The images of an item are named after its id, the canonical image having a suffix
+CANONICAL_SUFFIX = "_canonical"
+IMAGE_EXTENSION = ".stp.png"
+# Each level of the sharded layout is named after 2 hex digits, which makes 256 subfolders per level
+SHARD_WIDTH = 2
+SHARD_LEVELS = 2
+
+
+def get_image_name(item_id: str, canonical: bool = False) -> str:
+    suffix = CANONICAL_SUFFIX if canonical else ""
+    return f"{item_id}{suffix}{IMAGE_EXTENSION}"
+
+
+# Returns the id of the item of an image and whether it is the canonical one, from the name of its file
+def parse_image_name(name: str) -> tuple[str, bool]:
+    stem = name.split(".", 1)[0]
+    if stem.endswith(CANONICAL_SUFFIX):
+        return stem.removesuffix(CANONICAL_SUFFIX), True
+    return stem, False
+
+
+# The only place where the path of an image is decided. In the sharded layout, the images of an item share the subfolders given by the hash of its id
+def get_image_path(
+    name: str,
+    images_path: Path = config.images_path,
+    layout: ImagesLayout = config.images_layout,
+) -> Path:
+    if layout == ImagesLayout.FLAT:
+        return images_path / name
+    item_id, _ = parse_image_name(name)
+    digest = hashlib.md5(item_id.encode(), usedforsecurity=False).hexdigest()
+    shards = [
+        digest[level * SHARD_WIDTH : (level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return images_path.joinpath(*shards, name)
+
+
+# The stored images, whatever the layout. The hidden files are the images being written
+def iter_images_files(
+    images_path: Path = config.images_path,
+) -> Iterator[os.DirEntry]:
+    if not images_path.exists():
+        return
+    with os.scandir(images_path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                yield from iter_images_files(images_path / entry.name)
+            else:
+                yield entry
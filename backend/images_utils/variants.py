@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import importlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, NamedTuple
+
+import anyio
+
+from backend.config.config import config
+from backend.images_utils.enums import ImageFormat
+from backend.images_utils.exceptions import ImageVariantsUnavailableError
+from backend.images_utils.storage import images_storage
+from backend.images_utils.utils import iter_images_files
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from types import ModuleType
+
+    from backend.images_utils.models import Image
+
+logger = logging.getLogger()
+
+# The last use of a variant is recorded in its mtime, at most once in this interval so that serving it rarely writes to the disk
+VARIANT_TOUCH_INTERVAL_IN_SECONDS = 60 * 60
+# The cache is brought back under this fraction of its maximum size when it is evicted, so that it is not evicted again right away
+EVICTION_TARGET_RATIO = 0.9
+
+
+class ImageVariant(NamedTuple):
+    # None keeps the width of the image
+    width: int | None
+    format: ImageFormat
+
+
+# Pillow is an optional dependency, only needed for the variants of the images
+def import_pillow() -> ModuleType:
+    try:
+        return importlib.import_module("PIL.Image")
+    except ImportError as e:
+        msg = "Pillow has to be installed, with the variants extra (poetry install --extras variants), to get the variants of the images."
+        raise ImageVariantsUnavailableError(msg) from e
+
+
+def get_variant(width: int | None, image_format: ImageFormat) -> ImageVariant:
+    if width is not None:
+        widths = config.images_variants_widths
+        width = widths[min(bisect.bisect_left(widths, width), len(widths) - 1)]
+    return ImageVariant(width, image_format)
+
+
+# The variants are named after the hash of the image, so that identical images share them and an image written again gets new ones
+def get_variant_path(
+    sha256: str,
+    variant: ImageVariant,
+    variants_path: Path = config.images_variants_path,
+) -> Path:
+    width = "full" if variant.width is None else variant.width
+    return variants_path / sha256[:2] / f"{sha256}_{width}.{variant.format.value}"
+
+
+# The variant is resized without upscaling, and written under a temporary name before being moved into place like the images
+def create_variant(
+    source: Path | IO[bytes],
+    destination: Path,
+    variant: ImageVariant,
+) -> int:
+    pil_image = import_pillow()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.parent / f".{destination.name}.{uuid.uuid4().hex}.tmp"
+    try:
+        with pil_image.open(source) as image:
+            if variant.width is not None and variant.width < image.width:
+                image.thumbnail((variant.width, image.height), reducing_gap=2.0)
+            try:
+                image.save(
+                    tmp_path,
+                    format=variant.format.value,
+                    quality=config.images_variants_quality,
+                )
+            except KeyError as e:
+                msg = f"The installed Pillow cannot write the {variant.format.value} format."
+                raise ImageVariantsUnavailableError(msg) from e
+        size = tmp_path.stat().st_size
+        tmp_path.replace(destination)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return size
+
+
+# Removes the least recently used variants until the cache is under its maximum size
+def evict_variants(
+    max_size: int = config.images_variants_max_size,
+    variants_path: Path = config.images_variants_path,
+) -> int:
+    variants = [
+        (entry.stat(), entry.path) for entry in iter_images_files(variants_path)
+    ]
+    total_size = sum(variant_stat.st_size for variant_stat, _ in variants)
+    if total_size <= max_size:
+        return 0
+    evicted_count = 0
+    for variant_stat, path in sorted(
+        variants,
+        key=lambda variant: variant[0].st_mtime,
+    ):
+        if total_size <= max_size * EVICTION_TARGET_RATIO:
+            break
+        Path(path).unlink(missing_ok=True)
+        total_size -= variant_stat.st_size
+        evicted_count += 1
+    logger.info("%s variants evicted from the cache.", evicted_count)
+    return evicted_count
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_created_size = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor  # noqa: PLW0603
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                config.images_variants_workers,
+                thread_name_prefix="images-variants",
+            )
+        return _executor
+
+
+# The image is read from the storage of the images, in the thread generating its variant
+def create_image_variant(
+    image: Image,
+    destination: Path,
+    variant: ImageVariant,
+) -> int:
+    with images_storage.open_image(image) as source:
+        return create_variant(source, destination, variant)
+
+
+# The cache is evicted by the process which has written a tenth of its maximum size since the last eviction, rather than checked on each variant
+def _create_cached_variant(
+    image: Image,
+    destination: Path,
+    variant: ImageVariant,
+) -> None:
+    global _created_size  # noqa: PLW0603
+    size = create_image_variant(image, destination, variant)
+    with _executor_lock:
+        _created_size += size
+        evict = _created_size > config.images_variants_max_size // 10
+        if evict:
+            _created_size = 0
+    if evict:
+        evict_variants()
+
+
+# Records the use of a variant in its mtime. Returns False when the variant is not in the cache, including when it is evicted while it is touched
+def _touch_variant(destination: Path) -> bool:
+    try:
+        variant_stat = destination.stat()
+        if time.time() - variant_stat.st_mtime > VARIANT_TOUCH_INTERVAL_IN_SECONDS:
+            os.utime(destination)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+# Returns the path of the variant of an image, which is generated in the pool of threads the first time. The files are only touched in the pool of threads of the event loop, so that a slow disk does not block it
+async def get_variant_file(image: Image, variant: ImageVariant) -> Path:
+    destination = get_variant_path(image.sha256, variant)
+    if not await anyio.to_thread.run_sync(_touch_variant, destination):
+        await asyncio.wrap_future(
+            _get_executor().submit(
+                _create_cached_variant,
+                image,
+                destination,
+                variant,
+            ),
+        )
+    return destination
+
+
+# The variant can be evicted from the cache between the moment its path is got and the moment it is read, it is generated again then
+async def read_variant_file(image: Image, variant: ImageVariant, path: Path) -> bytes:
+    try:
+        return await anyio.Path(path).read_bytes()
+    except FileNotFoundError:
+        path = await get_variant_file(image, variant)
+        return await anyio.Path(path).read_bytes()
+
+
+# Generates the variants of freshly written images, given by their entries of the manifest. A variant which cannot be generated is only logged, it is generated again when asked for
+def create_variants(
+    images: Iterable[Image],
+    variants: list[ImageVariant],
+    executor: ThreadPoolExecutor,
+) -> int:
+    futures = [
+        executor.submit(
+            create_image_variant,
+            image,
+            get_variant_path(image.sha256, variant),
+            variant,
+        )
+        for image in images
+        for variant in variants
+    ]
+    created_count = 0
+    for future in futures:
+        # The other errors are raised by the result
+        if isinstance(future.exception(), (ImageVariantsUnavailableError, OSError)):
+            logger.warning("A variant could not be generated: %s", future.exception())
+        else:
+            future.result()
+            created_count += 1
+    return created_count
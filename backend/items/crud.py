@@ -1,24 +1,32 @@
+from __future__ import annotations
+
 import logging
+from typing import TYPE_CHECKING
 
 import pandas as pd
+from sqlalchemy import column, literal_column, select, table, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+from backend.config.config import config
+from backend.core.database.bulk import (
+    copy_dataframe,
+    copy_vectors,
+    create_staging_table,
+    iter_chunks,
+    to_records,
+)
 from backend.items import models, schemas
+from backend.upload.enums import IngestMethod
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
 
-def create_item(
-    db: Session,
-    item: schemas.Item,
-) -> models.Item:
-    existing_item = db.query(models.Item).filter_by(id=item.id).first()
-    if existing_item:
-        logging.info("Item with id %s already exists.", item.id)
-        return None
-    db_item = models.Item(**item.model_dump())
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+    import numpy as np
+
+    from backend.upload.progress import UploadProgress
+
+logger = logging.getLogger()
 
 
 def get_item(
@@ -28,12 +36,79 @@ def get_item(
     return db.query(models.Item).filter_by(id=item_id).first()
 
 
-def create_items(
+# The items can be shared by several datapacks: the new items are inserted, the items whose length or dataset changed are updated, and the others are skipped, all with set-based statements. The items can be given as a stream of dataframes
+def upsert_items(
+    db: Session,
+    items: pd.DataFrame | Iterable[pd.DataFrame],
+    method: IngestMethod = config.ingest_method,
+    progress: UploadProgress | None = None,
+) -> schemas.ItemsUpsertReport:
+    report = schemas.ItemsUpsertReport()
+    for rows in iter_chunks(items, config.ingest_chunk_size):
+        # A statement cannot update the same item twice, the last occurrence wins
+        chunk = rows.drop_duplicates("id", keep="last")
+        if method == IngestMethod.COPY:
+            # COPY does not handle conflicts, so the items go through a staging table
+            staging_table_name = create_staging_table(
+                db,
+                models.Item.__table__,
+                chunk.columns,
+            )
+            copy_dataframe(db, staging_table_name, chunk)
+            statement = insert(models.Item).from_select(
+                list(chunk.columns),
+                select(
+                    *(column(column_name) for column_name in chunk.columns),
+                ).select_from(table(staging_table_name)),
+            )
+        else:
+            statement = insert(models.Item).values(to_records(chunk))
+        # The rows are only returned when they are inserted or updated. "xmax" is only set for the rows which already existed, so this tells the inserted rows apart from the updated ones
+        statement = statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                "length": statement.excluded.length,
+                "dataset": statement.excluded.dataset,
+            },
+            where=tuple_(models.Item.length, models.Item.dataset).is_distinct_from(
+                tuple_(statement.excluded.length, statement.excluded.dataset),
+            ),
+        ).returning(literal_column("xmax = 0"))
+        inserted = db.execute(statement).scalars().all()
+        if progress is not None:
+            progress.advance(len(rows))
+        db.commit()
+        inserted_count = sum(inserted)
+        updated_count = len(inserted) - inserted_count
+        report.inserted += inserted_count
+        report.updated += updated_count
+        report.skipped += len(chunk) - inserted_count - updated_count
+        logger.debug("%s items upserted to the database.", len(chunk))
+    return report
+
+
+# The vectors are given by chunks, along with the ids of their items. They are copied in the binary format to a staging table, from which the items are updated
+def update_items_vectors(
     db: Session,
-    items: pd.DataFrame,
-) -> None:
-    for _, item in items.iterrows():
-        create_item(
+    vectors_chunks: Iterable[tuple[pd.Series, np.ndarray]],
+    progress: UploadProgress | None = None,
+) -> int:
+    updated_count = 0
+    for ids, vectors in vectors_chunks:
+        staging_table_name = create_staging_table(
             db,
-            schemas.Item(**item.to_dict()),
+            models.Item.__table__,
+            ["id", "vector"],
         )
+        copy_vectors(db, staging_table_name, ids, vectors)
+        staging_table = table(staging_table_name, column("id"), column("vector"))
+        updated_count += db.execute(
+            update(models.Item)
+            .values(vector=staging_table.c.vector)
+            .where(models.Item.id == staging_table.c.id),
+        ).rowcount
+        if progress is not None:
+            progress.advance(len(ids))
+        db.commit()
+        logger.debug("%s items vectors updated.", len(ids))
+    return updated_count
@@ -1,5 +1,7 @@
+from pgvector.sqlalchemy import Vector
 from sqlalchemy import Column, Float, String
 
+from backend.config.config import config
 from backend.core.database.core import Base
 
 
@@ -8,4 +10,6 @@ class Item(Base):
     id = Column(String, primary_key=True, index=True)
     length = Column(Float, index=True)
     dataset = Column(String, index=True)
-    # vector = Column(Vector(app_config.vector_dimension))
+    # The vectors need the pgvector extension in the database, so they are only stored when enabled
+    if config.items_vectors:
+        vector = Column(Vector(config.vector_dimension))
@@ -8,3 +8,9 @@ class Item(BaseModel):
     length: float
     dataset: str
     # vector: list[float]
+
+
+class ItemsUpsertReport(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
@@ -1,21 +1,33 @@
-from pathlib import Path
-
 import pandas as pd
 
-from backend.utils import logger
-
-
-def load_items(data_path: Path) -> pd.DataFrame:
-    try:
-        items = pd.read_csv(data_path)
-        # We want to convert the string of the vector to a list of floats
-        # items["vector"] = (
-        #     items["vector"].str.split(",").apply(lambda x: list(map(float, x)))
-        # )
+ITEM_COLUMNS = ["id", "length", "dataset"]
+ITEM_DTYPES = {"id": "string", "length": "float64", "dataset": "string"}
 
-    except FileNotFoundError as e:
-        logger.info("File not found: %s", e)
-        return pd.DataFrame()
 
-    else:
-        return items
+# The checks and conversions are done on whole columns, before writing the items to the database
+def prepare_items(items: pd.DataFrame) -> pd.DataFrame:
+    missing_columns = [
+        column_name for column_name in ITEM_COLUMNS if column_name not in items.columns
+    ]
+    if missing_columns:
+        msg = f"Missing items columns: {', '.join(missing_columns)}"
+        raise ValueError(msg)
+    items = items[ITEM_COLUMNS]
+    null_columns = [
+        column_name for column_name in ITEM_COLUMNS if items[column_name].isna().any()
+    ]
+    if null_columns:
+        msg = f"Missing values in items columns: {', '.join(null_columns)}"
+        raise ValueError(msg)
+    lengths = pd.to_numeric(items["length"], errors="coerce")
+    invalid_lengths = items["length"][lengths.isna()]
+    if not invalid_lengths.empty:
+        msg = f"Invalid items lengths: {', '.join(map(str, invalid_lengths.unique()[:10]))}"
+        raise ValueError(msg)
+    return items.astype(
+        {
+            column_name: str
+            for column_name in ["id", "dataset"]
+            if not pd.api.types.is_string_dtype(items[column_name])
+        },
+    ).assign(length=lengths)
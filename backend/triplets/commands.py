@@ -0,0 +1,34 @@
+# Maintenance commands of the triplets, run with `python -m backend.triplets.commands <command>`
+import argparse
+import logging
+
+from backend.core.database.core import SessionLocal
+from backend.triplets import crud
+
+logger = logging.getLogger()
+
+
+def repair_counters() -> None:
+    db = SessionLocal()
+    try:
+        stats = crud.repair_triplet_counters(db)
+    finally:
+        db.close()
+    logger.info("Triplet counters repaired: %s", stats)
+
+
+COMMANDS = {
+    "repair-counters": repair_counters,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Triplets maintenance commands.")
+    parser.add_argument("command", choices=COMMANDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
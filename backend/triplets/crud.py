@@ -2,171 +2,410 @@ from __future__ import annotations
 
 import datetime
 import logging
+import random
 from typing import TYPE_CHECKING
 
-from sqlalchemy.orm import Session
-
+from sqlalchemy import (
+    Integer,
+    Uuid,
+    case,
+    cast,
+    column,
+    delete,
+    exists,
+    false,
+    func,
+    literal,
+    select,
+    table,
+    text,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+
+import backend.items.models
 import backend.triplets.models
-import backend.triplets.schemas
 import backend.upload.models
 from backend.config.config import config
-from backend.triplets import crud, schemas
-from backend.triplets.enums import SelectedItemType
+from backend.core.database.bulk import (
+    copy_dataframe,
+    create_staging_table,
+    iter_chunks,
+    to_records,
+)
+from backend.triplets import schemas
+from backend.triplets.enums import LabelStatus, LeaseAction, SelectedItemType
+from backend.triplets.exceptions import TripletLeaseError, TripletNotFoundError
+from backend.upload.enums import IngestMethod, UploadPhase
 
 if TYPE_CHECKING:
+    import uuid
+    from collections.abc import Iterable
+
     import pandas as pd
+    from sqlalchemy import Row, Select
     from sqlalchemy.orm import Session
 
+    from backend.upload.progress import UploadProgress
+
 
 logger = logging.getLogger()
 
 
-# We get last status, because we are not going to upload data at the same time... Might cause an issue if several downloads are done at the same time
-def increment_all_triplets_upload_status(
+def increment_triplet_counter(
     db: Session,
+    model: type[backend.triplets.models.TripletBase],
+    labeled: int = 0,
+    unlabeled: int = 0,
 ) -> None:
-    status = (
-        db.query(backend.upload.models.AllTripletsUploadStatus)
-        .order_by(backend.upload.models.AllTripletsUploadStatus.id.desc())
-        .first()
+    statement = insert(backend.triplets.models.TripletCounter).values(
+        table_name=model.__tablename__,
+        slot=random.randrange(config.triplet_counter_slots),  # noqa: S311
+        labeled=labeled,
+        unlabeled=unlabeled,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["table_name", "slot"],
+            set_={
+                "labeled": backend.triplets.models.TripletCounter.labeled
+                + statement.excluded.labeled,
+                "unlabeled": backend.triplets.models.TripletCounter.unlabeled
+                + statement.excluded.unlabeled,
+            },
+        ),
     )
-    status.uploaded_count += 1
-    db.commit()
-
-
-def create_triplet(
-    db: Session,
-    triplet: backend.triplets.schemas.Triplet,
-) -> backend.triplets.models.Triplet:
-    triplet = backend.triplets.models.Triplet(**triplet.model_dump())
-    db.add(triplet)
-    db.commit()
-    db.refresh(triplet)
-    logger.debug("Labeled triplet added to the database.")
-    increment_all_triplets_upload_status(db)
-    return triplet
 
 
-def create_validation_triplet(
+# The triplets are written by chunks, each chunk being committed along with the counters and the upload progress. The triplets already in the table are skipped thanks to their natural key, so that uploading a datapack again only inserts its new triplets. The triplets can be given as a stream of dataframes
+def _create_triplets(
     db: Session,
-    triplet: backend.triplets.schemas.ValidationTriplet,
-) -> backend.triplets.models.ValidationTriplet:
-    triplet = backend.triplets.models.ValidationTriplet(**triplet.model_dump())
-    db.add(triplet)
-    db.commit()
-    db.refresh(triplet)
-    logger.debug("Validation triplet added to the database.")
-    increment_all_triplets_upload_status(db)
-    return triplet
+    model: type[backend.triplets.models.TripletBase],
+    triplets: pd.DataFrame | Iterable[pd.DataFrame],
+    method: IngestMethod,
+    progress: UploadProgress | None = None,
+) -> schemas.TripletsCreateReport:
+    report = schemas.TripletsCreateReport()
+    for chunk in iter_chunks(triplets, config.ingest_chunk_size):
+        if method == IngestMethod.COPY:
+            # COPY does not handle conflicts, so the triplets go through a staging table
+            staging_table_name = create_staging_table(
+                db,
+                model.__table__,
+                chunk.columns,
+            )
+            copy_dataframe(db, staging_table_name, chunk)
+            staging_table = table(
+                staging_table_name,
+                *(column(column_name) for column_name in chunk.columns),
+            )
+            # The triplets already in the table are left out before they are inserted, so that they do not take values from the sequence of the ids
+            statement = insert(model).from_select(
+                list(chunk.columns),
+                select(*staging_table.c).where(
+                    ~exists().where(
+                        *(
+                            getattr(model, column_name) == staging_table.c[column_name]
+                            for column_name in model.natural_key
+                        ),
+                    ),
+                ),
+            )
+        else:
+            statement = insert(model).values(to_records(chunk))
+        # Only the inserted triplets are returned, which gives the counts to add to the counters
+        inserted_labels = db.execute(
+            statement.on_conflict_do_nothing(
+                index_elements=list(model.natural_key),
+            ).returning(model.label),
+        ).scalars().all()
+        labeled_count = sum(label is not None for label in inserted_labels)
+        increment_triplet_counter(
+            db,
+            model,
+            labeled=labeled_count,
+            unlabeled=len(inserted_labels) - labeled_count,
+        )
+        if progress is not None:
+            progress.advance(len(chunk))
+        db.commit()
+        report.inserted += len(inserted_labels)
+        report.skipped += len(chunk) - len(inserted_labels)
+        logger.debug(
+            "%s %s rows added to the database, %s already there.",
+            len(inserted_labels),
+            model.__tablename__,
+            len(chunk) - len(inserted_labels),
+        )
+    return report
 
 
 def create_triplets(
     db: Session,
-    triplets: pd.DataFrame,
-) -> None:
-    for _, triplet in triplets.iterrows():
-        create_triplet(
-            db,
-            backend.triplets.schemas.Triplet(**triplet.to_dict()),
-        )
+    triplets: pd.DataFrame | Iterable[pd.DataFrame],
+    method: IngestMethod = config.ingest_method,
+    progress: UploadProgress | None = None,
+) -> schemas.TripletsCreateReport:
+    report = _create_triplets(
+        db,
+        backend.triplets.models.Triplet,
+        triplets,
+        method,
+        progress,
+    )
     logger.debug("Triplets added to the database.")
+    return report
 
 
 def create_validation_triplets(
     db: Session,
-    triplets: pd.DataFrame,
-) -> None:
-    for _, triplet in triplets.iterrows():
-        create_validation_triplet(
-            db,
-            backend.triplets.schemas.ValidationTriplet(**triplet.to_dict()),
-        )
+    triplets: pd.DataFrame | Iterable[pd.DataFrame],
+    method: IngestMethod = config.ingest_method,
+    progress: UploadProgress | None = None,
+) -> schemas.TripletsCreateReport:
+    report = _create_triplets(
+        db,
+        backend.triplets.models.ValidationTriplet,
+        triplets,
+        method,
+        progress,
+    )
     logger.debug("Validation triplets added to the database.")
+    return report
+
+
+def _claim_unlabeled_triplets_statement(
+    model: type[backend.triplets.models.TripletBase],
+    extra_columns: list[str],
+    count: int,
+    user_id: str | None,
+    now_time: datetime.datetime,
+    cutoff_time: datetime.datetime,
+    lock_timeout_in_seconds: int,
+) -> Select:
+    available = (model.label.is_(None)) & (
+        (model.retrieved_at.is_(None)) | (model.retrieved_at < cutoff_time)
+    )
+    # The triplets still leased to the user are given back first, so that reloading the page does not lease new triplets
+    held = (
+        (
+            (model.label.is_(None))
+            & (model.user_id == user_id)
+            & (model.retrieved_at >= cutoff_time)
+        )
+        if user_id is not None
+        else false()
+    )
+    # We lock the first available triplets and set their "retrieved_at" column in a single statement. "SKIP LOCKED" makes concurrent claims move on to the next available triplets instead of waiting for the lock, so two users can never be given the same triplet
+    held_triplets = (
+        select(model.id, literal(0).label("priority"))
+        .where(held)
+        .order_by(model.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+        .cte("held_triplets")
+    )
+    available_triplets = (
+        select(model.id, literal(1).label("priority"))
+        .where(available)
+        .order_by(model.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+        .cte("available_triplets")
+    )
+    leased_triplets = union_all(
+        select(held_triplets.c.id, held_triplets.c.priority),
+        select(available_triplets.c.id, available_triplets.c.priority),
+    ).subquery("leased_triplets")
+    candidates = (
+        select(leased_triplets.c.id)
+        .order_by(leased_triplets.c.priority, leased_triplets.c.id)
+        .limit(count)
+        .cte("candidates")
+    )
+    claimed = (
+        update(model)
+        .where(model.id == candidates.c.id)
+        .values(
+            retrieved_at=now_time,
+            user_id=user_id,
+            # A new lease token is generated unless the user already holds the lease
+            lease_token=case(
+                (held, model.lease_token),
+                else_=func.gen_random_uuid(),
+            ),
+        )
+        .returning(*model.__table__.columns)
+        .cte("claimed")
+    )
+    # The items are joined in the same round trip, the columns are labeled so that the rows map directly to the response schema
+    reference_item = aliased(backend.items.models.Item)
+    left_item = aliased(backend.items.models.Item)
+    right_item = aliased(backend.items.models.Item)
+    return (
+        select(
+            claimed.c.id,
+            claimed.c.reference_id,
+            reference_item.length.label("reference_length"),
+            reference_item.dataset.label("reference_dataset"),
+            claimed.c.left_id,
+            left_item.length.label("left_length"),
+            left_item.dataset.label("left_dataset"),
+            claimed.c.right_id,
+            right_item.length.label("right_length"),
+            right_item.dataset.label("right_dataset"),
+            *(claimed.c[column_name] for column_name in extra_columns),
+            claimed.c.lease_token,
+            (
+                claimed.c.retrieved_at
+                + datetime.timedelta(seconds=lock_timeout_in_seconds)
+            ).label("lease_expires_at"),
+        )
+        .select_from(claimed)
+        .join(reference_item, reference_item.id == claimed.c.reference_id)
+        .join(left_item, left_item.id == claimed.c.left_id)
+        .join(right_item, right_item.id == claimed.c.right_id)
+        .order_by(claimed.c.id)
+    )
 
 
-# We make sure two users do not label the same triplet by implementing our own locking mechanism. Not ideal because after the timeout period the triplet will be considered as "unlocked" and could be retrieved by another user.
-def get_first_unlabeled_triplet(
+# We make sure two users do not label the same triplet by implementing our own locking mechanism. After the timeout period the triplet is considered as "unlocked" and can be retrieved by another user, which gives it a new lease token: the label of the first user is then rejected.
+def get_unlabeled_triplets(
     db: Session,
+    count: int,
+    user_id: str | None = None,
     lock_timeout_in_seconds: int = config.lock_timeout_in_seconds,
-) -> backend.triplets.models.Triplet:
+) -> list[Row]:
     now_time = datetime.datetime.now(datetime.timezone.utc)
     # We define the timeout as the current time minus the lock_timeout_in_seconds, so the boundary, cutoff below which the triplet is considered as "unlocked", "stale"
     cutoff_time = now_time - datetime.timedelta(
         seconds=lock_timeout_in_seconds,
     )
-    # We retrieve the first triplet that is unlabeled and either has never been retrieved or has been retrieved before the cutoff time
-    triplet = (
-        db.query(backend.triplets.models.Triplet)
-        .filter(
-            (backend.triplets.models.Triplet.label.is_(None))
-            & (
-                (backend.triplets.models.Triplet.retrieved_at.is_(None))
-                | (backend.triplets.models.Triplet.retrieved_at < cutoff_time)
-            ),
-        )
-        .first()
-    )
-    if triplet:
-        triplet.retrieved_at = now_time
-        db.commit()
-    return triplet
+    # We retrieve the first triplets that are unlabeled and either have never been retrieved or have been retrieved before the cutoff time
+    triplets = db.execute(
+        _claim_unlabeled_triplets_statement(
+            backend.triplets.models.Triplet,
+            [],
+            count,
+            user_id,
+            now_time,
+            cutoff_time,
+            lock_timeout_in_seconds,
+        ),
+    ).all()
+    db.commit()
+    return triplets
 
 
-def get_first_unlabeled_validation_triplet(
+def get_unlabeled_validation_triplets(
     db: Session,
+    count: int,
+    user_id: str | None = None,
     lock_timeout_in_seconds: int = config.lock_timeout_in_seconds,
-) -> backend.triplets.models.ValidationTriplet:
+) -> list[Row]:
     now_time = datetime.datetime.now(datetime.timezone.utc)
     cutoff_time = now_time - datetime.timedelta(
         seconds=lock_timeout_in_seconds,
     )
-    triplet = (
-        db.query(backend.triplets.models.ValidationTriplet)
-        .filter(
-            (backend.triplets.models.ValidationTriplet.label.is_(None))
-            & (
-                (backend.triplets.models.ValidationTriplet.retrieved_at.is_(None))
-                | (backend.triplets.models.ValidationTriplet.retrieved_at < cutoff_time)
-            ),
-        )
-        .first()
-    )
-    if triplet:
-        triplet.retrieved_at = now_time
-        db.commit()
-    return triplet
+    triplets = db.execute(
+        _claim_unlabeled_triplets_statement(
+            backend.triplets.models.ValidationTriplet,
+            ["left_encoder_id", "right_encoder_id"],
+            count,
+            user_id,
+            now_time,
+            cutoff_time,
+            lock_timeout_in_seconds,
+        ),
+    ).all()
+    db.commit()
+    return triplets
 
 
-def count_labeled_triplets(db: Session) -> int:
-    return (
-        db.query(backend.triplets.models.Triplet)
-        .filter(backend.triplets.models.Triplet.label.isnot(None))
-        .count()
-    )
+def get_first_unlabeled_triplet(
+    db: Session,
+    user_id: str | None = None,
+    lock_timeout_in_seconds: int = config.lock_timeout_in_seconds,
+) -> Row | None:
+    triplets = get_unlabeled_triplets(db, 1, user_id, lock_timeout_in_seconds)
+    return triplets[0] if triplets else None
 
 
-def count_labeled_validation_triplets(db: Session) -> int:
-    return (
-        db.query(backend.triplets.models.ValidationTriplet)
-        .filter(backend.triplets.models.ValidationTriplet.label.isnot(None))
-        .count()
+def get_first_unlabeled_validation_triplet(
+    db: Session,
+    user_id: str | None = None,
+    lock_timeout_in_seconds: int = config.lock_timeout_in_seconds,
+) -> Row | None:
+    triplets = get_unlabeled_validation_triplets(
+        db,
+        1,
+        user_id,
+        lock_timeout_in_seconds,
     )
+    return triplets[0] if triplets else None
 
 
-def count_unlabeled_triplets(db: Session) -> int:
-    return (
-        db.query(backend.triplets.models.Triplet)
-        .filter(backend.triplets.models.Triplet.label.is_(None))
-        .count()
+# Returns the ids of the items of the given triplets, in the order of the given ids. The unknown triplets are left out
+def get_triplets_items_ids(
+    db: Session,
+    triplet_ids: list[int],
+    validation: bool = False,
+) -> dict[int, tuple[str, str, str]]:
+    model = (
+        backend.triplets.models.ValidationTriplet
+        if validation
+        else backend.triplets.models.Triplet
     )
+    items_ids = {
+        triplet.id: (triplet.reference_id, triplet.left_id, triplet.right_id)
+        for triplet in db.execute(
+            select(
+                model.id,
+                model.reference_id,
+                model.left_id,
+                model.right_id,
+            ).where(model.id.in_(triplet_ids)),
+        )
+    }
+    return {
+        triplet_id: items_ids[triplet_id]
+        for triplet_id in triplet_ids
+        if triplet_id in items_ids
+    }
 
 
-def count_unlabeled_validation_triplets(db: Session) -> int:
-    return (
-        db.query(backend.triplets.models.ValidationTriplet)
-        .filter(backend.triplets.models.ValidationTriplet.label.is_(None))
-        .count()
+# The label is only written if the user still holds the lease of the triplet, in a single conditional statement. The triplet is only looked up again if the label could not be written, to know why
+def _set_leased_triplet_label(
+    db: Session,
+    model: type[backend.triplets.models.TripletBase],
+    triplet_id: int,
+    label: SelectedItemType,
+    user_id: str,
+    lease_token: uuid.UUID,
+) -> None:
+    result = db.execute(
+        update(model)
+        .where(
+            model.id == triplet_id,
+            model.lease_token == lease_token,
+            model.label.is_(None),
+        )
+        .values(label=label, user_id=user_id)
+        .execution_options(synchronize_session=False),
     )
+    if result.rowcount == 1:
+        increment_triplet_counter(db, model, labeled=1, unlabeled=-1)
+        db.commit()
+        return
+    db.rollback()
+    if db.get(model, triplet_id) is None:
+        msg = f"No triplet found with id {triplet_id}"
+        raise TripletNotFoundError(msg)
+    msg = f"The lease of the triplet {triplet_id} is not held anymore or the triplet is already labeled"
+    raise TripletLeaseError(msg)
 
 
 def set_triplet_label(
@@ -174,18 +413,16 @@ def set_triplet_label(
     triplet_id: int,
     label: SelectedItemType,
     user_id: str,
+    lease_token: uuid.UUID,
 ) -> None:
-    triplet = (
-        db.query(backend.triplets.models.Triplet)
-        .filter(backend.triplets.models.Triplet.id == triplet_id)
-        .first()
+    _set_leased_triplet_label(
+        db,
+        backend.triplets.models.Triplet,
+        triplet_id,
+        label,
+        user_id,
+        lease_token,
     )
-    if triplet is None:
-        msg = f"No triplet found with id {triplet_id}"
-        raise ValueError(msg)
-    triplet.label = label
-    triplet.user_id = user_id
-    db.commit()
 
 
 def set_validation_triplet_label(
@@ -193,18 +430,180 @@ def set_validation_triplet_label(
     triplet_id: int,
     label: SelectedItemType,
     user_id: str,
+    lease_token: uuid.UUID,
 ) -> None:
-    triplet = (
-        db.query(backend.triplets.models.ValidationTriplet)
-        .filter(backend.triplets.models.ValidationTriplet.id == triplet_id)
-        .first()
-    )
-    if triplet is None:
-        msg = f"No validation triplet found with id {triplet_id}"
-        raise ValueError(msg)
-    triplet.label = label
-    triplet.user_id = user_id
+    _set_leased_triplet_label(
+        db,
+        backend.triplets.models.ValidationTriplet,
+        triplet_id,
+        label,
+        user_id,
+        lease_token,
+    )
+
+
+# The labels are applied with a single "UPDATE ... FROM (VALUES ...)" statement, the triplets which were not updated are then looked up to know why
+def _set_triplets_labels(
+    db: Session,
+    model: type[backend.triplets.models.TripletBase],
+    labels: dict[int, schemas.TripletLabel],
+    user_id: str,
+) -> dict[int, LabelStatus]:
+    new_labels = values(
+        column("id", Integer),
+        column("label", model.label.type),
+        column("lease_token", Uuid),
+        name="new_labels",
+    ).data(
+        [
+            (triplet_id, label.label, label.lease_token)
+            for triplet_id, label in labels.items()
+        ],
+    )
+    applied_ids = set(
+        db.execute(
+            update(model)
+            .where(
+                model.id == new_labels.c.id,
+                model.lease_token == new_labels.c.lease_token,
+                model.label.is_(None),
+            )
+            .values(label=cast(new_labels.c.label, model.label.type), user_id=user_id)
+            .returning(model.id)
+            .execution_options(synchronize_session=False),
+        ).scalars(),
+    )
+    if applied_ids:
+        increment_triplet_counter(
+            db,
+            model,
+            labeled=len(applied_ids),
+            unlabeled=-len(applied_ids),
+        )
+    not_applied_ids = labels.keys() - applied_ids
+    labeled_by_id = (
+        dict(
+            db.execute(
+                select(model.id, model.label.isnot(None)).where(
+                    model.id.in_(not_applied_ids),
+                ),
+            ).all(),
+        )
+        if not_applied_ids
+        else {}
+    )
+    statuses = {}
+    for triplet_id in labels:
+        if triplet_id in applied_ids:
+            statuses[triplet_id] = LabelStatus.APPLIED
+        elif triplet_id not in labeled_by_id:
+            statuses[triplet_id] = LabelStatus.NOT_FOUND
+        elif labeled_by_id[triplet_id]:
+            statuses[triplet_id] = LabelStatus.ALREADY_LABELED
+        else:
+            statuses[triplet_id] = LabelStatus.LEASE_LOST
+    return statuses
+
+
+def set_triplets_labels(
+    db: Session,
+    labels: list[schemas.TripletLabel],
+    user_id: str,
+) -> list[schemas.TripletLabelResult]:
+    # If the same triplet is labeled several times, the last label wins
+    triplets_labels = {
+        label.triplet_id: label for label in labels if not label.validation
+    }
+    validation_triplets_labels = {
+        label.triplet_id: label for label in labels if label.validation
+    }
+    results = []
+    for validation, model, model_labels in (
+        (False, backend.triplets.models.Triplet, triplets_labels),
+        (True, backend.triplets.models.ValidationTriplet, validation_triplets_labels),
+    ):
+        if not model_labels:
+            continue
+        statuses = _set_triplets_labels(db, model, model_labels, user_id)
+        results.extend(
+            schemas.TripletLabelResult(
+                triplet_id=triplet_id,
+                validation=validation,
+                status=label_status,
+            )
+            for triplet_id, label_status in statuses.items()
+        )
+    # All the labels are committed at once
+    db.commit()
+    return results
+
+
+def _update_triplets_leases(
+    db: Session,
+    model: type[backend.triplets.models.TripletBase],
+    leases: dict[int, uuid.UUID],
+    **new_values,
+) -> dict[int, datetime.datetime | None]:
+    leased_triplets = values(
+        column("id", Integer),
+        column("lease_token", Uuid),
+        name="leased_triplets",
+    ).data(list(leases.items()))
+    return dict(
+        db.execute(
+            update(model)
+            .where(
+                model.id == leased_triplets.c.id,
+                model.lease_token == leased_triplets.c.lease_token,
+                model.label.is_(None),
+            )
+            .values(**new_values)
+            .returning(model.id, model.retrieved_at)
+            .execution_options(synchronize_session=False),
+        ).all(),
+    )
+
+
+# Renewing a lease postpones its expiry, releasing it makes the triplet available right away, for instance when the user closes the tab
+def update_triplets_leases(
+    db: Session,
+    leases: list[schemas.TripletLease],
+    action: LeaseAction,
+    lock_timeout_in_seconds: int = config.lock_timeout_in_seconds,
+) -> list[schemas.TripletLeaseResult]:
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    if action == LeaseAction.RENEW:
+        new_values = {"retrieved_at": now_time}
+    else:
+        new_values = {"retrieved_at": None, "user_id": None, "lease_token": None}
+    results = []
+    for validation, model in (
+        (False, backend.triplets.models.Triplet),
+        (True, backend.triplets.models.ValidationTriplet),
+    ):
+        model_leases = {
+            lease.triplet_id: lease.lease_token
+            for lease in leases
+            if lease.validation == validation
+        }
+        if not model_leases:
+            continue
+        updated = _update_triplets_leases(db, model, model_leases, **new_values)
+        for triplet_id in model_leases:
+            renewed = action == LeaseAction.RENEW and triplet_id in updated
+            results.append(
+                schemas.TripletLeaseResult(
+                    triplet_id=triplet_id,
+                    validation=validation,
+                    applied=triplet_id in updated,
+                    lease_expires_at=updated[triplet_id]
+                    + datetime.timedelta(seconds=lock_timeout_in_seconds)
+                    if renewed
+                    else None,
+                ),
+            )
     db.commit()
+    return results
 
 
 # We only retrieve the triplets that have been labeled
@@ -226,24 +625,93 @@ def get_validation_labeled_triplets(db: Session) -> list[dict]:
     ]
 
 
+def _delete_triplet_counter(
+    db: Session,
+    model: type[backend.triplets.models.TripletBase],
+) -> None:
+    db.execute(
+        delete(backend.triplets.models.TripletCounter).where(
+            backend.triplets.models.TripletCounter.table_name == model.__tablename__,
+        ),
+    )
+
+
+# The file of the deleted triplets is forgotten, so that uploading it again writes its rows again
+def _delete_datapack_file(db: Session, phase: UploadPhase) -> None:
+    db.execute(
+        delete(backend.upload.models.DatapackFile).where(
+            backend.upload.models.DatapackFile.name == phase.value,
+        ),
+    )
+
+
 def delete_triplets(db: Session) -> None:
     db.query(backend.triplets.models.Triplet).delete()
+    _delete_triplet_counter(db, backend.triplets.models.Triplet)
+    _delete_datapack_file(db, UploadPhase.TRIPLETS)
     db.commit()
 
 
 def delete_validation_triplets(db: Session) -> None:
     db.query(backend.triplets.models.ValidationTriplet).delete()
+    _delete_triplet_counter(db, backend.triplets.models.ValidationTriplet)
+    _delete_datapack_file(db, UploadPhase.VALIDATION_TRIPLETS)
     db.commit()
 
 
 def get_triplets_stats(db: Session) -> schemas.TripletStats:
-    labeled_count = crud.count_labeled_triplets(db)
-    unlabeled_count = crud.count_unlabeled_triplets(db)
-    validation_labeled_count = crud.count_labeled_validation_triplets(db)
-    validation_unlabeled_count = crud.count_unlabeled_validation_triplets(db)
+    counts = {
+        table_name: (labeled, unlabeled)
+        for table_name, labeled, unlabeled in db.execute(
+            select(
+                backend.triplets.models.TripletCounter.table_name,
+                func.sum(backend.triplets.models.TripletCounter.labeled),
+                func.sum(backend.triplets.models.TripletCounter.unlabeled),
+            ).group_by(backend.triplets.models.TripletCounter.table_name),
+        ).all()
+    }
+    labeled_count, unlabeled_count = counts.get(
+        backend.triplets.models.Triplet.__tablename__,
+        (0, 0),
+    )
+    validation_labeled_count, validation_unlabeled_count = counts.get(
+        backend.triplets.models.ValidationTriplet.__tablename__,
+        (0, 0),
+    )
     return schemas.TripletStats(
         labeled=labeled_count,
         unlabeled=unlabeled_count,
         validation_labeled=validation_labeled_count,
         validation_unlabeled=validation_unlabeled_count,
     )
+
+
+# Recomputes the counters from the triplet tables, in case they drifted, for instance after triplets were inserted or deleted outside of the app
+def repair_triplet_counters(db: Session) -> schemas.TripletStats:
+    # The concurrent increments wait for the end of the repair, so that they apply on top of the recomputed counts
+    db.execute(
+        text(
+            f"LOCK TABLE {backend.triplets.models.TripletCounter.__table__.fullname} IN EXCLUSIVE MODE",
+        ),
+    )
+    db.execute(delete(backend.triplets.models.TripletCounter))
+    for model in (
+        backend.triplets.models.Triplet,
+        backend.triplets.models.ValidationTriplet,
+    ):
+        labeled_count, unlabeled_count = db.execute(
+            select(
+                func.count().filter(model.label.isnot(None)),
+                func.count().filter(model.label.is_(None)),
+            ),
+        ).one()
+        db.add(
+            backend.triplets.models.TripletCounter(
+                table_name=model.__tablename__,
+                slot=0,
+                labeled=labeled_count,
+                unlabeled=unlabeled_count,
+            ),
+        )
+    db.commit()
+    return get_triplets_stats(db)
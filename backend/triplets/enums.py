@@ -5,3 +5,15 @@ class SelectedItemType(str, Enum):
     LEFT = "left"
     RIGHT = "right"
     DONT_KNOW = "dont_know"
+
+
+class LabelStatus(str, Enum):
+    APPLIED = "applied"
+    NOT_FOUND = "not_found"
+    ALREADY_LABELED = "already_labeled"
+    LEASE_LOST = "lease_lost"
+
+
+class LeaseAction(str, Enum):
+    RENEW = "renew"
+    RELEASE = "release"
@@ -0,0 +1,7 @@
+class TripletNotFoundError(ValueError):
+    pass
+
+
+# Raised when a label is written for a triplet whose lease has been taken over by another user, or which is already labeled
+class TripletLeaseError(ValueError):
+    pass
@@ -1,4 +1,18 @@
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String
+from __future__ import annotations
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    Uuid,
+    text,
+)
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
@@ -9,16 +23,20 @@ from backend.triplets.enums import SelectedItemType
 class TripletBase(Base):
     # Use this class as an abstract base class for the other classes, so that SQLAlchemy doesn't create a table for it.
     __abstract__ = True
+    # The columns identifying a triplet, a triplet is only inserted once whatever the number of uploads it is in
+    natural_key: tuple[str, ...] = ()
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     reference_id = Column(String, ForeignKey("item.id"), index=True)
     left_id = Column(String, ForeignKey("item.id"), index=True)
     right_id = Column(String, ForeignKey("item.id"), index=True)
     # cf https://github.com/sqlalchemy/sqlalchemy/discussions/10583, we need to explicitly specify the schema for the Enum to be defined for this specific schema
-    label = Column(Enum(SelectedItemType, inherit_schema=True), index=True)
-    user_id = Column(String, index=True)
+    label = Column(Enum(SelectedItemType, inherit_schema=True))
+    user_id = Column(String)
     # We add a "retrieved_at" column to manage the locking of the triplets, so two users will not deal with the same triplet
-    retrieved_at = Column(DateTime(timezone=True), index=True)
+    retrieved_at = Column(DateTime(timezone=True))
+    # Generated each time the triplet is leased to a user, it has to be provided to label the triplet so that a user whose lease was taken over cannot overwrite the label
+    lease_token = Column(Uuid)
 
     # This method is used to convert the object to a dictionary, useful for retrieving the csv when we download the database
     def to_dict(self) -> dict:
@@ -26,6 +44,27 @@ class TripletBase(Base):
             column.key: getattr(self, column.key) for column in self.__table__.columns
         }
 
+    # The triplets are dispatched in the order of their ids among the unlabeled ones, so we only index the unlabeled triplets: the labeled ones do not slow down the dispatch, however many there are. "retrieved_at" is included to check the lock without visiting the rows which are locked
+    @declared_attr.directive
+    def __table_args__(cls) -> tuple:
+        return (
+            UniqueConstraint(*cls.natural_key, name=f"uq_{cls.__tablename__}_natural_key"),
+            Index(
+                f"ix_{cls.__tablename__}_unlabeled_id",
+                "id",
+                postgresql_include=["retrieved_at"],
+                postgresql_where=text("label IS NULL"),
+            ),
+            # Used to give back to a user the triplets it still holds
+            Index(
+                f"ix_{cls.__tablename__}_unlabeled_user_id_id",
+                "user_id",
+                "id",
+                postgresql_include=["retrieved_at"],
+                postgresql_where=text("label IS NULL"),
+            ),
+        )
+
     # We need to use the @declared_attr decorator to be able to use the relationships in the subclasses
     @declared_attr
     def reference_item(cls):
@@ -42,12 +81,32 @@ class TripletBase(Base):
 
 class Triplet(TripletBase):
     __tablename__ = "triplet"
+    natural_key = ("reference_id", "left_id", "right_id", "encoder_id")
 
     encoder_id = Column(String, index=True)
 
 
 class ValidationTriplet(TripletBase):
     __tablename__ = "validation_triplet"
+    natural_key = (
+        "reference_id",
+        "left_id",
+        "left_encoder_id",
+        "right_id",
+        "right_encoder_id",
+    )
 
     left_encoder_id = Column(String, index=True)
     right_encoder_id = Column(String, index=True)
+
+
+# The number of labeled and unlabeled triplets of each table is maintained in the same transactions as the writes to the triplet tables, so that the stats do not need to count the triplets
+class TripletCounter(Base):
+    __tablename__ = "triplet_counter"
+
+    # Name of the counted table, "triplet" or "validation_triplet"
+    table_name = Column(String, primary_key=True)
+    # The counts of a table are spread over several slots, whose sum gives the counts, so that concurrent label writes do not wait for each other on a single row
+    slot = Column(Integer, primary_key=True)
+    labeled = Column(BigInteger, nullable=False, default=0)
+    unlabeled = Column(BigInteger, nullable=False, default=0)
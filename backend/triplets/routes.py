@@ -3,20 +3,27 @@ from __future__ import annotations
 import logging
 import time
 
+# FastAPI reads the annotations of the routes at runtime, it has to stay out of a type checking block
+import uuid  # noqa: TCH003
+
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
     status,
 )
 from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, StreamingResponse
 
+from backend.config.config import config
 from backend.core.api.auth.core import AdminUserSession, UserSession
 from backend.core.database.manage import get_db
+from backend.images_utils.bundles import get_images_bundle_response
 from backend.triplets import crud, schemas
-from backend.triplets.enums import SelectedItemType
+from backend.triplets.enums import LabelStatus, LeaseAction, SelectedItemType
+from backend.triplets.exceptions import TripletLeaseError, TripletNotFoundError
 from backend.triplets.flows import (
     get_triplets_csv_stream,
     get_validation_triplets_csv_stream,
@@ -39,9 +46,9 @@ async def get_triplet(
     db: Session = Depends(get_db),
 ) -> schemas.TripletResponse | schemas.ValidationTripletResponse:
     if validation:
-        triplet = crud.get_first_unlabeled_validation_triplet(db)
+        triplet = crud.get_first_unlabeled_validation_triplet(db, user.uid)
     else:
-        triplet = crud.get_first_unlabeled_triplet(db)
+        triplet = crud.get_first_unlabeled_triplet(db, user.uid)
 
     if triplet is None:
         logger.info("No unlabeled triplet found.")
@@ -51,44 +58,118 @@ async def get_triplet(
         )
     if validation:
         logger.info("Validation Triplet %s retrieved.", triplet.id)
-        return schemas.ValidationTripletResponse(
-            id=triplet.id,
-            reference_id=triplet.reference_id,
-            reference_length=triplet.reference_item.length,
-            reference_dataset=triplet.reference_item.dataset,
-            left_id=triplet.left_id,
-            left_length=triplet.left_item.length,
-            left_dataset=triplet.left_item.dataset,
-            left_encoder_id=triplet.left_encoder_id,
-            right_id=triplet.right_id,
-            right_length=triplet.right_item.length,
-            right_dataset=triplet.right_item.dataset,
-            right_encoder_id=triplet.right_encoder_id,
-        )
+        return schemas.ValidationTripletResponse.model_validate(triplet)
     logger.info("Triplet %s retrieved.", triplet.id)
-    return schemas.TripletResponse(
-        id=triplet.id,
-        reference_id=triplet.reference_id,
-        reference_length=triplet.reference_item.length,
-        reference_dataset=triplet.reference_item.dataset,
-        left_id=triplet.left_id,
-        left_length=triplet.left_item.length,
-        left_dataset=triplet.left_item.dataset,
-        right_id=triplet.right_id,
-        right_length=triplet.right_item.length,
-        right_dataset=triplet.right_item.dataset,
+    return schemas.TripletResponse.model_validate(triplet)
+
+
+# The triplets are leased to the user for config.lock_timeout_in_seconds, like the one from GET /triplet, so that the frontend can prefetch the images of the next triplets
+@router.get(
+    "/triplet/batch",
+    summary="Get several triplets at once for the user of the app, each of them being leased until its 'lease_expires_at' time.",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.TripletResponse]
+    | list[schemas.ValidationTripletResponse],
+)
+async def get_triplets_batch(
+    user: UserSession,
+    n: int = Query(ge=1, le=config.max_lease_batch_size),
+    validation: bool = False,
+    db: Session = Depends(get_db),
+) -> list[schemas.TripletResponse] | list[schemas.ValidationTripletResponse]:
+    if validation:
+        triplets = crud.get_unlabeled_validation_triplets(db, n, user.uid)
+    else:
+        triplets = crud.get_unlabeled_triplets(db, n, user.uid)
+
+    if not triplets:
+        logger.info("No unlabeled triplet found.")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No unlabeled triplet found.",
+        )
+    if validation:
+        logger.info("%s validation triplets retrieved.", len(triplets))
+        return [
+            schemas.ValidationTripletResponse.model_validate(triplet)
+            for triplet in triplets
+        ]
+    logger.info("%s triplets retrieved.", len(triplets))
+    return [schemas.TripletResponse.model_validate(triplet) for triplet in triplets]
+
+
+# All the images needed to display triplets in a single response, rather than one request per image
+@router.get(
+    "/triplet/images",
+    summary="Get the images of several triplets in a single multipart/mixed response. Each part is an image, named after its item and its file, and sent once even when its item is in several triplets. Provide 'canonical=true' to also get the canonical images.",
+    status_code=status.HTTP_200_OK,
+)
+async def get_triplets_images(
+    user: UserSession,
+    ids: list[int] = Query(),
+    validation: bool = False,
+    canonical: bool = False,
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    if len(ids) > config.max_lease_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most the images of {config.max_lease_batch_size} triplets can be retrieved at once.",
+        )
+    triplets_items_ids = crud.get_triplets_items_ids(db, ids, validation)
+    if not triplets_items_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No triplet found.",
+        )
+    logger.info("Images of %s triplets retrieved.", len(triplets_items_ids))
+    return get_images_bundle_response(
+        db,
+        (
+            item_id
+            for items_ids in triplets_items_ids.values()
+            for item_id in items_ids
+        ),
+        canonical,
+    )
+
+
+@router.get(
+    "/triplet/{triplet_id}/images",
+    summary="Get the images of the reference, left and right items of a triplet in a single multipart/mixed response. Provide 'canonical=true' to also get the canonical images.",
+    status_code=status.HTTP_200_OK,
+)
+async def get_triplet_images(
+    user: UserSession,
+    triplet_id: int,
+    validation: bool = False,
+    canonical: bool = False,
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    triplets_items_ids = crud.get_triplets_items_ids(db, [triplet_id], validation)
+    if not triplets_items_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Triplet not found.",
+        )
+    logger.info("Images of triplet %s retrieved.", triplet_id)
+    return get_images_bundle_response(
+        db,
+        triplets_items_ids[triplet_id],
+        canonical,
     )
 
 
 @router.post(
     "/triplet",
-    summary="Set the label of a triplet according to the user's choice.",
+    summary="Set the label of a triplet according to the user's choice. The lease token given with the triplet has to be provided.",
     status_code=status.HTTP_200_OK,
 )
 async def set_triplet_label(
     user: UserSession,
-    triplet_id: str,
+    triplet_id: int,
     label: SelectedItemType,
+    lease_token: uuid.UUID,
     validation: bool = False,
     db: Session = Depends(get_db),
 ) -> JSONResponse:
@@ -98,8 +179,17 @@ async def set_triplet_label(
             triplet_id,
             label,
             user.uid,
-        ) if validation else crud.set_triplet_label(db, triplet_id, label, user.uid)
-    except ValueError as e:
+            lease_token,
+        ) if validation else crud.set_triplet_label(
+            db,
+            triplet_id,
+            label,
+            user.uid,
+            lease_token,
+        )
+    except TripletLeaseError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    except TripletNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from e
 
     if validation:
@@ -112,6 +202,60 @@ async def set_triplet_label(
     )
 
 
+# The frontend can renew the leases of the triplets it still displays, and release them when the tab is closed so that they do not stay locked until the timeout
+@router.post(
+    "/triplet/lease",
+    summary="Renew or release the leases of triplets held by the user.",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.TripletLeaseResult],
+)
+async def update_triplets_leases(
+    user: UserSession,
+    action: LeaseAction,
+    leases: list[schemas.TripletLease],
+    db: Session = Depends(get_db),
+) -> list[schemas.TripletLeaseResult]:
+    if len(leases) > config.max_lease_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.max_lease_batch_size} leases can be updated at once.",
+        )
+    results = crud.update_triplets_leases(db, leases, action)
+    logger.info(
+        "%s action applied to %s leases out of %s.",
+        action.value,
+        sum(result.applied for result in results),
+        len(results),
+    )
+    return results
+
+
+# Allows the clients to flush several labels at once, they are all applied in a single transaction
+@router.post(
+    "/triplet/labels",
+    summary="Set the labels of several triplets at once. Triplets which are already labeled are not modified.",
+    status_code=status.HTTP_200_OK,
+    response_model=list[schemas.TripletLabelResult],
+)
+async def set_triplets_labels(
+    user: UserSession,
+    labels: list[schemas.TripletLabel],
+    db: Session = Depends(get_db),
+) -> list[schemas.TripletLabelResult]:
+    if len(labels) > config.max_labels_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.max_labels_batch_size} labels can be set at once.",
+        )
+    results = crud.set_triplets_labels(db, labels, user.uid)
+    logger.info(
+        "%s triplets labeled out of %s.",
+        sum(result.status == LabelStatus.APPLIED for result in results),
+        len(results),
+    )
+    return results
+
+
 @router.get(
     "/triplet/stats",
     summary="Get the number of labeled and unlabeled triplets.",
@@ -2,10 +2,11 @@ from __future__ import annotations
 
 # Be careful not to move into a type checking block because in this case pydantic will not be able to find the datetime module !
 import datetime  # noqa: TCH003
+import uuid  # noqa: TCH003
 
 from pydantic import BaseModel
 
-from backend.triplets.enums import SelectedItemType
+from backend.triplets.enums import LabelStatus, SelectedItemType
 
 
 class TripletBase(BaseModel):
@@ -26,6 +27,10 @@ class TripletResponse(TripletBase):
     left_dataset: str
     right_length: float
     right_dataset: str
+    # The lease token has to be provided to set the label of the triplet
+    lease_token: uuid.UUID
+    # Past this time, the triplet can be retrieved by another user
+    lease_expires_at: datetime.datetime
 
 
 class ValidationTripletResponse(TripletBase):
@@ -38,6 +43,8 @@ class ValidationTripletResponse(TripletBase):
     right_dataset: str
     left_encoder_id: str
     right_encoder_id: str
+    lease_token: uuid.UUID
+    lease_expires_at: datetime.datetime
 
 
 class Triplet(TripletBase):
@@ -60,3 +67,35 @@ class ValidationTriplet(TripletBase):
     label: SelectedItemType | None = None
     user_id: str | None = None
     retrieved_at: datetime.datetime | None = None
+
+
+class TripletLabel(BaseModel):
+    triplet_id: int
+    label: SelectedItemType
+    lease_token: uuid.UUID
+    validation: bool = False
+
+
+class TripletLabelResult(BaseModel):
+    triplet_id: int
+    validation: bool
+    status: LabelStatus
+
+
+class TripletLease(BaseModel):
+    triplet_id: int
+    lease_token: uuid.UUID
+    validation: bool = False
+
+
+class TripletLeaseResult(BaseModel):
+    triplet_id: int
+    validation: bool
+    # False if the lease is not held anymore or the triplet is already labeled
+    applied: bool
+    lease_expires_at: datetime.datetime | None = None
+
+
+class TripletsCreateReport(BaseModel):
+    inserted: int = 0
+    skipped: int = 0
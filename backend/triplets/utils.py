@@ -1,38 +1,72 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
-
 import pandas as pd
-from fastapi import HTTPException, status
-
-from backend.utils import logger
-
-if TYPE_CHECKING:
-    from pathlib import Path
 
+from backend.triplets.enums import SelectedItemType
 
-def load_triplets(data_path: Path) -> pd.DataFrame:
-    try:
-        return pd.read_csv(data_path)
-    except FileNotFoundError as e:
-        logger.info("File not found: %s", e)
-        return pd.DataFrame()
+TRIPLET_COLUMNS = ["reference_id", "left_id", "right_id", "encoder_id"]
+VALIDATION_TRIPLET_COLUMNS = [
+    "reference_id",
+    "left_id",
+    "left_encoder_id",
+    "right_id",
+    "right_encoder_id",
+]
+# The uploaded triplets can already be labeled
+OPTIONAL_TRIPLET_COLUMNS = ["label", "user_id"]
+TRIPLET_DTYPES = dict.fromkeys(
+    [*TRIPLET_COLUMNS, "left_encoder_id", "right_encoder_id", *OPTIONAL_TRIPLET_COLUMNS],
+    "string",
+)
+# The labels are stored by the names of the enum members, but can be given by their values as well
+LABELS_NAMES = {
+    **{member.value: member.name for member in SelectedItemType},
+    **{member.name: member.name for member in SelectedItemType},
+}
 
 
-def extract_triplets_ids(triplets: pd.DataFrame) -> set[str]:
-    """Extract a set of triplet IDs from a DataFrame."""
-    return set(
-        triplets[["reference_id", "left_id", "right_id"]].to_numpy().flatten(),
+# The checks and conversions are done on whole columns, before writing the triplets to the database
+def prepare_triplets(
+    triplets: pd.DataFrame,
+    required_columns: list[str],
+) -> pd.DataFrame:
+    missing_columns = [
+        column_name
+        for column_name in required_columns
+        if column_name not in triplets.columns
+    ]
+    if missing_columns:
+        msg = f"Missing triplets columns: {', '.join(missing_columns)}"
+        raise ValueError(msg)
+    triplets = triplets[
+        required_columns
+        + [
+            column_name
+            for column_name in OPTIONAL_TRIPLET_COLUMNS
+            if column_name in triplets.columns
+        ]
+    ]
+    null_columns = [
+        column_name
+        for column_name in required_columns
+        if triplets[column_name].isna().any()
+    ]
+    if null_columns:
+        msg = f"Missing values in triplets columns: {', '.join(null_columns)}"
+        raise ValueError(msg)
+    # The columns read as strings are kept as they are
+    triplets = triplets.astype(
+        {
+            column_name: str
+            for column_name in required_columns
+            if not pd.api.types.is_string_dtype(triplets[column_name])
+        },
     )
-
-
-def check_match_triplets_images(
-    triplets_ids: set[str],
-    all_images_ids: set[str],
-) -> None:
-    missing_images_names = triplets_ids - all_images_ids
-    if missing_images_names:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Missing images for these ids: {missing_images_names}.",
-        )
+    if "label" in triplets.columns:
+        labels = triplets["label"].map(LABELS_NAMES)
+        invalid_labels = triplets["label"][triplets["label"].notna() & labels.isna()]
+        if not invalid_labels.empty:
+            msg = f"Invalid labels: {', '.join(map(str, invalid_labels.unique()[:10]))}"
+            raise ValueError(msg)
+        triplets = triplets.assign(label=labels)
+    return triplets
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import IO, TYPE_CHECKING, NamedTuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.config.config import config
+from backend.images_utils.storage import images_storage
+from backend.upload.enums import DatapackFormat
+from backend.upload.exceptions import DatapackError, UploadTooLargeError
+from backend.upload.readers import (
+    NpyReader,
+    read_arrow_chunks,
+    read_csv_chunks,
+    read_parquet_chunks,
+)
+
+if TYPE_CHECKING:
+    import datetime
+    from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pandas as pd
+
+    from backend.images_utils.storage import ImagesStorage
+
+logger = logging.getLogger()
+
+DATAPACK_DATA_DIR = PurePosixPath("data")
+DATAPACK_IMAGES_DIR = DATAPACK_DATA_DIR / "images"
+DATAPACK_VECTORS_NAME = "vectors.npy"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# The length and the type of a chunk, which is followed by its data and the checksum of its type and data
+PNG_CHUNK_HEADER_SIZE = 8
+PNG_CHUNK_CRC_SIZE = 4
+# Small members compress a lot without being a threat, the compression ratio is only checked above this size
+MIN_CHECKED_MEMBER_SIZE = 1024 * 1024
+
+
+def check_upload_size(size: int, max_size: int = config.max_upload_size) -> None:
+    if size > max_size:
+        msg = f"The upload exceeds the maximum size of {max_size} bytes."
+        raise UploadTooLargeError(msg)
+
+
+# The body is written as it is received, so that the memory used does not depend on its size and an upload too large is stopped as soon as it exceeds the maximum size
+async def save_upload(
+    stream: AsyncIterator[bytes],
+    destination: Path,
+    max_size: int = config.max_upload_size,
+) -> int:
+    size = 0
+    try:
+        with destination.open("wb") as target:
+            async for chunk in stream:
+                size += len(chunk)
+                check_upload_size(size, max_size)
+                await run_in_threadpool(target.write, chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def _check_member(member: zipfile.ZipInfo) -> None:
+    path = PurePosixPath(member.filename)
+    if path.is_absolute() or ".." in path.parts:
+        msg = f"Invalid path in the datapack: {member.filename}"
+        raise DatapackError(msg)
+    if (
+        member.file_size > MIN_CHECKED_MEMBER_SIZE
+        and member.file_size
+        > config.max_datapack_compression_ratio * max(member.compress_size, 1)
+    ):
+        msg = f"Suspicious compression ratio of {member.filename} in the datapack."
+        raise DatapackError(msg)
+
+
+def _check_members(members: list[zipfile.ZipInfo]) -> None:
+    if len(members) > config.max_datapack_members:
+        msg = f"The datapack has more than {config.max_datapack_members} files."
+        raise DatapackError(msg)
+    if sum(member.file_size for member in members) > config.max_datapack_size:
+        msg = f"The uncompressed datapack exceeds {config.max_datapack_size} bytes."
+        raise DatapackError(msg)
+    for member in members:
+        _check_member(member)
+
+
+# The limits are checked against the central directory before anything is read. The declared sizes can be trusted since zipfile stops reading a member at its declared size
+def open_datapack(file_path: Path) -> zipfile.ZipFile:
+    try:
+        datapack = zipfile.ZipFile(file_path)
+    except zipfile.BadZipFile as e:
+        msg = f"The datapack is not a valid zip file: {e}"
+        raise DatapackError(msg) from e
+    try:
+        _check_members(datapack.infolist())
+    except DatapackError:
+        datapack.close()
+        raise
+    return datapack
+
+
+def get_datapack_member(
+    datapack: zipfile.ZipFile,
+    name: str,
+) -> zipfile.ZipInfo | None:
+    try:
+        return datapack.getinfo(str(DATAPACK_DATA_DIR / name))
+    except KeyError:
+        return None
+
+
+# The format of each table is detected from the extension of its file
+def get_datapack_table_member(
+    datapack: zipfile.ZipFile,
+    stem: str,
+) -> tuple[zipfile.ZipInfo, DatapackFormat] | None:
+    for file_format in DatapackFormat:
+        member = get_datapack_member(datapack, f"{stem}.{file_format.value}")
+        if member is not None:
+            return member, file_format
+    return None
+
+
+def hash_datapack_member(datapack: zipfile.ZipFile, member: zipfile.ZipInfo) -> str:
+    digest = hashlib.sha256()
+    with datapack.open(member) as file:
+        while data := file.read(config.upload_chunk_size):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+# pyarrow seeks back and forth in the files it reads, which a compressed member only does by decompressing it again from its start. Such a member is first decompressed to a temporary file next to the datapack, a stored member being read in place
+@contextlib.contextmanager
+def open_seekable_member(
+    datapack: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+) -> Iterator[IO[bytes]]:
+    with datapack.open(member) as source:
+        if member.compress_type == zipfile.ZIP_STORED:
+            yield source
+            return
+        with tempfile.TemporaryFile(dir=Path(datapack.filename).parent) as spool:
+            shutil.copyfileobj(source, spool, config.upload_chunk_size)
+            spool.seek(0)
+            yield spool
+
+
+# The csv files are parsed by chunks as they are decompressed, without being extracted. A missing file yields no chunk
+def iter_datapack_table(
+    datapack: zipfile.ZipFile,
+    stem: str,
+    dtypes: dict[str, str],
+) -> Iterator[pd.DataFrame]:
+    table_member = get_datapack_table_member(datapack, stem)
+    if table_member is None:
+        logger.info("File not found in the datapack: %s", stem)
+        return
+    member, file_format = table_member
+    if file_format == DatapackFormat.CSV:
+        with datapack.open(member) as file:
+            yield from read_csv_chunks(file, dtypes)
+        return
+    with open_seekable_member(datapack, member) as file:
+        if file_format == DatapackFormat.PARQUET:
+            yield from read_parquet_chunks(file)
+        else:
+            yield from read_arrow_chunks(file)
+
+
+# The vectors of the items are given in the same order as the items
+@contextlib.contextmanager
+def open_datapack_vectors(datapack: zipfile.ZipFile) -> Iterator[NpyReader | None]:
+    member = get_datapack_member(datapack, DATAPACK_VECTORS_NAME)
+    if member is None:
+        yield None
+        return
+    with datapack.open(member) as file:
+        yield NpyReader(file)
+
+
+def get_datapack_images(datapack: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [
+        member
+        for member in datapack.infolist()
+        if not member.is_dir()
+        and PurePosixPath(member.filename).parent == DATAPACK_IMAGES_DIR
+    ]
+
+
+# The chunks of the image are read one after the other up to the IEND chunk, the checksum of each of them being computed while it is read. Yields each time data is read
+def _read_png_chunks(read: Callable[[int], bytes]) -> Iterator[None]:
+    if read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        msg = "Invalid PNG signature."
+        raise DatapackError(msg)
+    chunk_type = None
+    while chunk_type != b"IEND":
+        header = read(PNG_CHUNK_HEADER_SIZE)
+        if len(header) < PNG_CHUNK_HEADER_SIZE:
+            msg = "Truncated PNG image."
+            raise DatapackError(msg)
+        is_first_chunk = chunk_type is None
+        length, chunk_type = struct.unpack(">I4s", header)
+        if is_first_chunk and chunk_type != b"IHDR":
+            msg = "Invalid PNG header."
+            raise DatapackError(msg)
+        crc = zlib.crc32(chunk_type)
+        while length:
+            data = read(min(length, config.upload_chunk_size))
+            if not data:
+                msg = "Truncated PNG image."
+                raise DatapackError(msg)
+            crc = zlib.crc32(data, crc)
+            length -= len(data)
+            yield
+        if read(PNG_CHUNK_CRC_SIZE) != struct.pack(">I", crc):
+            msg = f"Invalid checksum of the PNG {chunk_type.decode(errors='replace')} chunk."
+            raise DatapackError(msg)
+
+
+# The image is checked while it is read, and what is read is yielded by pieces of about the size of the upload chunks, the data following the IEND chunk included
+def iter_png_data(source: IO[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+
+    def read(size: int) -> bytes:
+        data = source.read(size)
+        buffer.extend(data)
+        return data
+
+    for _ in _read_png_chunks(read):
+        if len(buffer) >= config.upload_chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    while read(config.upload_chunk_size):
+        yield bytes(buffer)
+        buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_file_data(source: IO[bytes]) -> Iterator[bytes]:
+    while data := source.read(config.upload_chunk_size):
+        yield data
+
+
+class WrittenImage(NamedTuple):
+    size: int
+    sha256: str
+    mtime: datetime.datetime
+    pack: int | None = None
+    offset: int | None = None
+
+
+# The image is decompressed straight into the storage of the images, and checked and hashed along the way, in a single pass. The storage is handed its chunks while they are read, a corrupt image being never written. An image whose size and hash are the ones of the stored image is not written again, and None is returned
+def write_datapack_image(
+    datapack: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+    storage: ImagesStorage = images_storage,
+    check_png: bool = config.images_check_png,
+    stored_hash: tuple[int, str] | None = None,
+) -> WrittenImage | None:
+    if stored_hash is not None and stored_hash[0] == member.file_size:
+        try:
+            sha256 = hash_datapack_member(datapack, member)
+        except zipfile.BadZipFile as e:
+            raise DatapackError(str(e)) from e
+        if sha256 == stored_hash[1]:
+            return None
+    digest = hashlib.sha256()
+
+    def iter_member_chunks() -> Iterator[bytes]:
+        with datapack.open(member) as source:
+            for data in (iter_png_data if check_png else iter_file_data)(source):
+                digest.update(data)
+                yield data
+
+    try:
+        stored = storage.write_image(
+            PurePosixPath(member.filename).name,
+            iter_member_chunks(),
+        )
+    except zipfile.BadZipFile as e:
+        # The checksum of the member is checked once it is fully read
+        raise DatapackError(str(e)) from e
+    return WrittenImage(
+        stored.size,
+        digest.hexdigest(),
+        stored.mtime,
+        stored.pack,
+        stored.offset,
+    )
+
+
+# The images are written in parallel, zipfile allowing several members to be read at the same time. The sizes and the hashes of the stored images are given by their names. Returns the images written, the names of the unchanged ones and the errors of the others, by their names
+def write_datapack_images(
+    datapack: zipfile.ZipFile,
+    members: Iterable[zipfile.ZipInfo],
+    storage: ImagesStorage,
+    executor: ThreadPoolExecutor,
+    stored_hashes: dict[str, tuple[int, str]] | None = None,
+) -> tuple[dict[str, WrittenImage], list[str], dict[str, str]]:
+    stored_hashes = stored_hashes or {}
+    members_by_name = {PurePosixPath(member.filename).name: member for member in members}
+    futures = {
+        name: executor.submit(
+            write_datapack_image,
+            datapack,
+            member,
+            storage,
+            stored_hash=stored_hashes.get(name),
+        )
+        for name, member in members_by_name.items()
+    }
+    images, unchanged, errors = {}, [], {}
+    for name, future in futures.items():
+        # The other errors are raised by the result
+        if isinstance(future.exception(), DatapackError):
+            errors[name] = str(future.exception())
+        elif (image := future.result()) is None:
+            unchanged.append(name)
+        else:
+            images[name] = image
+    return images, unchanged, errors
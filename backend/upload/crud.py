@@ -1,35 +1,350 @@
+from __future__ import annotations
+
+import contextlib
+import datetime
+import uuid
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, exists, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
-from backend.upload import models, schemas
+from backend.config.config import config
+from backend.upload import models
+from backend.upload.enums import UploadJobStatus, UploadPhase
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from sqlalchemy import Connection
+
+# Arbitrary key of the advisory lock taken to claim upload jobs
+UPLOAD_JOBS_LOCK_ID = 4242
+
+
+def create_upload_job(
+    db: Session,
+    file_path: Path,
+    user_id: str,
+) -> models.UploadJob:
+    job = models.UploadJob(
+        status=UploadJobStatus.QUEUED,
+        file_path=str(file_path),
+        user_id=user_id,
+        created_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_upload_job(
+    db: Session,
+    job_id: int,
+) -> models.UploadJob | None:
+    return db.get(models.UploadJob, job_id)
+
+
+def get_last_upload_job(db: Session) -> models.UploadJob | None:
+    return db.scalars(
+        select(models.UploadJob).order_by(models.UploadJob.id.desc()).limit(1),
+    ).first()
+
+
+# The claims of all the workers are serialized by an advisory lock, so that the number of running jobs never exceeds the limit. The jobs are run in the order they were created
+def claim_next_upload_job(
+    db: Session,
+    max_concurrent_uploads: int = config.max_concurrent_uploads,
+) -> models.UploadJob | None:
+    db.execute(select(func.pg_advisory_xact_lock(UPLOAD_JOBS_LOCK_ID)))
+    running_count = db.scalar(
+        select(func.count()).where(
+            models.UploadJob.status == UploadJobStatus.RUNNING,
+        ),
+    )
+    if running_count >= max_concurrent_uploads:
+        db.commit()
+        return None
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    job = db.scalars(
+        update(models.UploadJob)
+        .where(
+            models.UploadJob.id
+            == select(models.UploadJob.id)
+            .where(models.UploadJob.status == UploadJobStatus.QUEUED)
+            .order_by(models.UploadJob.id)
+            .limit(1)
+            .scalar_subquery(),
+        )
+        .values(
+            status=UploadJobStatus.RUNNING,
+            started_at=now_time,
+            heartbeat_at=now_time,
+            attempts=models.UploadJob.attempts + 1,
+        )
+        .returning(models.UploadJob),
+    ).first()
+    db.commit()
+    return job
+
+
+def heartbeat_upload_job(
+    db: Session,
+    job_id: int,
+) -> None:
+    db.execute(
+        update(models.UploadJob)
+        .where(models.UploadJob.id == job_id)
+        .values(heartbeat_at=datetime.datetime.now(datetime.timezone.utc)),
+    )
+    db.commit()
 
 
-def create_upload_status(
+def finish_upload_job(
     db: Session,
-    to_upload_count: int,
-) -> models.AllTripletsUploadStatus:
-    db_status = models.AllTripletsUploadStatus(
-        to_upload_count=to_upload_count,
-        uploaded_count=0,
+    job_id: int,
+    error: str | None = None,
+    problems: list[dict] | None = None,
+) -> None:
+    db.execute(
+        update(models.UploadJob)
+        .where(models.UploadJob.id == job_id)
+        .values(
+            status=UploadJobStatus.FAILED if error else UploadJobStatus.SUCCEEDED,
+            error=error,
+            problems=problems,
+            finished_at=datetime.datetime.now(datetime.timezone.utc),
+        ),
     )
-    db.add(db_status)
     db.commit()
-    db.refresh(db_status)
-    return db_status
 
 
-def get_upload_status(
+# The running jobs whose heartbeat stopped were interrupted by a restart of their worker. They are run again if they have attempts left, otherwise they are failed and the paths of their files are returned
+def recover_upload_jobs(
     db: Session,
-) -> models.AllTripletsUploadStatus:
-    upload_status = (
-        db.query(models.AllTripletsUploadStatus)
-        .order_by(models.AllTripletsUploadStatus.id.desc())
-        .first()
+    stale_timeout_in_seconds: int = config.upload_job_stale_timeout_in_seconds,
+    max_attempts: int = config.upload_job_max_attempts,
+) -> list[str]:
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    interrupted = (models.UploadJob.status == UploadJobStatus.RUNNING) & (
+        models.UploadJob.heartbeat_at
+        < now_time - datetime.timedelta(seconds=stale_timeout_in_seconds)
+    )
+    db.execute(
+        update(models.UploadJob)
+        .where(interrupted, models.UploadJob.attempts < max_attempts)
+        .values(status=UploadJobStatus.QUEUED),
     )
-    if upload_status is None:
-        # Return a default TripletUploadStatus object when there is no record in the database, because we experienced a bug when no data was uploaded yet
-        return schemas.AllTripletsUploadStatus(
-            id=0,
-            to_upload_count=0,
-            uploaded_count=0,
+    failed_files_paths = db.scalars(
+        update(models.UploadJob)
+        .where(interrupted)
+        .values(
+            status=UploadJobStatus.FAILED,
+            error="The upload was interrupted by a restart of its worker.",
+            finished_at=now_time,
         )
-    return upload_status
+        .returning(models.UploadJob.file_path),
+    ).all()
+    db.commit()
+    return list(failed_files_paths)
+
+
+# Holds the lock of the claims of the upload jobs on the connection, across the transactions run on it meanwhile, so that no upload job starts until it is released
+@contextlib.contextmanager
+def hold_upload_jobs_lock(connection: Connection) -> Iterator[None]:
+    connection.execute(select(func.pg_advisory_lock(UPLOAD_JOBS_LOCK_ID)))
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.rollback()
+        connection.execute(select(func.pg_advisory_unlock(UPLOAD_JOBS_LOCK_ID)))
+        connection.commit()
+
+
+def has_unfinished_upload_jobs(db: Session) -> bool:
+    return db.scalar(
+        select(
+            exists().where(
+                models.UploadJob.status.in_(
+                    [UploadJobStatus.QUEUED, UploadJobStatus.RUNNING],
+                ),
+            ),
+        ),
+    )
+
+
+# Restarting a phase, when the job is run again, resets its progress
+def start_upload_phase(
+    db: Session,
+    job_id: int,
+    phase: UploadPhase,
+    total_count: int | None = None,
+) -> None:
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    statement = insert(models.UploadJobPhase).values(
+        job_id=job_id,
+        phase=phase,
+        total_count=total_count,
+        done_count=0,
+        started_at=now_time,
+        updated_at=now_time,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["job_id", "phase"],
+            set_={
+                "total_count": statement.excluded.total_count,
+                "done_count": 0,
+                "started_at": now_time,
+                "updated_at": now_time,
+                "finished_at": None,
+            },
+        ),
+    )
+    db.commit()
+
+
+# Not committed, so that the progress is committed along with the chunk it accounts for
+def advance_upload_phase(
+    db: Session,
+    job_id: int,
+    phase: UploadPhase,
+    count: int,
+) -> None:
+    db.execute(
+        update(models.UploadJobPhase)
+        .where(
+            models.UploadJobPhase.job_id == job_id,
+            models.UploadJobPhase.phase == phase,
+        )
+        .values(
+            done_count=models.UploadJobPhase.done_count + count,
+            updated_at=datetime.datetime.now(datetime.timezone.utc),
+        ),
+    )
+
+
+def finish_upload_phase(
+    db: Session,
+    job_id: int,
+    phase: UploadPhase,
+) -> None:
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    db.execute(
+        update(models.UploadJobPhase)
+        .where(
+            models.UploadJobPhase.job_id == job_id,
+            models.UploadJobPhase.phase == phase,
+        )
+        .values(updated_at=now_time, finished_at=now_time),
+    )
+    db.commit()
+
+
+def create_upload_session(
+    db: Session,
+    chunks_count: int,
+    sha256: str | None,
+    user_id: str,
+) -> models.UploadSession:
+    upload_session = models.UploadSession(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        chunks_count=chunks_count,
+        sha256=sha256,
+        created_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    db.add(upload_session)
+    db.commit()
+    db.refresh(upload_session)
+    return upload_session
+
+
+# The session is locked while it is finalized, so that it is turned into a single upload job
+def get_upload_session(
+    db: Session,
+    session_id: uuid.UUID,
+    lock: bool = False,
+) -> models.UploadSession | None:
+    return db.get(models.UploadSession, session_id, with_for_update=lock)
+
+
+# The job is created in the same transaction as the session is updated, so that the lock on the session is held until then
+def finalize_upload_session(
+    db: Session,
+    upload_session: models.UploadSession,
+    file_path: Path,
+    user_id: str,
+) -> models.UploadJob:
+    job = models.UploadJob(
+        status=UploadJobStatus.QUEUED,
+        file_path=str(file_path),
+        user_id=user_id,
+        created_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    db.add(job)
+    db.flush()
+    upload_session.job_id = job.id
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# Returns the ids of the expired sessions, whose chunks can be removed
+def delete_expired_upload_sessions(
+    db: Session,
+    ttl_in_hours: int = config.upload_session_ttl_in_hours,
+) -> list[uuid.UUID]:
+    expired_sessions_ids = db.scalars(
+        delete(models.UploadSession)
+        .where(
+            models.UploadSession.created_at
+            < datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(hours=ttl_in_hours),
+        )
+        .returning(models.UploadSession.id),
+    ).all()
+    db.commit()
+    return list(expired_sessions_ids)
+
+
+# Returns the files among the given ones which were already written, by their names
+def get_datapack_files(
+    db: Session,
+    hashes: dict[str, str],
+) -> dict[str, models.DatapackFile]:
+    if not hashes:
+        return {}
+    files = db.scalars(
+        select(models.DatapackFile).where(
+            tuple_(models.DatapackFile.name, models.DatapackFile.sha256).in_(
+                list(hashes.items()),
+            ),
+        ),
+    )
+    return {file.name: file for file in files}
+
+
+# The file is recorded once all its rows are written, so that a job interrupted before can be run again
+def add_datapack_file(
+    db: Session,
+    name: str,
+    sha256: str,
+    rows_count: int,
+    job_id: int | None = None,
+) -> None:
+    db.execute(
+        insert(models.DatapackFile)
+        .values(
+            name=name,
+            sha256=sha256,
+            rows_count=rows_count,
+            job_id=job_id,
+            created_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        .on_conflict_do_nothing(),
+    )
+    db.commit()
@@ -0,0 +1,39 @@
+from enum import Enum
+
+
+class IngestMethod(str, Enum):
+    # "COPY FROM STDIN", the fastest
+    COPY = "copy"
+    # Multi-row "INSERT" statements, in case COPY is not available
+    INSERT = "insert"
+
+
+class CsvEngine(str, Enum):
+    C = "c"
+    # Faster and keeps the strings out of Python objects, needs pyarrow to be installed
+    PYARROW = "pyarrow"
+
+
+# The formats of the tables of a datapack, by order of precedence when a table is given in several formats
+class DatapackFormat(str, Enum):
+    PARQUET = "parquet"
+    ARROW = "arrow"
+    CSV = "csv"
+
+
+class UploadJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+# In the order in which they are run
+class UploadPhase(str, Enum):
+    EXTRACT = "extract"
+    VALIDATE = "validate"
+    ITEMS = "items"
+    VECTORS = "vectors"
+    TRIPLETS = "triplets"
+    VALIDATION_TRIPLETS = "validation_triplets"
+    IMAGES = "images"
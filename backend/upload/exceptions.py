@@ -0,0 +1,30 @@
+# Raised when an uploaded datapack is not a valid zip file, or exceeds the limits protecting the disk and the memory of the workers
+class DatapackError(ValueError):
+    pass
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+# Raised when the form of an upload cannot be parsed, or has no file
+class UploadFormError(ValueError):
+    pass
+
+
+class UploadChecksumError(ValueError):
+    pass
+
+
+class UploadSessionIncompleteError(ValueError):
+    pass
+
+
+# Raised when the validation of a datapack found problems, the first of them being reported
+class DatapackValidationError(DatapackError):
+    def __init__(self, problems: list, problems_count: int) -> None:
+        self.problems = problems
+        self.problems_count = problems_count
+        super().__init__(
+            f"The datapack has {problems_count} problems, the first {len(problems)} of them are reported.",
+        )
@@ -1,159 +1,385 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import logging
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
 from typing import TYPE_CHECKING
 
-import pandas as pd
-from fastapi import Depends
 from sqlalchemy.orm import Session
 
-import backend.upload.crud
 from backend.config.config import config
-from backend.core.database.manage import get_db
-from backend.items.crud import create_items
-from backend.items.utils import load_items
+from backend.core.database.bulk import iter_chunks, prefetch
+from backend.images_utils.crud import get_images_hashes, upsert_images
+from backend.images_utils.models import Image
+from backend.images_utils.storage import images_storage
+from backend.images_utils.utils import parse_image_name
+from backend.images_utils.variants import (
+    create_variants,
+    evict_variants,
+    get_variant,
+)
+from backend.items.crud import update_items_vectors, upsert_items
+from backend.items.utils import ITEM_DTYPES, prepare_items
 from backend.triplets.crud import create_triplets, create_validation_triplets
 from backend.triplets.utils import (
-    check_match_triplets_images,
-    extract_triplets_ids,
-    load_triplets,
+    TRIPLET_COLUMNS,
+    TRIPLET_DTYPES,
+    VALIDATION_TRIPLET_COLUMNS,
+    prepare_triplets,
 )
-from backend.utils import (
-    check_structure_consistency,
-    extract_zip,
-    get_all_images_ids,
-    get_uploaded_images_ids,
+from backend.upload import crud
+from backend.upload.archive import (
+    DATAPACK_VECTORS_NAME,
+    get_datapack_images,
+    get_datapack_member,
+    get_datapack_table_member,
+    hash_datapack_member,
+    iter_datapack_table,
+    open_datapack,
+    open_datapack_vectors,
+    write_datapack_images,
 )
+from backend.upload.enums import IngestMethod, UploadPhase
+from backend.upload.exceptions import DatapackValidationError
+from backend.upload.schemas import DatapackProblem
+from backend.upload.validation import DatapackValidator
 
 if TYPE_CHECKING:
-    import io
+    import zipfile
+    from collections.abc import Iterable, Iterator
     from pathlib import Path
 
-logger = logging.getLogger()
+    import numpy as np
+    import pandas as pd
 
+    from backend.upload.archive import WrittenImage
+    from backend.upload.models import DatapackFile
+    from backend.upload.progress import UploadProgress
+    from backend.upload.readers import NpyReader
 
-def update_database(
-    db: Session,
-    items: pd.DataFrame,
-    triplets: pd.DataFrame,
-    validation_triplets: pd.DataFrame,
-    uploaded_images_path: Path,
-) -> None:
-    # Has to be done in this order because of foreign key constraints, which are not enforced with SQLite but are with PostgreSQL !
-    if not items.empty:
-        create_items(db, items)
-    if not triplets.empty:
-        create_triplets(db, triplets)
-    if not validation_triplets.empty:
-        create_validation_triplets(db, validation_triplets)
-    uploaded_images = uploaded_images_path.iterdir()
-    config.images_path.mkdir(parents=True, exist_ok=True)
-    for file in uploaded_images:
-        destination = config.images_path / file.name
-        shutil.move(file, destination)
-    logger.info("Database updated")
+logger = logging.getLogger()
 
 
-def upload_verified_data(
-    file_in_memory: io.BytesIO,
-    db: Session = Depends(get_db),
-) -> None:
-    logger.info("Verifying and Uploading data...")
+# The tables of a datapack, in the order in which they are written because of the foreign key constraints
+DATAPACK_TABLES = {
+    UploadPhase.ITEMS: ("items", ITEM_DTYPES, prepare_items),
+    UploadPhase.TRIPLETS: (
+        "triplets",
+        TRIPLET_DTYPES,
+        functools.partial(prepare_triplets, required_columns=TRIPLET_COLUMNS),
+    ),
+    UploadPhase.VALIDATION_TRIPLETS: (
+        "validation_triplets",
+        TRIPLET_DTYPES,
+        functools.partial(
+            prepare_triplets,
+            required_columns=VALIDATION_TRIPLET_COLUMNS,
+        ),
+    ),
+}
 
-    tmp_path = extract_zip(file_in_memory)
-    logger.debug("Zip file extracted.")
 
-    uploaded_data_path = tmp_path / "data"
-    check_structure_consistency(
-        uploaded_data_path,
-        tmp_path,
-        "The zip file should contain a folder named 'data'.",
-    )
+# Each chunk is validated and converted as soon as it is parsed
+def iter_prepared_table(
+    datapack: zipfile.ZipFile,
+    phase: UploadPhase,
+) -> Iterator[pd.DataFrame]:
+    name, dtypes, prepare = DATAPACK_TABLES[phase]
+    return map(prepare, iter_datapack_table(datapack, name, dtypes))
 
-    uploaded_images_path = uploaded_data_path / "images"
-    check_structure_consistency(
-        uploaded_images_path,
-        tmp_path,
-        "The data folder should contain a folder named 'images'.",
-    )
-    uploaded_images_ids = get_uploaded_images_ids(uploaded_images_path)
-    all_images_ids = get_all_images_ids(uploaded_images_ids)
-
-    triplets_path = uploaded_data_path / "triplets.csv"
-    check_structure_consistency(
-        triplets_path,
-        tmp_path,
-        "The zip file should contain a csv file named 'triplets.csv'.",
-    )
 
-    triplets = load_triplets(triplets_path)
-    logger.debug("Triplets loaded.")
+# The hashes of the files of the datapack which are written to the database, by the phase writing them
+def hash_datapack_files(datapack: zipfile.ZipFile) -> dict[UploadPhase, str]:
+    members = {
+        phase: get_datapack_table_member(datapack, name)
+        for phase, (name, _, _) in DATAPACK_TABLES.items()
+    }
+    members = {
+        phase: table_member[0]
+        for phase, table_member in members.items()
+        if table_member is not None
+    }
+    vectors_member = get_datapack_member(datapack, DATAPACK_VECTORS_NAME)
+    if vectors_member is not None:
+        members[UploadPhase.VECTORS] = vectors_member
+    return {
+        phase: hash_datapack_member(datapack, member)
+        for phase, member in members.items()
+    }
 
-    triplets_ids = extract_triplets_ids(triplets)
-    check_match_triplets_images(triplets_ids, all_images_ids)
-    logger.debug("Triplets images checked.")
 
-    validation_triplets_path = uploaded_data_path / "validation_triplets.csv"
-    check_structure_consistency(
-        validation_triplets_path,
-        tmp_path,
-        "The zip file should contain a csv file named 'validation_triplets.csv'.",
+# The whole datapack is validated before anything is written, by a first pass over its tables which also counts their rows, and over the names of its images. The content of the images is checked while they are written. Only the current chunk is held in memory, along with the hashes of the ids and of the triplets
+def validate_datapack(
+    db: Session,
+    datapack: zipfile.ZipFile,
+    progress: UploadProgress,
+    written_files: dict[UploadPhase, DatapackFile],
+) -> dict[UploadPhase, int]:
+    images = get_datapack_images(datapack)
+    validator = DatapackValidator(
+        [PurePosixPath(member.filename).name for member in images],
     )
+    checks = {
+        UploadPhase.ITEMS: validator.check_items,
+        UploadPhase.TRIPLETS: functools.partial(
+            validator.check_triplets,
+            required_columns=TRIPLET_COLUMNS,
+        ),
+        UploadPhase.VALIDATION_TRIPLETS: functools.partial(
+            validator.check_triplets,
+            required_columns=VALIDATION_TRIPLET_COLUMNS,
+        ),
+    }
+    rows_counts = dict.fromkeys(DATAPACK_TABLES, 0)
+    for phase, (name, dtypes, _) in DATAPACK_TABLES.items():
+        if phase in written_files:
+            rows_counts[phase] = written_files[phase].rows_count
+            logger.info("The %s file was already written, it is skipped.", name)
+            continue
+        try:
+            # The columns are read as strings, so that an invalid value is reported on its row rather than making the whole file unreadable
+            for chunk in iter_datapack_table(
+                datapack,
+                name,
+                dict.fromkeys(dtypes, "string"),
+            ):
+                checks[phase](name, chunk, rows_counts[phase])
+                rows_counts[phase] += len(chunk)
+                progress.advance(len(chunk))
+                db.commit()
+        except ValueError as e:
+            validator.add_unreadable_file(name, e)
+        logger.debug("%s %s rows validated.", rows_counts[phase], phase.value)
+    rows_counts[UploadPhase.VECTORS] = 0
+    try:
+        with open_datapack_vectors(datapack) as vectors:
+            if UploadPhase.VECTORS in written_files:
+                rows_counts[UploadPhase.VECTORS] = written_files[
+                    UploadPhase.VECTORS
+                ].rows_count
+                logger.info("The vectors file was already written, it is skipped.")
+            elif vectors is not None:
+                validator.check_vectors(vectors, rows_counts[UploadPhase.ITEMS])
+                rows_counts[UploadPhase.VECTORS] = vectors.rows_count
+    except ValueError as e:
+        validator.add_unreadable_file(DATAPACK_VECTORS_NAME, e)
+    validator.finish(db)
+    return rows_counts
 
-    validation_triplets = load_triplets(validation_triplets_path)
-    logger.debug("Validation triplets loaded.")
 
-    validation_triplets_ids = extract_triplets_ids(validation_triplets)
-    check_match_triplets_images(validation_triplets_ids, all_images_ids)
-    logger.debug("Validation triplets images checked.")
+# The vectors are read along with the items, in the same order
+def iter_items_vectors(
+    datapack: zipfile.ZipFile,
+    vectors: NpyReader,
+) -> Iterator[tuple[pd.Series, np.ndarray]]:
+    for chunk in iter_chunks(
+        iter_prepared_table(datapack, UploadPhase.ITEMS),
+        config.vectors_chunk_size,
+    ):
+        yield chunk["id"], vectors.read(len(chunk))
 
-    update_database(
+
+def _record_datapack_file(
+    db: Session,
+    phase: UploadPhase,
+    hashes: dict[UploadPhase, str],
+    rows_counts: dict[UploadPhase, int],
+    progress: UploadProgress,
+) -> None:
+    crud.add_datapack_file(
         db,
-        triplets,
-        validation_triplets,
-        uploaded_images_path,
+        phase.value,
+        hashes[phase],
+        rows_counts[phase],
+        progress.job_id,
     )
-    logger.info("Database updated")
-
-    shutil.rmtree(tmp_path)
-    logger.debug("Temporary files removed.")
 
 
-def upload_data(file_in_memory: io.BytesIO, db: Session = Depends(get_db)) -> None:
-    logger.info("Uploading data ...")
+# The entries of the manifest of the written images, by their names
+def get_images_manifest(written: dict[str, WrittenImage]) -> list[dict]:
+    manifest = []
+    for name, image in written.items():
+        item_id, canonical = parse_image_name(name)
+        manifest.append(
+            {
+                "item_id": item_id,
+                "canonical": canonical,
+                "size": image.size,
+                "mtime": image.mtime,
+                "sha256": image.sha256,
+                "pack": image.pack,
+                "offset": image.offset,
+            },
+        )
+    return manifest
 
-    tmp_path = extract_zip(file_in_memory)
-    logger.debug("Zip file extracted.")
 
-    uploaded_data_path = tmp_path / "data"
+# The sizes and the hashes of the stored images of the members, by their names
+def get_stored_hashes(
+    db: Session,
+    members: Iterable[zipfile.ZipInfo],
+) -> dict[str, tuple[int, str]]:
+    names = [PurePosixPath(member.filename).name for member in members]
+    images = {name: parse_image_name(name) for name in names}
+    stored_hashes = get_images_hashes(db, {item_id for item_id, _ in images.values()})
+    return {
+        name: stored_hashes[image]
+        for name, image in images.items()
+        if image in stored_hashes
+    }
 
-    triplets_path = uploaded_data_path / "triplets.csv"
-    triplets = load_triplets(triplets_path)
-    triplets_count = len(triplets)
-    logger.debug("Triplets loaded.")
 
-    validation_triplets_path = uploaded_data_path / "validation_triplets.csv"
-    validation_triplets = load_triplets(validation_triplets_path)
-    validation_triplets_count = len(validation_triplets)
-    logger.debug("Validation triplets loaded.")
+# The tables are parsed again while they are written, the next chunk being parsed in the background while the current one is written. Only the files whose hashes are given are written, each of them being recorded once written
+def update_database(
+    db: Session,
+    datapack: zipfile.ZipFile,
+    rows_counts: dict[UploadPhase, int],
+    hashes: dict[UploadPhase, str],
+    progress: UploadProgress,
+    method: IngestMethod = config.ingest_method,
+) -> None:
+    if UploadPhase.ITEMS in hashes:
+        with progress.phase(UploadPhase.ITEMS, rows_counts[UploadPhase.ITEMS]):
+            items_report = upsert_items(
+                db,
+                prefetch(iter_prepared_table(datapack, UploadPhase.ITEMS)),
+                method,
+                progress,
+            )
+            logger.info(
+                "Items: %s inserted, %s updated, %s skipped.",
+                items_report.inserted,
+                items_report.updated,
+                items_report.skipped,
+            )
+        _record_datapack_file(db, UploadPhase.ITEMS, hashes, rows_counts, progress)
+    if UploadPhase.VECTORS in hashes:
+        with (
+            open_datapack_vectors(datapack) as vectors,
+            progress.phase(UploadPhase.VECTORS, rows_counts[UploadPhase.VECTORS]),
+        ):
+            update_items_vectors(
+                db,
+                prefetch(iter_items_vectors(datapack, vectors)),
+                progress,
+            )
+        _record_datapack_file(db, UploadPhase.VECTORS, hashes, rows_counts, progress)
+    for phase, create in [
+        (UploadPhase.TRIPLETS, create_triplets),
+        (UploadPhase.VALIDATION_TRIPLETS, create_validation_triplets),
+    ]:
+        if phase not in hashes:
+            continue
+        with progress.phase(phase, rows_counts[phase]):
+            triplets_report = create(
+                db,
+                prefetch(iter_prepared_table(datapack, phase)),
+                method,
+                progress,
+            )
+            logger.info(
+                "%s: %s inserted, %s already there.",
+                phase.value,
+                triplets_report.inserted,
+                triplets_report.skipped,
+            )
+        _record_datapack_file(db, phase, hashes, rows_counts, progress)
 
-    all_triplets_count = triplets_count + validation_triplets_count
+    images = get_datapack_images(datapack)
+    images_storage.prepare()
+    images_written, images_unchanged, images_errors = {}, [], {}
+    pregenerated_variants = [
+        get_variant(width, image_format)
+        for width, image_format in config.images_pregenerated_variants
+    ]
+    variants_count = 0
+    with (
+        progress.phase(UploadPhase.IMAGES, len(images)),
+        ThreadPoolExecutor(config.images_workers) as executor,
+        ThreadPoolExecutor(config.images_variants_workers) as variants_executor,
+    ):
+        for images_chunk in itertools.batched(images, config.images_chunk_size):
+            # The images already stored with the same content are not written again, which would change their modification time and invalidate their caches
+            written, unchanged, errors = write_datapack_images(
+                datapack,
+                images_chunk,
+                images_storage,
+                executor,
+                get_stored_hashes(db, images_chunk),
+            )
+            # The manifest is updated along with the progress, once the images are in place
+            manifest = get_images_manifest(written)
+            upsert_images(db, manifest)
+            if pregenerated_variants:
+                variants_count += create_variants(
+                    (Image(**entry) for entry in manifest),
+                    pregenerated_variants,
+                    variants_executor,
+                )
+            images_written.update(written)
+            images_unchanged.extend(unchanged)
+            images_errors.update(errors)
+            progress.advance(len(images_chunk))
+            db.commit()
+    logger.info(
+        "%s images written, %s bytes, %s unchanged.",
+        len(images_written),
+        sum(image.size for image in images_written.values()),
+        len(images_unchanged),
+    )
+    if pregenerated_variants:
+        logger.info("%s variants generated.", variants_count)
+        evict_variants()
+    # The corrupt images are found while they are written, and are left out. They are reported once the other ones are written
+    if images_errors:
+        raise DatapackValidationError(
+            [
+                DatapackProblem(file="images", value=name, message=error)
+                for name, error in itertools.islice(
+                    images_errors.items(),
+                    config.max_reported_problems,
+                )
+            ],
+            len(images_errors),
+        )
+    logger.info("Database updated")
 
-    # We create an entry in the database when we know how much triplets we have to upload
-    backend.upload.crud.create_upload_status(db, all_triplets_count)
 
-    items = load_items(uploaded_data_path / "items.csv")
-    logger.debug("Items loaded.")
+# The datapack is read in place, one member at a time: nothing is extracted to a temporary folder
+def upload_data(
+    file_path: Path,
+    db: Session,
+    progress: UploadProgress,
+) -> None:
+    logger.info("Uploading data ...")
 
-    uploaded_images_path = uploaded_data_path / "images"
+    with progress.phase(UploadPhase.EXTRACT):
+        datapack = open_datapack(file_path)
+    logger.debug("Zip file checked.")
 
-    update_database(
-        db,
-        items,
-        triplets,
-        validation_triplets,
-        uploaded_images_path,
-    )
-    shutil.rmtree(tmp_path)
-    logging.info("Temporary files removed.")
+    with datapack:
+        with progress.phase(UploadPhase.VALIDATE):
+            hashes = hash_datapack_files(datapack)
+            written_files = crud.get_datapack_files(
+                db,
+                {phase.value: sha256 for phase, sha256 in hashes.items()},
+            )
+            written_files = {
+                phase: written_files[phase.value]
+                for phase in hashes
+                if phase.value in written_files
+            }
+            rows_counts = validate_datapack(db, datapack, progress, written_files)
+        update_database(
+            db,
+            datapack,
+            rows_counts,
+            {
+                phase: sha256
+                for phase, sha256 in hashes.items()
+                if phase not in written_files
+            },
+            progress,
+        )
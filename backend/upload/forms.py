@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from backend.upload.exceptions import UploadFormError
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from starlette.datastructures import Headers
+
+
+# Parses a multipart body as it is received, keeping only the data of a file field. The other fields are skipped, and nothing is spooled to a temporary file
+class FormFileParser:
+    def __init__(self, boundary: bytes, field_name: str) -> None:
+        self.field_name = field_name.encode()
+        self.found = False
+        self._is_file = False
+        self._header_name = b""
+        self._header_value = b""
+        self._chunks: list[bytes] = []
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+            },
+        )
+
+    def on_part_begin(self) -> None:
+        self._is_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    # Only the first file of the field is kept
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._is_file = (
+                not self.found
+                and options.get(b"name") == self.field_name
+                and b"filename" in options
+            )
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            self._chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        self.found = self.found or self._is_file
+
+    # Returns the data of the file found in the given bytes of the body
+    def write(self, data: bytes) -> list[bytes]:
+        try:
+            self._parser.write(data)
+        except MultipartParseError as e:
+            msg = f"The form is not a valid multipart body: {e}"
+            raise UploadFormError(msg) from e
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+# Yields the data of the file field of a form as the body is received, so that it is written straight to its destination
+async def iter_form_file(
+    headers: Headers,
+    stream: AsyncIterator[bytes],
+    field_name: str = "file",
+) -> AsyncIterator[bytes]:
+    _, params = parse_options_header(headers.get("content-type", ""))
+    if b"boundary" not in params:
+        msg = "The form has no boundary."
+        raise UploadFormError(msg)
+    parser = FormFileParser(params[b"boundary"], field_name)
+    async for data in stream:
+        for chunk in parser.write(data):
+            yield chunk
+    if not parser.found:
+        msg = f"The form has no {field_name} field."
+        raise UploadFormError(msg)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from backend.config.config import config
+from backend.core.api.logging import setup_logging
+from backend.core.database.core import SessionLocal, engine
+from backend.upload import crud
+from backend.upload.exceptions import DatapackValidationError
+from backend.upload.flows import upload_data
+from backend.upload.progress import UploadProgress
+from backend.upload.sessions import remove_session_chunks
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger()
+
+# The pool is created on the first upload so that the app does not spawn processes it does not use
+_executor: ProcessPoolExecutor | None = None
+
+
+def _init_upload_worker() -> None:
+    setup_logging(logging.DEBUG)
+    # The connections inherited from the parent process must not be shared with it
+    engine.dispose(close=False)
+
+
+def get_upload_executor() -> ProcessPoolExecutor:
+    global _executor  # noqa: PLW0603
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config.max_concurrent_uploads,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_upload_worker,
+        )
+    return _executor
+
+
+# Wakes up a worker, which runs the queued jobs until there is none left or the limit of concurrent uploads is reached
+def submit_upload_jobs() -> None:
+    try:
+        get_upload_executor().submit(run_upload_jobs)
+    except BrokenProcessPool:
+        # A worker died abruptly, its job is recovered once its heartbeat is stale
+        logger.warning("The upload workers are restarted.")
+        shutdown_upload_workers()
+        get_upload_executor().submit(run_upload_jobs)
+
+
+# The jobs left running by a previous run of the app look alive until their heartbeat is stale, a second pass recovers them once it is
+def schedule_upload_jobs_recovery() -> asyncio.TimerHandle:
+    return asyncio.get_running_loop().call_later(
+        config.upload_job_stale_timeout_in_seconds,
+        submit_upload_jobs,
+    )
+
+
+def shutdown_upload_workers() -> None:
+    global _executor  # noqa: PLW0603
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+@contextlib.contextmanager
+def heartbeat(job_id: int) -> Iterator[None]:
+    stop_event = threading.Event()
+
+    # The heartbeat uses its own session since the upload session is busy in the main thread
+    def beat() -> None:
+        db = SessionLocal()
+        try:
+            while not stop_event.wait(config.upload_job_heartbeat_in_seconds):
+                crud.heartbeat_upload_job(db, job_id)
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def run_upload_jobs() -> None:
+    db = SessionLocal()
+    try:
+        for file_path in crud.recover_upload_jobs(db):
+            Path(file_path).unlink(missing_ok=True)
+        for session_id in crud.delete_expired_upload_sessions(db):
+            remove_session_chunks(session_id)
+        while job := crud.claim_next_upload_job(db):
+            logger.info("Upload job %s starts.", job.id)
+            file_path = Path(job.file_path)
+            error = None
+            problems = None
+            with heartbeat(job.id):
+                try:
+                    upload_data(file_path, db, UploadProgress(db, job.id))
+                except DatapackValidationError as e:
+                    logger.info("Upload job %s: %s", job.id, e)
+                    db.rollback()
+                    error = str(e)
+                    problems = [problem.model_dump() for problem in e.problems]
+                except Exception as e:
+                    logger.exception("Upload job %s failed.", job.id)
+                    db.rollback()
+                    error = str(e) or type(e).__name__
+            crud.finish_upload_job(db, job.id, error, problems)
+            file_path.unlink(missing_ok=True)
+            logger.info("Upload job %s finished.", job.id)
+    finally:
+        db.close()
@@ -1,11 +1,110 @@
-from sqlalchemy import Column, Integer
+from __future__ import annotations
+
+import datetime
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Integer,
+    String,
+    Uuid,
+)
+from sqlalchemy.orm import relationship
 
 from backend.core.database.core import Base
+from backend.upload.enums import UploadJobStatus, UploadPhase
+
+
+# Each uploaded datapack is stored on disk and processed by the upload workers, the job keeps track of its processing
+class UploadJob(Base):
+    __tablename__ = "upload_job"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(
+        Enum(UploadJobStatus, inherit_schema=True),
+        nullable=False,
+        index=True,
+    )
+    file_path = Column(String, nullable=False)
+    user_id = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    # The first problems found by the validation of the datapack, when it failed
+    problems = Column(JSON)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    # Regularly updated by the worker running the job, a running job whose heartbeat stopped has been interrupted
+    heartbeat_at = Column(DateTime(timezone=True))
+
+    phases = relationship(
+        "UploadJobPhase",
+        order_by="UploadJobPhase.started_at",
+        lazy="selectin",
+    )
+
+
+# The progress of a phase of an upload job, updated once per chunk of rows
+class UploadJobPhase(Base):
+    __tablename__ = "upload_job_phase"
+
+    job_id = Column(
+        Integer,
+        ForeignKey("upload_job.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    phase = Column(Enum(UploadPhase, inherit_schema=True), primary_key=True)
+    total_count = Column(BigInteger)
+    done_count = Column(BigInteger, nullable=False, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+
+    @property
+    def rows_per_second(self) -> float | None:
+        end_time = self.finished_at or self.updated_at
+        elapsed_seconds = (end_time - self.started_at).total_seconds()
+        if not self.done_count or elapsed_seconds <= 0:
+            return None
+        return self.done_count / elapsed_seconds
+
+    # Extrapolated from the throughput of the phase so far
+    @property
+    def estimated_completion_at(self) -> datetime.datetime | None:
+        if self.finished_at is not None:
+            return self.finished_at
+        rows_per_second = self.rows_per_second
+        if self.total_count is None or rows_per_second is None:
+            return None
+        remaining_count = max(self.total_count - self.done_count, 0)
+        return self.updated_at + datetime.timedelta(
+            seconds=remaining_count / rows_per_second,
+        )
+
+
+# A datapack uploaded by chunks, whose chunks are stored on disk until the session is finalized into an upload job
+class UploadSession(Base):
+    __tablename__ = "upload_session"
+
+    id = Column(Uuid, primary_key=True)
+    user_id = Column(String)
+    chunks_count = Column(Integer, nullable=False)
+    # The checksum of the whole datapack, checked when the session is finalized
+    sha256 = Column(String)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    job_id = Column(Integer, ForeignKey("upload_job.id", ondelete="SET NULL"))
 
 
-class AllTripletsUploadStatus(Base):
-    __tablename__ = "all_triplets_upload_status"
+# The files of the datapacks already written to the database, identified by their table and the hash of their content, so that a datapack uploaded again skips them
+class DatapackFile(Base):
+    __tablename__ = "datapack_file"
 
-    id = Column(Integer, primary_key=True, index=True)
-    to_upload_count = Column(Integer, index=True)
-    uploaded_count = Column(Integer, index=True)
+    name = Column(String, primary_key=True)
+    sha256 = Column(String, primary_key=True)
+    rows_count = Column(BigInteger, nullable=False)
+    job_id = Column(Integer, ForeignKey("upload_job.id", ondelete="SET NULL"))
+    created_at = Column(DateTime(timezone=True), nullable=False)
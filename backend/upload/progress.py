@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+from typing import TYPE_CHECKING
+
+from backend.upload import crud
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from sqlalchemy.orm import Session
+
+    from backend.upload.enums import UploadPhase
+
+logger = logging.getLogger()
+
+
+# Records the progress of the phases of an upload job, the writers of the chunks only have to call advance before committing them
+class UploadProgress:
+    def __init__(self, db: Session, job_id: int) -> None:
+        self.db = db
+        self.job_id = job_id
+        self.current_phase: UploadPhase | None = None
+
+    @contextlib.contextmanager
+    def phase(self, phase: UploadPhase, total_count: int | None = None) -> Iterator[None]:
+        crud.start_upload_phase(self.db, self.job_id, phase, total_count)
+        self.current_phase = phase
+        logger.debug("Upload job %s: %s phase starts.", self.job_id, phase.value)
+        # A phase which fails is left unfinished, the advances are not recorded for it any longer
+        try:
+            yield
+        finally:
+            self.current_phase = None
+        crud.finish_upload_phase(self.db, self.job_id, phase)
+
+    def advance(self, count: int) -> None:
+        if self.current_phase is not None:
+            crud.advance_upload_phase(self.db, self.job_id, self.current_phase, count)
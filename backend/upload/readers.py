@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import importlib
+import logging
+from typing import IO, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from backend.config.config import config
+from backend.upload.enums import CsvEngine
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from types import ModuleType
+
+logger = logging.getLogger()
+
+
+# pyarrow is an optional dependency, only needed for the formats and engines relying on it
+def import_pyarrow_module(name: str) -> ModuleType:
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        msg = "pyarrow has to be installed, with the arrow extra (poetry install --extras arrow), to read Parquet and Arrow files, or to use CSV_ENGINE=pyarrow."
+        raise RuntimeError(msg) from e
+
+
+def _read_csv_chunks_with_pyarrow(
+    file: IO[bytes],
+    dtypes: dict[str, str],
+) -> Iterator[pd.DataFrame]:
+    pa = import_pyarrow_module("pyarrow")
+    pa_csv = import_pyarrow_module("pyarrow.csv")
+    reader = pa_csv.open_csv(
+        file,
+        read_options=pa_csv.ReadOptions(block_size=config.csv_block_size),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                column_name: pa.string() if dtype == "string" else pa.from_numpy_dtype(dtype)
+                for column_name, dtype in dtypes.items()
+            },
+            strings_can_be_null=True,
+        ),
+    )
+    # The string columns stay in Arrow memory rather than being converted to Python objects
+    for batch in reader:
+        yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+# The csv file is read by chunks of bounded size, with the types of its columns given rather than inferred. The columns absent from the file are ignored
+def read_csv_chunks(
+    file: IO[bytes],
+    dtypes: dict[str, str],
+    engine: CsvEngine = config.csv_engine,
+    chunk_size: int = config.ingest_chunk_size,
+) -> Iterator[pd.DataFrame]:
+    if engine == CsvEngine.PYARROW:
+        yield from _read_csv_chunks_with_pyarrow(file, dtypes)
+        return
+    with pd.read_csv(
+        file,
+        dtype={
+            column_name: str if dtype == "string" else dtype
+            for column_name, dtype in dtypes.items()
+        },
+        chunksize=chunk_size,
+    ) as reader:
+        yield from reader
+
+
+# The record batches are converted to dataframes backed by the Arrow memory, without copying the numeric columns nor turning the strings into Python objects
+def read_parquet_chunks(
+    file: IO[bytes],
+    chunk_size: int = config.ingest_chunk_size,
+) -> Iterator[pd.DataFrame]:
+    pa_parquet = import_pyarrow_module("pyarrow.parquet")
+    for batch in pa_parquet.ParquetFile(file).iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_arrow_chunks(file: IO[bytes]) -> Iterator[pd.DataFrame]:
+    pa_ipc = import_pyarrow_module("pyarrow.ipc")
+    reader = pa_ipc.open_file(file)
+    for index in range(reader.num_record_batches):
+        yield reader.get_batch(index).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+# Reads the rows of a 2-dimensional .npy array by chunks, straight from the bytes of the file
+class NpyReader:
+    def __init__(self, file: IO[bytes]) -> None:
+        self.file = file
+        major_version, _ = np.lib.format.read_magic(file)
+        read_array_header = (
+            np.lib.format.read_array_header_1_0
+            if major_version == 1
+            else np.lib.format.read_array_header_2_0
+        )
+        shape, fortran_order, self.dtype = read_array_header(file)
+        if fortran_order or len(shape) != 2 or self.dtype.kind != "f":  # noqa: PLR2004
+            msg = "The vectors have to be a 2-dimensional C-ordered array of floats."
+            raise ValueError(msg)
+        self.rows_count, self.dimension = shape
+        self.row_size = self.dimension * self.dtype.itemsize
+
+    def read(self, rows_count: int) -> np.ndarray:
+        data = self.file.read(rows_count * self.row_size)
+        if len(data) != rows_count * self.row_size:
+            msg = "The vectors file is truncated."
+            raise ValueError(msg)
+        return np.frombuffer(data, dtype=self.dtype).reshape(rows_count, self.dimension)
@@ -1,14 +1,32 @@
-import io
 import logging
+import uuid
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, UploadFile, status
-from fastapi.responses import JSONResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Request,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
+from backend.config.config import config
 from backend.core.api.auth.core import AdminUserSession
 from backend.core.database.manage import get_db
-from backend.upload import crud, schemas
-from backend.upload.flows import upload_data
+from backend.upload import crud, models, schemas
+from backend.upload.archive import check_upload_size, save_upload
+from backend.upload.exceptions import (
+    UploadChecksumError,
+    UploadFormError,
+    UploadSessionIncompleteError,
+    UploadTooLargeError,
+)
+from backend.upload.forms import iter_form_file
+from backend.upload.jobs import submit_upload_jobs
+from backend.upload.sessions import assemble_chunks, get_received_chunks, save_chunk
 
 router = APIRouter(tags=["Upload"])
 
@@ -17,33 +35,210 @@ logger = logging.getLogger()
 
 @router.post(
     "/upload",
-    summary="Upload new data, including images and triplets. The data has to be a zipped folder containing a csv file named triplets, a csv file named validation_triplets and a folder named images containing the images. Needs to be authorized as an admin user. If you do not want to include triplets, you can provide a csv file with no line but still the header.",
-    status_code=status.HTTP_201_CREATED,
+    summary="Upload new data, including images and triplets. The data has to be a zipped folder containing a csv file named triplets, a csv file named validation_triplets and a folder named images containing the images, sent as the raw body of the request or in the file field of a form. Needs to be authorized as an admin user. If you do not want to include triplets, you can provide a csv file with no line but still the header. The data is processed in the background by an upload job, whose id is returned.",
+    status_code=status.HTTP_202_ACCEPTED,
 )
 async def upload_data_in_the_background(
     user: AdminUserSession,
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db),
-) -> JSONResponse:
-    # Read the file into memory
-    file_in_memory = io.BytesIO(await file.read())
-
-    # Add the task to the background with the file in memory
-    background_tasks.add_task(upload_data, file_in_memory, db)
-    logger.info("Data upload starts in the background.")
-    return JSONResponse(
-        content={"message": "Data upload starts in the background."},
-        status_code=status.HTTP_202_ACCEPTED,
-    )
+) -> schemas.UploadJob:
+    # The file is stored on disk rather than in memory, so that it can be processed by another process and survive a restart of the app
+    config.uploads_path.mkdir(parents=True, exist_ok=True)
+    file_path = config.uploads_path / f"{uuid.uuid4()}.zip"
+    is_form = request.headers.get("content-type", "").startswith("multipart/form-data")
+    try:
+        # The uploads announced as too large are rejected before their body is received
+        if "content-length" in request.headers:
+            check_upload_size(int(request.headers["content-length"]))
+        # The file of a form is streamed to its destination as its parts are parsed, like a raw body
+        await save_upload(
+            iter_form_file(request.headers, request.stream())
+            if is_form
+            else request.stream(),
+            file_path,
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e),
+        ) from e
+    except UploadFormError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        ) from e
+
+    job = crud.create_upload_job(db, file_path, user.uid)
+    submit_upload_jobs()
+    logger.info("Data upload job %s is queued.", job.id)
+    return job
 
 
 @router.get(
     "/upload",
-    summary="Get the status of the last triplets data upload.",
+    summary="Get the status and the progress of the last upload job.",
+)
+async def get_last_upload_job(
+    user: AdminUserSession,
+    db: Session = Depends(get_db),
+) -> schemas.UploadJob:
+    job = crud.get_last_upload_job(db)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No upload job found.",
+        )
+    return job
+
+
+@router.get(
+    "/upload/{job_id}",
+    summary="Get the status of an upload job, along with the progress of each of its phases: the number of rows done, the throughput in rows per second and the estimated completion time.",
 )
-async def get_upload_status(
+async def get_upload_job(
     user: AdminUserSession,
+    job_id: int,
     db: Session = Depends(get_db),
-) -> schemas.AllTripletsUploadStatus:
-    return crud.get_upload_status(db)
+) -> schemas.UploadJob:
+    job = crud.get_upload_job(db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload job not found.",
+        )
+    return job
+
+
+def _get_upload_session(
+    db: Session,
+    session_id: uuid.UUID,
+    lock: bool = False,
+) -> models.UploadSession:
+    upload_session = crud.get_upload_session(db, session_id, lock)
+    if upload_session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found.",
+        )
+    return upload_session
+
+
+@router.post(
+    "/upload/sessions",
+    summary="Create an upload session, to upload a datapack by chunks. The chunks can be sent in any order and in parallel, and sent again when their upload failed. Needs to be authorized as an admin user.",
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_upload_session(
+    user: AdminUserSession,
+    upload_session: schemas.UploadSessionCreate,
+    db: Session = Depends(get_db),
+) -> schemas.UploadSession:
+    return crud.create_upload_session(
+        db,
+        upload_session.chunks_count,
+        upload_session.sha256,
+        user.uid,
+    )
+
+
+@router.get(
+    "/upload/sessions/{session_id}",
+    summary="Get an upload session, along with the indexes of the chunks received so far.",
+)
+async def get_upload_session(
+    user: AdminUserSession,
+    session_id: uuid.UUID,
+    db: Session = Depends(get_db),
+) -> schemas.UploadSession:
+    upload_session = _get_upload_session(db, session_id)
+    return schemas.UploadSession.model_validate(upload_session).model_copy(
+        update={"received_chunks": get_received_chunks(session_id)},
+    )
+
+
+@router.put(
+    "/upload/sessions/{session_id}/chunks/{index}",
+    summary="Upload the chunk of the given index, starting from 0, as the raw body of the request. The SHA-256 checksum of the chunk has to be given in hexadecimal in the X-Chunk-SHA256 header.",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def put_upload_chunk(
+    user: AdminUserSession,
+    session_id: uuid.UUID,
+    request: Request,
+    x_chunk_sha256: str = Header(),
+    index: int = Path(ge=0),
+    db: Session = Depends(get_db),
+) -> None:
+    upload_session = _get_upload_session(db, session_id)
+    if upload_session.job_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The upload session is already finalized.",
+        )
+    if index >= upload_session.chunks_count:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"The upload session has {upload_session.chunks_count} chunks.",
+        )
+    # The session is not locked while the chunk is received
+    db.commit()
+    try:
+        await save_chunk(session_id, index, request.stream(), x_chunk_sha256)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e),
+        ) from e
+    except UploadChecksumError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        ) from e
+
+
+@router.post(
+    "/upload/sessions/{session_id}/finalize",
+    summary="Assemble the chunks of an upload session and process the datapack in the background, as for a direct upload. Finalizing a session again returns the same upload job.",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def finalize_upload_session(
+    user: AdminUserSession,
+    session_id: uuid.UUID,
+    db: Session = Depends(get_db),
+) -> schemas.UploadJob:
+    upload_session = _get_upload_session(db, session_id, lock=True)
+    if upload_session.job_id is not None:
+        db.commit()
+        return crud.get_upload_job(db, upload_session.job_id)
+
+    config.uploads_path.mkdir(parents=True, exist_ok=True)
+    file_path = config.uploads_path / f"{uuid.uuid4()}.zip"
+    try:
+        await run_in_threadpool(
+            assemble_chunks,
+            session_id,
+            upload_session.chunks_count,
+            file_path,
+            upload_session.sha256,
+        )
+    except UploadSessionIncompleteError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+        ) from e
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e),
+        ) from e
+    except UploadChecksumError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        ) from e
+
+    job = crud.finalize_upload_session(db, upload_session, file_path, user.uid)
+    submit_upload_jobs()
+    logger.info("Upload session %s is finalized into the job %s.", session_id, job.id)
+    return job
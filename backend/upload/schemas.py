@@ -1,7 +1,63 @@
-from pydantic import BaseModel
+from __future__ import annotations
 
+# Be careful not to move into a type checking block because in this case pydantic will not be able to find the datetime module !
+import datetime  # noqa: TCH003
+import uuid  # noqa: TCH003
 
-class AllTripletsUploadStatus(BaseModel):
+from pydantic import BaseModel, Field
+
+from backend.upload.enums import UploadJobStatus, UploadPhase
+
+
+class UploadJobPhase(BaseModel):
+    phase: UploadPhase
+    total_count: int | None = None
+    done_count: int
+    started_at: datetime.datetime
+    finished_at: datetime.datetime | None = None
+    rows_per_second: float | None = None
+    estimated_completion_at: datetime.datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+# The rows are counted from 0 in each table of the datapack, without the header
+class DatapackProblem(BaseModel):
+    file: str
+    row: int | None = None
+    column: str | None = None
+    value: str | None = None
+    message: str
+
+
+class UploadJob(BaseModel):
     id: int
-    to_upload_count: int = 0
-    uploaded_count: int
+    status: UploadJobStatus
+    attempts: int
+    error: str | None = None
+    problems: list[DatapackProblem] | None = None
+    created_at: datetime.datetime
+    started_at: datetime.datetime | None = None
+    finished_at: datetime.datetime | None = None
+    phases: list[UploadJobPhase] = []
+
+    class Config:
+        from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    chunks_count: int = Field(ge=1)
+    sha256: str | None = None
+
+
+class UploadSession(BaseModel):
+    id: uuid.UUID
+    chunks_count: int
+    sha256: str | None = None
+    created_at: datetime.datetime
+    job_id: int | None = None
+    received_chunks: list[int] = []
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import shutil
+import uuid
+from typing import TYPE_CHECKING
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.config.config import config
+from backend.upload.exceptions import (
+    UploadChecksumError,
+    UploadSessionIncompleteError,
+    UploadTooLargeError,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+    from pathlib import Path
+
+logger = logging.getLogger()
+
+# The chunks of an upload session are stored as numbered files in the folder of the session, a chunk only gets its final name once its checksum is verified
+CHUNK_SUFFIX = ".part"
+
+
+def get_session_path(session_id: uuid.UUID) -> Path:
+    return config.upload_sessions_path / str(session_id)
+
+
+def get_chunk_path(session_id: uuid.UUID, index: int) -> Path:
+    return get_session_path(session_id) / f"{index:08d}{CHUNK_SUFFIX}"
+
+
+def get_received_chunks(session_id: uuid.UUID) -> list[int]:
+    session_path = get_session_path(session_id)
+    if not session_path.exists():
+        return []
+    return sorted(
+        int(path.stem) for path in session_path.glob(f"*{CHUNK_SUFFIX}")
+    )
+
+
+# The chunk is written as it is received, so that the memory used does not depend on its size. Sending a chunk again replaces it, so that the chunks can be retried
+async def save_chunk(
+    session_id: uuid.UUID,
+    index: int,
+    stream: AsyncIterator[bytes],
+    sha256: str,
+    max_size: int = config.max_upload_chunk_size,
+) -> int:
+    chunk_path = get_chunk_path(session_id, index)
+    chunk_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = chunk_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with tmp_path.open("wb") as target:
+            async for data in stream:
+                size += len(data)
+                if size > max_size:
+                    msg = f"The chunk exceeds the maximum size of {max_size} bytes."
+                    raise UploadTooLargeError(msg)
+                digest.update(data)
+                await run_in_threadpool(target.write, data)
+        if digest.hexdigest() != sha256.lower():
+            msg = f"The checksum of the chunk {index} does not match its content."
+            raise UploadChecksumError(msg)
+        tmp_path.replace(chunk_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return size
+
+
+# The chunks are concatenated in their order into the datapack, and removed along with the folder of the session
+def assemble_chunks(
+    session_id: uuid.UUID,
+    chunks_count: int,
+    destination: Path,
+    sha256: str | None = None,
+    max_size: int = config.max_upload_size,
+) -> int:
+    missing_chunks = sorted(
+        set(range(chunks_count)) - set(get_received_chunks(session_id)),
+    )
+    if missing_chunks:
+        msg = f"Missing chunks: {', '.join(map(str, missing_chunks[:20]))}"
+        raise UploadSessionIncompleteError(msg)
+    chunks_paths = [get_chunk_path(session_id, index) for index in range(chunks_count)]
+    size = sum(path.stat().st_size for path in chunks_paths)
+    if size > max_size:
+        msg = f"The upload exceeds the maximum size of {max_size} bytes."
+        raise UploadTooLargeError(msg)
+    digest = hashlib.sha256()
+    with destination.open("wb") as target:
+        for chunk_path in chunks_paths:
+            with chunk_path.open("rb") as source:
+                while data := source.read(config.upload_chunk_size):
+                    digest.update(data)
+                    target.write(data)
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        destination.unlink(missing_ok=True)
+        msg = "The checksum of the upload does not match its content."
+        raise UploadChecksumError(msg)
+    remove_session_chunks(session_id)
+    return size
+
+
+def remove_session_chunks(session_id: uuid.UUID) -> None:
+    shutil.rmtree(get_session_path(session_id), ignore_errors=True)
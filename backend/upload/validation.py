@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from backend.config.config import config
+from backend.images_utils.crud import get_existing_images
+from backend.images_utils.utils import CANONICAL_SUFFIX
+from backend.items.models import Item
+from backend.items.utils import ITEM_COLUMNS
+from backend.triplets.utils import LABELS_NAMES
+from backend.upload.archive import DATAPACK_VECTORS_NAME
+from backend.upload.exceptions import DatapackValidationError
+from backend.upload.schemas import DatapackProblem
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from sqlalchemy.orm import Session
+
+    from backend.upload.readers import NpyReader
+
+logger = logging.getLogger()
+
+# The columns of the triplets referencing items
+TRIPLET_ITEMS_COLUMNS = ["reference_id", "left_id", "right_id"]
+HASH_MULTIPLIER = np.uint64(1_000_003)
+REFERENCES_COLUMNS = ["hash", "id", "file", "row", "column"]
+REFERENCES_MERGE_COUNT = 16
+# The existing items and images are looked up in the database by batches of ids
+ITEMS_LOOKUP_BATCH_SIZE = 10_000
+
+
+# The ids are compared through 64-bit hashes, which makes the set operations on millions of them fast and compact
+def hash_ids(ids: pd.Series) -> np.ndarray:
+    if not pd.api.types.is_string_dtype(ids):
+        ids = ids.astype(str)
+    return pd.util.hash_pandas_object(ids, index=False, categorize=False).to_numpy()
+
+
+# The rows are identified by a combination of the hashes of their columns
+def combine_hashes(hashes: Iterable[np.ndarray]) -> np.ndarray:
+    combined = None
+    for column_hashes in hashes:
+        combined = (
+            column_hashes.copy()
+            if combined is None
+            else combined * HASH_MULTIPLIER ^ column_hashes
+        )
+    return combined
+
+
+def is_in_sorted(values: np.ndarray, sorted_values: np.ndarray) -> np.ndarray:
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    indexes = np.searchsorted(sorted_values, values)
+    indexes[indexes == len(sorted_values)] = 0
+    return sorted_values[indexes] == values
+
+
+# The image files are named after their item, followed by the canonical suffix for the canonical image
+def split_images_names(names: Iterable[str]) -> tuple[pd.Index, pd.Index]:
+    stems = pd.Series(list(names), dtype=object).str.split(".", n=1).str[0]
+    is_canonical = stems.str.endswith(CANONICAL_SUFFIX)
+    return (
+        pd.Index(stems[~is_canonical].unique()),
+        pd.Index(stems[is_canonical].str.removesuffix(CANONICAL_SUFFIX).unique()),
+    )
+
+
+def _concat_references(references: list[pd.DataFrame]) -> pd.DataFrame:
+    if not references:
+        return pd.DataFrame(columns=REFERENCES_COLUMNS)
+    return pd.concat(references, ignore_index=True).drop_duplicates("hash")
+
+
+# Only the first occurrence of each id is kept. The frames are merged regularly, so that the memory used depends on the number of distinct ids rather than on the number of triplets
+def _append_references(references: list[pd.DataFrame], new: pd.DataFrame) -> None:
+    references.append(new.drop_duplicates("hash"))
+    if len(references) >= REFERENCES_MERGE_COUNT:
+        references[:] = [_concat_references(references)]
+
+
+# Collects the problems of a datapack while its tables are read chunk by chunk. The checks are done on whole columns, the ids referenced by the triplets being compared with the uploaded items and images through sorted arrays of hashes
+class DatapackValidator:
+    def __init__(
+        self,
+        images_names: list[str],
+        max_problems: int = config.max_reported_problems,
+    ) -> None:
+        self.max_problems = max_problems
+        self.problems: list[DatapackProblem] = []
+        self.problems_count = 0
+        self.invalid_files: set[str] = set()
+        self.images_ids, self.canonical_images_ids = split_images_names(images_names)
+        self.images_hashes = np.intersect1d(
+            hash_ids(self.images_ids.to_series()),
+            hash_ids(self.canonical_images_ids.to_series()),
+        )
+        self.items_hashes: list[np.ndarray] = []
+        self.sorted_items_hashes: np.ndarray | None = None
+        # The first occurrence of each referenced id which is not an uploaded item, or has no uploaded images
+        self.unknown_items: list[pd.DataFrame] = []
+        self.unknown_images: list[pd.DataFrame] = []
+        self.keys_hashes: dict[str, list[np.ndarray]] = {}
+
+    def add(
+        self,
+        file: str,
+        message: str,
+        column: str | None = None,
+        rows: Iterable[int] | None = None,
+        values: Iterable | None = None,
+    ) -> None:
+        rows = [None] if rows is None else list(rows)
+        values = [None] * len(rows) if values is None else list(values)
+        self.problems_count += len(rows)
+        room = self.max_problems - len(self.problems)
+        self.problems.extend(
+            DatapackProblem(
+                file=file,
+                row=None if row is None else int(row),
+                column=column,
+                value=None if value is None or pd.isna(value) else str(value),
+                message=message,
+            )
+            for row, value in zip(rows[:room], values[:room])
+        )
+
+    # Returns which rows have all the required columns, or None when the file lacks some of them
+    def _check_columns(
+        self,
+        file: str,
+        chunk: pd.DataFrame,
+        offset: int,
+        required_columns: list[str],
+    ) -> np.ndarray | None:
+        if file in self.invalid_files:
+            return None
+        missing_columns = [
+            column_name
+            for column_name in required_columns
+            if column_name not in chunk.columns
+        ]
+        if missing_columns:
+            self.invalid_files.add(file)
+            self.add(file, f"Missing columns: {', '.join(missing_columns)}")
+            return None
+        nulls = chunk[required_columns].isna().to_numpy()
+        for index in np.flatnonzero(nulls.any(axis=0)):
+            self.add(
+                file,
+                "Missing value",
+                required_columns[index],
+                offset + np.flatnonzero(nulls[:, index]),
+            )
+        return ~nulls.any(axis=1)
+
+    # A file which cannot be parsed is reported, and not read any further
+    def add_unreadable_file(self, file: str, error: Exception) -> None:
+        self.invalid_files.add(file)
+        self.add(file, f"The file cannot be read: {error}")
+
+    def check_items(self, file: str, chunk: pd.DataFrame, offset: int) -> None:
+        complete = self._check_columns(file, chunk, offset, ITEM_COLUMNS)
+        if complete is None:
+            return
+        # The values which cannot be parsed are NaN rather than missing in the Arrow columns, they are both NaN once converted
+        lengths = pd.to_numeric(chunk["length"], errors="coerce").astype("float64")
+        invalid_rows = np.flatnonzero(
+            (lengths.isna() & chunk["length"].notna()).to_numpy(),
+        )
+        if len(invalid_rows):
+            self.add(
+                file,
+                "Invalid length",
+                "length",
+                offset + invalid_rows,
+                chunk["length"].iloc[invalid_rows],
+            )
+        self.items_hashes.append(hash_ids(chunk["id"][complete]))
+
+    def check_triplets(
+        self,
+        file: str,
+        chunk: pd.DataFrame,
+        offset: int,
+        required_columns: list[str],
+    ) -> None:
+        complete = self._check_columns(file, chunk, offset, required_columns)
+        if complete is None:
+            return
+        if "label" in chunk.columns:
+            invalid_rows = np.flatnonzero(
+                (chunk["label"].notna() & ~chunk["label"].isin(LABELS_NAMES)).to_numpy(),
+            )
+            if len(invalid_rows):
+                self.add(
+                    file,
+                    "Invalid label",
+                    "label",
+                    offset + invalid_rows,
+                    chunk["label"].iloc[invalid_rows],
+                )
+        # The rows with missing values are already reported
+        if not complete.all():
+            chunk = chunk[complete]
+        rows = offset + np.flatnonzero(complete)
+        hashes = {
+            column_name: hash_ids(chunk[column_name]) for column_name in required_columns
+        }
+        self.keys_hashes.setdefault(file, []).append(
+            np.stack([rows.astype(np.uint64), combine_hashes(hashes.values())]),
+        )
+        # The items are read before the triplets
+        if self.sorted_items_hashes is None:
+            self.sorted_items_hashes = np.unique(
+                np.concatenate([np.empty(0, dtype=np.uint64), *self.items_hashes]),
+            )
+            self.items_hashes = []
+        for column_name in TRIPLET_ITEMS_COLUMNS:
+            column_hashes = hashes[column_name]
+            for references, sorted_hashes in [
+                (self.unknown_items, self.sorted_items_hashes),
+                (self.unknown_images, self.images_hashes),
+            ]:
+                unknown = np.flatnonzero(~is_in_sorted(column_hashes, sorted_hashes))
+                if len(unknown):
+                    _append_references(
+                        references,
+                        pd.DataFrame(
+                            {
+                                "hash": column_hashes[unknown],
+                                "id": chunk[column_name].iloc[unknown].to_numpy(dtype=object),
+                                "file": file,
+                                "row": rows[unknown],
+                                "column": column_name,
+                            },
+                        ),
+                    )
+
+    def check_vectors(self, vectors: NpyReader, items_count: int) -> None:
+        if not config.items_vectors:
+            self.add(
+                DATAPACK_VECTORS_NAME,
+                "The datapack contains vectors, but the vectors of the items are not enabled.",
+            )
+        elif vectors.dimension != config.vector_dimension:
+            self.add(
+                DATAPACK_VECTORS_NAME,
+                f"The vectors have {vectors.dimension} dimensions instead of {config.vector_dimension}.",
+            )
+        elif vectors.rows_count != items_count:
+            self.add(
+                DATAPACK_VECTORS_NAME,
+                f"There are {vectors.rows_count} vectors for {items_count} items.",
+            )
+
+    def _check_duplicates(self) -> None:
+        for file, keys_hashes in self.keys_hashes.items():
+            rows, hashes = np.concatenate(keys_hashes, axis=1)
+            duplicated_rows = rows[pd.Series(hashes).duplicated().to_numpy()]
+            if len(duplicated_rows):
+                self.add(file, "Duplicate triplet", rows=duplicated_rows)
+
+    def _add_references(self, references: pd.DataFrame, message: str) -> None:
+        for (file, column_name), group in references.groupby(
+            ["file", "column"],
+            sort=False,
+        ):
+            self.add(file, message, column_name, group["row"], group["id"])
+
+    # Only the ids which are not uploaded are looked up, among the items already in the database and the images of the manifest
+    def _check_references(self, db: Session) -> None:
+        unknown_items = _concat_references(self.unknown_items)
+        existing_ids = set()
+        for start in range(0, len(unknown_items), ITEMS_LOOKUP_BATCH_SIZE):
+            batch = unknown_items["id"].iloc[start : start + ITEMS_LOOKUP_BATCH_SIZE]
+            existing_ids.update(
+                db.scalars(select(Item.id).where(Item.id.in_(batch.tolist()))),
+            )
+        self._add_references(
+            unknown_items[~unknown_items["id"].isin(existing_ids)],
+            "Unknown item",
+        )
+
+        unknown_images = _concat_references(self.unknown_images)
+        stored_images = set()
+        for start in range(0, len(unknown_images), ITEMS_LOOKUP_BATCH_SIZE):
+            batch = unknown_images["id"].iloc[start : start + ITEMS_LOOKUP_BATCH_SIZE]
+            stored_images.update(get_existing_images(db, batch.tolist()))
+        for canonical, message in [
+            (False, "Missing image"),
+            (True, "Missing canonical image"),
+        ]:
+            stored_ids = {
+                item_id
+                for item_id, is_canonical in stored_images
+                if is_canonical == canonical
+            }
+            self._add_references(
+                unknown_images[~unknown_images["id"].isin(stored_ids)],
+                message,
+            )
+
+    def _check_images(self) -> None:
+        missing_canonicals = self.images_ids.difference(self.canonical_images_ids)
+        self.add(
+            "images",
+            "Missing canonical image",
+            rows=[None] * len(missing_canonicals),
+            values=missing_canonicals,
+        )
+        missing_images = self.canonical_images_ids.difference(self.images_ids)
+        self.add(
+            "images",
+            "Canonical image without image",
+            rows=[None] * len(missing_images),
+            values=missing_images,
+        )
+
+    # Raises the report of the problems found, once all the tables are read
+    def finish(self, db: Session) -> None:
+        self._check_images()
+        self._check_duplicates()
+        self._check_references(db)
+        if self.problems_count:
+            raise DatapackValidationError(self.problems, self.problems_count)
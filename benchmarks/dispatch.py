@@ -0,0 +1,153 @@
+# Measures the time taken to dispatch a triplet when millions of labeled triplets are ahead of the unlabeled ones, run with `make bench-dispatch`
+# The benchmark runs against the database of the environment variables, in its own schema which is dropped at the end
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+# Be careful to modify the environment before the first instance of the config is created
+os.environ["DB_SCHEMA"] = "labelizer_benchmark"
+
+from sqlalchemy import text  # noqa: E402
+
+from backend.config.config import config  # noqa: E402
+from backend.core.database.core import SessionLocal, engine  # noqa: E402
+from backend.core.database.manage import (  # noqa: E402
+    create_all_tables,
+    drop_all_tables,
+)
+from backend.triplets import crud, models  # noqa: E402
+
+UNLABELED_COUNT = 10_000
+CLAIMS_COUNT = 200
+
+
+def setup_schema(with_partial_indexes: bool) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {config.db_schema}"))
+    drop_all_tables(engine)
+    create_all_tables(engine)
+    if with_partial_indexes:
+        return
+    # Layout of the indexes before the partial indexes were introduced
+    with engine.begin() as connection:
+        for index_name in ("ix_triplet_unlabeled_id", "ix_triplet_unlabeled_user_id_id"):
+            connection.execute(text(f"DROP INDEX {config.db_schema}.{index_name}"))
+        for column_name in ("label", "user_id", "retrieved_at"):
+            connection.execute(
+                text(f"CREATE INDEX ON {config.db_schema}.triplet ({column_name})"),
+            )
+
+
+def fill_triplets(labeled_count: int) -> None:
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"INSERT INTO {config.db_schema}.item (id, length, dataset) VALUES ('item', 1, 'benchmark')",
+            ),
+        )
+        # The labeled triplets are inserted first so that they have the lowest ids, as in production where the triplets are dispatched in the order of their ids. Each triplet has its own encoder, the natural key of the triplets being unique
+        connection.execute(
+            text(
+                f"INSERT INTO {config.db_schema}.triplet (reference_id, left_id, right_id, encoder_id, label, user_id) "
+                "SELECT 'item', 'item', 'item', 'labeled-encoder-' || g, 'LEFT', 'benchmark' FROM generate_series(1, :count) AS g",
+            ),
+            {"count": labeled_count},
+        )
+        connection.execute(
+            text(
+                f"INSERT INTO {config.db_schema}.triplet (reference_id, left_id, right_id, encoder_id) "
+                "SELECT 'item', 'item', 'item', 'unlabeled-encoder-' || g FROM generate_series(1, :count) AS g",
+            ),
+            {"count": UNLABELED_COUNT},
+        )
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"VACUUM ANALYZE {config.db_schema}.triplet"))
+
+
+def explain_claim() -> tuple[str, int]:
+    now_time = datetime.datetime.now(datetime.timezone.utc)
+    statement = crud._claim_unlabeled_triplets_statement(  # noqa: SLF001
+        models.Triplet,
+        [],
+        1,
+        "benchmark-explain",
+        now_time,
+        now_time - datetime.timedelta(seconds=config.lock_timeout_in_seconds),
+        config.lock_timeout_in_seconds,
+    )
+    compiled = statement.compile(engine)
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}",
+            compiled.params,
+        ).scalar()[0]
+        connection.rollback()
+    scans = []
+    buffers = 0
+
+    def walk(node: dict) -> None:
+        nonlocal buffers
+        if node.get("Relation Name") == "triplet" and "Scan" in node["Node Type"]:
+            scans.append(f"{node['Node Type']} ({node.get('Index Name', '-')})")
+            buffers += node["Shared Hit Blocks"] + node["Shared Read Blocks"]
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    return ", ".join(dict.fromkeys(scans)), buffers
+
+
+def time_claims() -> float:
+    durations = []
+    db = SessionLocal()
+    try:
+        for i in range(CLAIMS_COUNT):
+            start_time = time.perf_counter()
+            crud.get_first_unlabeled_triplet(db, f"benchmark-user-{i}")
+            durations.append(time.perf_counter() - start_time)
+    finally:
+        db.close()
+    return statistics.median(durations) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the dispatch of triplets behind labeled triplets.",
+    )
+    parser.add_argument(
+        "--labeled",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000, 5_000_000],
+        help="Numbers of labeled triplets ahead of the unlabeled ones.",
+    )
+    parser.add_argument(
+        "--without-partial-indexes",
+        action="store_true",
+        help="Use the single-column indexes instead of the partial indexes, for comparison.",
+    )
+    args = parser.parse_args()
+
+    print(f"{'labeled rows':>14} | {'median claim (ms)':>17} | {'buffers':>8} | scan")
+    try:
+        for labeled_count in args.labeled:
+            setup_schema(not args.without_partial_indexes)
+            fill_triplets(labeled_count)
+            scan, buffers = explain_claim()
+            median_duration = time_claims()
+            print(
+                f"{labeled_count:>14,} | {median_duration:>17.2f} | {buffers:>8} | {scan}",
+            )
+    finally:
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"DROP SCHEMA IF EXISTS {config.db_schema} CASCADE"),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Measures the CPU time a worker of the app spends per image served, when it sends the files itself and when the reverse proxy sends them, run with `make bench-images-offload`
+# The benchmark runs against the database of the environment variables, in its own schema which is dropped at the end, the images being written to a temporary workspace. No proxy is run, only the work of the worker is measured
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Be careful to modify the environment before the first instance of the config is created
+os.environ["DB_SCHEMA"] = "labelizer_benchmark"
+os.environ["WORKSPACE_DIR"] = tempfile.mkdtemp(prefix="labelizer-benchmark-")
+# The memory cache would spare the worker the reads of the files it sends
+os.environ["IMAGES_MEMORY_CACHE_SIZE"] = "0"
+
+import httpx  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+# The models referenced by the triplets have to be imported for their tables to be created
+import backend.items.models  # noqa: E402, F401
+from backend.config.config import config  # noqa: E402
+from backend.core.database.core import SessionLocal, engine  # noqa: E402
+from backend.core.database.manage import (  # noqa: E402
+    create_all_tables,
+    drop_all_tables,
+)
+from backend.images_utils.crud import upsert_images  # noqa: E402
+from backend.images_utils.enums import ImagesOffload  # noqa: E402
+from backend.images_utils.storage import FilesStorage  # noqa: E402
+from backend.images_utils.utils import get_image_name  # noqa: E402
+
+PORT = 42043
+IMAGES_URL = f"http://127.0.0.1:{PORT}/api/labelizer/v1/images"
+WARMUP_COUNT = 200
+
+
+def setup_images(images_count: int, image_size: int) -> list[str]:
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {config.db_schema}"))
+    drop_all_tables(engine)
+    create_all_tables(engine)
+    storage = FilesStorage()
+    storage.prepare()
+    item_ids = [f"benchmark-{index}" for index in range(images_count)]
+    manifest = []
+    for item_id in item_ids:
+        content = os.urandom(image_size)
+        stored = storage.write_image(get_image_name(item_id), [content])
+        manifest.append(
+            {
+                "item_id": item_id,
+                "canonical": False,
+                "size": stored.size,
+                "mtime": stored.mtime,
+                "sha256": hashlib.sha256(content).hexdigest(),
+            },
+        )
+    db = SessionLocal()
+    try:
+        upsert_images(db, manifest)
+        db.commit()
+    finally:
+        db.close()
+    return item_ids
+
+
+# The user and system CPU time of a process, in seconds
+def get_cpu_time(pid: int) -> float:
+    fields = Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+# The worker answers once it has started
+def is_worker_started() -> bool:
+    try:
+        httpx.get(f"{IMAGES_URL}/cache/stats")
+    except httpx.TransportError:
+        return False
+    return True
+
+
+def start_worker(offload: ImagesOffload) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "backend.core.api.fast_api_app:app",
+            "--port",
+            str(PORT),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env={**os.environ, "IMAGES_OFFLOAD": offload.value},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if is_worker_started():
+            return process
+        time.sleep(0.2)
+    process.terminate()
+    msg = "The worker did not start."
+    raise RuntimeError(msg)
+
+
+# Returns the CPU time of the worker per image in milliseconds, the images served per second and the bytes per response
+def measure(
+    offload: ImagesOffload,
+    item_ids: list[str],
+    requests_count: int,
+    concurrency: int,
+) -> tuple[float, float, float]:
+    process = start_worker(offload)
+    try:
+        with httpx.Client(base_url=IMAGES_URL) as client:
+
+            def fetch(item_id: str) -> int:
+                response = client.get(f"/{item_id}")
+                response.raise_for_status()
+                return len(response.content)
+
+            for item_id in item_ids[:WARMUP_COUNT]:
+                fetch(item_id)
+            start_cpu_time = get_cpu_time(process.pid)
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                sizes = list(
+                    executor.map(
+                        fetch,
+                        itertools.islice(itertools.cycle(item_ids), requests_count),
+                    ),
+                )
+            duration = time.perf_counter() - start_time
+            cpu_time = get_cpu_time(process.pid) - start_cpu_time
+    finally:
+        process.terminate()
+        process.wait()
+    return (
+        cpu_time / requests_count * 1000,
+        requests_count / duration,
+        sum(sizes) / requests_count,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the CPU time of a worker per image served, with and without offloading the files to the proxy.",
+    )
+    parser.add_argument("--images", type=int, default=1_000)
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs="+",
+        default=[64 * 1024, 512 * 1024, 2 * 1024**2],
+        help="Sizes of the images in bytes.",
+    )
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(
+        f"{'image size':>10} | {'offload':>16} | {'worker CPU/image (ms)':>21} | "
+        f"{'images/s':>8} | {'bytes/response':>14}",
+    )
+    try:
+        for image_size in args.size:
+            item_ids = setup_images(args.images, image_size)
+            for offload in (ImagesOffload.NONE, ImagesOffload.ACCEL_REDIRECT):
+                cpu_time, throughput, response_size = measure(
+                    offload,
+                    item_ids,
+                    args.requests,
+                    args.concurrency,
+                )
+                print(
+                    f"{image_size:>10,} | {offload.value:>16} | {cpu_time:>21.3f} | "
+                    f"{throughput:>8.0f} | {response_size:>14,.0f}",
+                )
+            shutil.rmtree(config.images_path)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"DROP SCHEMA IF EXISTS {config.db_schema} CASCADE"),
+            )
+        shutil.rmtree(os.environ["WORKSPACE_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
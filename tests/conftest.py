@@ -5,6 +5,9 @@ from starlette.config import environ
 environ["DB_NAME"] = "labelizer_test"
 environ["DB_SCHEMA"] = "labelizer_test"
 
+# The models have to be imported for their tables to be created
+import backend.images_utils.models  # noqa: E402
+import backend.upload.models  # noqa: E402, F401
 from backend.core.database.manage import create_all_tables, drop_all_tables
 from tests.database import TestSession, test_engine
 from tests.test_data import test_item, test_triplet, test_validation_triplet
@@ -0,0 +1,66 @@
+import datetime
+import email
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from backend.images_utils import bundles
+from backend.images_utils.crud import upsert_images
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.storage import FilesStorage
+from backend.images_utils.utils import get_image_name
+
+
+def test_get_images_bundle_response(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        bundles,
+        "images_storage",
+        FilesStorage(tmp_path, ImagesLayout.FLAT),
+    )
+    images = []
+    for item_id in ["test-bundle-id-1", "test-bundle-id-2"]:
+        for canonical in [False, True]:
+            content = f"{item_id} {canonical}".encode()
+            (tmp_path / get_image_name(item_id, canonical)).write_bytes(content)
+            images.append(
+                {
+                    "item_id": item_id,
+                    "canonical": canonical,
+                    "size": len(content),
+                    "mtime": datetime.datetime.now(datetime.timezone.utc),
+                    "sha256": "hash",
+                },
+            )
+    upsert_images(session, images)
+
+    def endpoint(request):
+        return bundles.get_images_bundle_response(
+            session,
+            ["test-bundle-id-1", "unknown-id", "test-bundle-id-2", "test-bundle-id-1"],
+            request.query_params.get("canonical") == "true",
+        )
+
+    client = TestClient(Starlette(routes=[Route("/images", endpoint)]))
+    for canonical, t_names in [
+        (False, ["test-bundle-id-1.stp.png", "test-bundle-id-2.stp.png"]),
+        (
+            True,
+            [
+                "test-bundle-id-1.stp.png",
+                "test-bundle-id-1_canonical.stp.png",
+                "test-bundle-id-2.stp.png",
+                "test-bundle-id-2_canonical.stp.png",
+            ],
+        ),
+    ]:
+        t_response = client.get("/images", params={"canonical": str(canonical).lower()})
+        t_message = email.message_from_bytes(
+            f"Content-Type: {t_response.headers['content-type']}\r\n\r\n".encode()
+            + t_response.content,
+        )
+        t_parts = t_message.get_payload()
+        assert [part.get_filename() for part in t_parts] == t_names
+        assert [part.get_payload(decode=True) for part in t_parts] == [
+            (tmp_path / name).read_bytes() for name in t_names
+        ]
@@ -0,0 +1,71 @@
+import datetime
+
+from backend.images_utils import crud
+
+
+def get_image_entry(item_id, canonical=False, sha256="hash"):
+    return {
+        "item_id": item_id,
+        "canonical": canonical,
+        "size": 1,
+        "mtime": datetime.datetime.now(datetime.timezone.utc),
+        "sha256": sha256,
+    }
+
+
+def test_upsert_images(session):
+    crud.upsert_images(
+        session,
+        [
+            get_image_entry("test-image-id"),
+            get_image_entry("test-image-id", canonical=True),
+        ],
+    )
+    crud.upsert_images(session, [get_image_entry("test-image-id", sha256="new-hash")])
+    assert crud.get_image(session, "test-image-id").sha256 == "new-hash"
+    assert crud.get_existing_images(session, ["test-image-id", "unknown-id"]) == {
+        ("test-image-id", False),
+        ("test-image-id", True),
+    }
+
+
+def test_delete_unreferenced_images(session, item, triplet):
+    crud.upsert_images(
+        session,
+        [get_image_entry(triplet.reference_id), get_image_entry("test-lonely-id")],
+    )
+    t_images = crud.delete_unreferenced_images(session, 10)
+    assert ("test-lonely-id", False) in t_images
+    assert (triplet.reference_id, False) not in t_images
+    assert crud.get_image(session, triplet.reference_id) is not None
+
+
+def test_gc(session, tmp_path, monkeypatch):
+    from sqlalchemy import func, select
+
+    from backend.images_utils import commands
+    from backend.images_utils.enums import ImagesLayout
+    from backend.images_utils.storage import FilesStorage
+    from backend.images_utils.utils import get_image_name
+    from backend.upload.crud import UPLOAD_JOBS_LOCK_ID
+
+    storage = FilesStorage(tmp_path, ImagesLayout.FLAT)
+    storage.write_image(get_image_name("test-gc-id"), [b"image"])
+    crud.upsert_images(session, [get_image_entry("test-gc-id")])
+    session.commit()
+    locks = []
+    delete_image = storage.delete_image
+
+    # The lock of the claims of the upload jobs is held by the collection while it deletes the images
+    def check_lock(item_id, canonical):
+        locks.append(
+            session.scalar(select(func.pg_try_advisory_xact_lock(UPLOAD_JOBS_LOCK_ID))),
+        )
+        delete_image(item_id, canonical)
+
+    monkeypatch.setattr(storage, "delete_image", check_lock)
+    assert commands.gc(storage) >= 1
+    assert locks
+    assert not any(locks)
+    assert not storage.get_path("test-gc-id", canonical=False).exists()
+    assert crud.get_image(session, "test-gc-id") is None
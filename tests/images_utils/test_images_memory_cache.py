@@ -0,0 +1,57 @@
+import datetime
+import time
+
+from backend.images_utils.crud import notify_images_changed
+from backend.images_utils.listener import ImagesChangesListener
+from backend.images_utils.memory_cache import CachedImage, ImagesMemoryCache
+
+
+def get_cached_image(size):
+    return CachedImage(
+        {"etag": '"hash"'},
+        datetime.datetime.now(datetime.timezone.utc),
+        "image/png",
+        bytes(size),
+    )
+
+
+def test_images_memory_cache():
+    cache = ImagesMemoryCache(max_size=10, max_entry_size=6)
+    cache.put(("id-1", False, None), get_cached_image(4), cache.generation)
+    cache.put(("id-2", False, None), get_cached_image(4), cache.generation)
+    cache.put(("id-3", False, None), get_cached_image(7), cache.generation)
+    assert cache.get(("id-1", False, None)) is not None
+    # The least recently used image is evicted
+    cache.put(("id-3", False, None), get_cached_image(4), cache.generation)
+    assert cache.get(("id-2", False, None)) is None
+    t_stats = cache.get_stats()
+    assert (t_stats.hits, t_stats.misses, t_stats.evictions) == (1, 1, 1)
+    assert (t_stats.count, t_stats.size) == (2, 8)
+
+    # An image read before an invalidation is not cached
+    generation = cache.generation
+    cache.invalidate(["id-1"])
+    cache.put(("id-1", True, None), get_cached_image(1), generation)
+    assert cache.get(("id-1", False, None)) is None
+    assert cache.get(("id-1", True, None)) is None
+    assert cache.get(("id-3", False, None)) is not None
+
+
+def test_images_changes_listener(session):
+    cache = ImagesMemoryCache(max_size=10, max_entry_size=10)
+    listener = ImagesChangesListener(cache)
+    listener.start()
+    try:
+        # The cache is cleared once the listener listens
+        deadline = time.monotonic() + 10
+        while cache.generation == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        cache.put(("test-id", False, None), get_cached_image(1), cache.generation)
+        cache.put(("other-id", False, None), get_cached_image(1), cache.generation)
+        notify_images_changed(session, ["test-id"])
+        session.commit()
+        while len(cache.entries) == 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert list(cache.entries) == [("other-id", False, None)]
+    finally:
+        listener.stop()
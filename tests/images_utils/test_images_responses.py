@@ -0,0 +1,161 @@
+import datetime
+import functools
+import io
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from backend.config.config import config
+from backend.images_utils import responses, variants
+from backend.images_utils.enums import ImageFormat, ImagesLayout, ImagesOffload
+from backend.images_utils.models import Image
+from backend.images_utils.responses import get_image_response
+from backend.images_utils.storage import FilesStorage
+from backend.images_utils.variants import (
+    evict_variants,
+    get_variant,
+    get_variant_path,
+)
+
+
+def get_client(image):
+    async def endpoint(request):
+        variant = None
+        if "w" in request.query_params:
+            variant = get_variant(
+                int(request.query_params["w"]),
+                ImageFormat(request.query_params["format"]),
+            )
+        return await get_image_response(request.headers, image, variant)
+
+    return TestClient(Starlette(routes=[Route("/image", endpoint)]))
+
+
+def test_get_image_response(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        responses,
+        "images_storage",
+        FilesStorage(tmp_path, ImagesLayout.FLAT),
+    )
+    path = tmp_path / "test-id.stp.png"
+    path.write_bytes(bytes(range(100)))
+    image = Image(
+        item_id="test-id",
+        canonical=False,
+        size=100,
+        mtime=datetime.datetime(2024, 1, 1, 12, 0, 0, 500, datetime.timezone.utc),
+        sha256="hash",
+    )
+
+    client = get_client(image)
+    t_response = client.get("/image")
+    assert t_response.status_code == 200
+    assert t_response.headers["etag"] == '"hash"'
+    assert "immutable" in t_response.headers["cache-control"]
+    assert t_response.content == path.read_bytes()
+
+    for headers in [
+        {"if-none-match": 'W/"other", "hash"'},
+        {"if-modified-since": "Mon, 01 Jan 2024 12:00:00 GMT"},
+    ]:
+        t_response = client.get("/image", headers=headers)
+        assert t_response.status_code == 304
+        assert t_response.headers["etag"] == '"hash"'
+    assert client.get("/image", headers={"if-none-match": '"other"'}).status_code == 200
+
+    t_response = client.get("/image", headers={"range": "bytes=10-19"})
+    assert t_response.status_code == 206
+    assert t_response.headers["content-range"] == "bytes 10-19/100"
+    assert t_response.content == bytes(range(10, 20))
+    assert client.get("/image", headers={"range": "bytes=-5"}).content == bytes(
+        range(95, 100),
+    )
+    # The range of another version of the image is not served
+    t_response = client.get(
+        "/image",
+        headers={"range": "bytes=10-19", "if-range": '"other"'},
+    )
+    assert t_response.status_code == 200
+    assert client.get("/image", headers={"range": "bytes=200-"}).status_code == 416
+
+
+def test_get_image_offloaded_response(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        responses,
+        "images_storage",
+        FilesStorage(tmp_path, ImagesLayout.SHARDED),
+    )
+    monkeypatch.setattr(config, "images_offload_prefixes", {tmp_path: "/internal/"})
+    image = Image(
+        item_id="test-id",
+        canonical=True,
+        size=100,
+        mtime=datetime.datetime.now(datetime.timezone.utc),
+        sha256="hash",
+    )
+    client = get_client(image)
+    path = responses.images_storage.get_file_path(image)
+
+    # The proxy sends the file and answers the ranges, the app only naming it
+    monkeypatch.setattr(config, "images_offload", ImagesOffload.ACCEL_REDIRECT)
+    t_response = client.get("/image", headers={"range": "bytes=10-19"})
+    assert t_response.status_code == 200
+    assert t_response.headers["x-accel-redirect"] == (
+        f"/internal/{path.relative_to(tmp_path).as_posix()}"
+    )
+    assert t_response.headers["etag"] == '"hash"'
+    assert t_response.content == b""
+    assert client.get("/image", headers={"if-none-match": '"hash"'}).status_code == 304
+
+    monkeypatch.setattr(config, "images_offload", ImagesOffload.SENDFILE)
+    assert client.get("/image").headers["x-sendfile"] == str(path.absolute())
+
+
+def test_get_image_variant_response(tmp_path, monkeypatch):
+    pil_image = pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(
+        variants,
+        "images_storage",
+        FilesStorage(tmp_path, ImagesLayout.FLAT),
+    )
+    monkeypatch.setattr(
+        variants,
+        "get_variant_path",
+        functools.partial(get_variant_path, variants_path=tmp_path / "variants"),
+    )
+    content = io.BytesIO()
+    pil_image.new("RGB", (600, 300), "red").save(content, format="png")
+    (tmp_path / "test-id.stp.png").write_bytes(content.getvalue())
+    image = Image(
+        item_id="test-id",
+        canonical=False,
+        size=len(content.getvalue()),
+        mtime=datetime.datetime.now(datetime.timezone.utc),
+        sha256="hash",
+    )
+    client = get_client(image)
+
+    # The width is rounded up to one of the widths of the variants
+    t_response = client.get("/image", params={"w": 200, "format": "webp"})
+    assert t_response.status_code == 200
+    assert t_response.headers["content-type"] == "image/webp"
+    assert t_response.headers["etag"] == '"hash-256-webp"'
+    assert pil_image.open(io.BytesIO(t_response.content)).size == (256, 128)
+    assert [path.name for path in (tmp_path / "variants").rglob("*.webp")] == [
+        "hash_256.webp",
+    ]
+    t_response = client.get(
+        "/image",
+        params={"w": 200, "format": "webp"},
+        headers={"if-none-match": '"hash-256-webp"'},
+    )
+    assert t_response.status_code == 304
+
+    assert evict_variants(0, tmp_path / "variants") == 1
+    assert not list((tmp_path / "variants").rglob("*.webp"))
+    # An evicted variant is generated again
+    t_response = client.get("/image", params={"w": 200, "format": "webp"})
+    assert t_response.status_code == 200
+    assert pil_image.open(io.BytesIO(t_response.content)).size == (256, 128)
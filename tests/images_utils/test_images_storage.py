@@ -0,0 +1,86 @@
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from backend.images_utils import commands, crud, responses
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.responses import get_image_response
+from backend.images_utils.storage import FilesStorage, PacksStorage
+from backend.images_utils.utils import get_image_name
+
+
+def get_client(session, item_id):
+    async def endpoint(request):
+        return await get_image_response(
+            request.headers,
+            crud.get_image(session, item_id),
+        )
+
+    return TestClient(Starlette(routes=[Route("/image", endpoint)]))
+
+
+def test_packs_storage(session, tmp_path, monkeypatch):
+    files_storage = FilesStorage(tmp_path / "images", ImagesLayout.FLAT)
+    files_storage.prepare()
+    storage = PacksStorage(tmp_path / "packs", 250, files_storage)
+    storage.prepare()
+    monkeypatch.setattr(responses, "images_storage", storage)
+    images = []
+    for index in range(3):
+        content = bytes([index]) * 100
+        stored = storage.write_image(
+            get_image_name(f"test-pack-id-{index}"),
+            [content[:10], content[10:]],
+        )
+        images.append(
+            {
+                "item_id": f"test-pack-id-{index}",
+                "canonical": False,
+                "sha256": f"hash-{index}",
+                **stored._asdict(),
+            },
+        )
+    # The third image does not fit in the first pack
+    assert [(image["pack"], image["offset"]) for image in images] == [
+        (1, 0),
+        (1, 100),
+        (2, 0),
+    ]
+    assert storage.get_packs() == {1: 200, 2: 100}
+    # An image written before the packs were used is still read from its file
+    stored = files_storage.write_image(get_image_name("test-file-id"), [b"file"])
+    images.append(
+        {"item_id": "test-file-id", "canonical": False, "sha256": "hash-file"}
+        | stored._asdict(),
+    )
+    crud.upsert_images(session, images)
+
+    image = crud.get_image(session, "test-pack-id-1")
+    assert storage.read_image(image, 10, 5) == bytes([1]) * 5
+    client = get_client(session, "test-pack-id-1")
+    # The packed image is sent from its offset in its pack
+    t_response = client.get("/image")
+    assert t_response.headers["content-type"] == "image/png"
+    assert t_response.headers["content-length"] == "100"
+    assert t_response.content == bytes([1]) * 100
+    t_response = client.get("/image", headers={"range": "bytes=90-"})
+    assert t_response.status_code == 206
+    assert t_response.headers["content-range"] == "bytes 90-99/100"
+    assert t_response.content == bytes([1]) * 10
+    t_response = get_client(session, "test-file-id").get("/image")
+    assert t_response.status_code == 200
+    assert t_response.content == b"file"
+
+    # The image left in the first pack is copied to the last pack before the first pack is removed
+    session.delete(crud.get_image(session, "test-pack-id-0"))
+    session.commit()
+    assert commands.compact(session, storage) == 1
+    session.expire_all()
+    assert storage.get_packs() == {2: 200}
+    assert crud.get_packs_usage(session) == {2: 200}
+    image = crud.get_image(session, "test-pack-id-1")
+    assert (image.pack, image.offset) == (2, 100)
+    assert storage.read_image(image) == bytes([1]) * 100
+    assert get_client(session, "test-pack-id-1").get("/image").content == (
+        bytes([1]) * 100
+    )
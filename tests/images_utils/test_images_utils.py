@@ -0,0 +1,26 @@
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.utils import get_image_path, iter_images_files
+
+
+def test_get_image_path(tmp_path):
+    assert get_image_path("test-id.stp.png", tmp_path, ImagesLayout.FLAT) == (
+        tmp_path / "test-id.stp.png"
+    )
+    t_path = get_image_path("test-id.stp.png", tmp_path, ImagesLayout.SHARDED)
+    t_canonical_path = get_image_path(
+        "test-id_canonical.stp.png",
+        tmp_path,
+        ImagesLayout.SHARDED,
+    )
+    # The images of an item share their subfolders
+    assert t_path.parent == t_canonical_path.parent
+    assert len(t_path.relative_to(tmp_path).parts) == 3
+
+    t_path.parent.mkdir(parents=True)
+    t_path.touch()
+    (tmp_path / "flat-id.stp.png").touch()
+    (tmp_path / ".flat-id.stp.png.tmp").touch()
+    assert sorted(entry.name for entry in iter_images_files(tmp_path)) == [
+        "flat-id.stp.png",
+        "test-id.stp.png",
+    ]
@@ -4,3 +4,69 @@ from backend.items import crud
 def test_get_item(session, item):
     t_item = crud.get_item(session, item.id)
     assert t_item.id == item.id
+
+
+def test_upsert_items(session):
+    import pandas as pd
+
+    from backend.upload.enums import IngestMethod
+
+    items = pd.DataFrame(
+        {
+            "id": ["test-upsert-id-1", "test-upsert-id-2"],
+            "length": [1.0, 2.0],
+            "dataset": ["test-dataset", "test-dataset"],
+        },
+    )
+    # The items are new the first time, and unchanged the second time
+    for method in IngestMethod:
+        method_items = items.assign(id=items["id"] + f"-{method.value}")
+        t_report = crud.upsert_items(session, method_items, method)
+        assert (t_report.inserted, t_report.updated, t_report.skipped) == (2, 0, 0)
+        t_report = crud.upsert_items(session, method_items, method)
+        assert (t_report.inserted, t_report.updated, t_report.skipped) == (0, 0, 2)
+
+    crud.upsert_items(session, items)
+    t_report = crud.upsert_items(session, items.assign(length=[1.0, 3.0]))
+    assert (t_report.inserted, t_report.updated, t_report.skipped) == (0, 1, 1)
+    assert crud.get_item(session, "test-upsert-id-2").length == 3.0
+
+
+def test_update_items_vectors(session, item):
+    import numpy as np
+    import pandas as pd
+    import pytest
+
+    from backend.config.config import config
+
+    if not config.items_vectors:
+        pytest.skip("The vectors of the items are not enabled.")
+    vectors = np.arange(config.vector_dimension, dtype=np.float32).reshape(1, -1)
+    t_updated_count = crud.update_items_vectors(
+        session,
+        [(pd.Series([item.id, "test-missing-id"]), np.vstack([vectors, vectors]))],
+    )
+    assert t_updated_count == 1
+    session.expire_all()
+    assert crud.get_item(session, item.id).vector.tolist() == vectors[0].tolist()
+
+
+def test_create_items_vector_column():
+    import pytest
+    from sqlalchemy import inspect, text
+
+    from backend.config.config import config
+    from backend.core.database.manage import create_items_vector_column
+    from tests.database import test_engine
+
+    if not config.items_vectors:
+        pytest.skip("The vectors of the items are not enabled.")
+    # The vectors are enabled after the table was created without them
+    with test_engine.connect() as connection:
+        connection.execute(
+            text(f"ALTER TABLE {config.db_schema}.item DROP COLUMN vector"),
+        )
+        create_items_vector_column(connection)
+        columns = inspect(connection).get_columns("item", schema=config.db_schema)
+        connection.rollback()
+    assert "vector" in {column["name"] for column in columns}
@@ -1,5 +1,9 @@
+import struct
+import zlib
+
 from backend.items.models import Item
 from backend.triplets.models import Triplet, ValidationTriplet
+from backend.upload.archive import PNG_SIGNATURE
 
 test_item = Item(id="test-id", length=1.0, dataset="test-dataset")
 
@@ -17,3 +21,21 @@ test_validation_triplet = ValidationTriplet(
     left_id="test-id",
     right_id="test-id",
 )
+
+
+def get_png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+# A valid 1x1 grayscale image
+PNG = (
+    PNG_SIGNATURE
+    + get_png_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+    + get_png_chunk(b"IDAT", zlib.compress(b"\0\0"))
+    + get_png_chunk(b"IEND", b"")
+)
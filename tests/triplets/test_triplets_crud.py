@@ -10,3 +10,227 @@ def test_get_validation_triplet(session, validation_triplet):
 
     t_validation_triplet = crud.get_first_unlabeled_validation_triplet(session)
     assert t_validation_triplet.id == validation_triplet.id
+
+
+def test_get_triplets_items_ids(session, item, triplet):
+    from backend.triplets import crud
+
+    t_items_ids = crud.get_triplets_items_ids(session, [triplet.id, -1])
+    assert t_items_ids == {triplet.id: (item.id, item.id, item.id)}
+
+
+def test_claimed_triplet_is_not_given_twice(session, item):
+    from backend.triplets import crud
+    from backend.triplets.models import Triplet
+
+    session.add_all(
+        [
+            Triplet(
+                encoder_id=f"test-claimed-encoder-id-{index}",
+                reference_id=item.id,
+                left_id=item.id,
+                right_id=item.id,
+            )
+            for index in range(2)
+        ],
+    )
+    session.commit()
+
+    first_triplet = crud.get_first_unlabeled_triplet(session)
+    second_triplet = crud.get_first_unlabeled_triplet(session)
+    assert first_triplet.id != second_triplet.id
+    assert first_triplet.reference_length == item.length
+    assert first_triplet.reference_dataset == item.dataset
+
+
+def test_get_triplets_batch(session, item):
+    from backend.triplets import crud
+    from backend.triplets.models import ValidationTriplet
+
+    session.add_all(
+        [
+            ValidationTriplet(
+                left_encoder_id=f"test-batch-encoder-id-{index}",
+                right_encoder_id="test-batch-encoder-id",
+                reference_id=item.id,
+                left_id=item.id,
+                right_id=item.id,
+            )
+            for index in range(3)
+        ],
+    )
+    session.commit()
+
+    t_validation_triplets = crud.get_unlabeled_validation_triplets(
+        session,
+        3,
+        "test-user",
+    )
+    assert len({triplet.id for triplet in t_validation_triplets}) == 3
+    assert all(
+        triplet.lease_expires_at is not None for triplet in t_validation_triplets
+    )
+
+
+def test_set_triplets_labels(session, item):
+    import uuid
+
+    from backend.triplets import crud, schemas
+    from backend.triplets.enums import LabelStatus, SelectedItemType
+    from backend.triplets.models import Triplet
+
+    triplets = [
+        Triplet(
+            encoder_id=f"test-labels-encoder-id-{index}",
+            reference_id=item.id,
+            left_id=item.id,
+            right_id=item.id,
+            label=label,
+            lease_token=uuid.uuid4(),
+        )
+        for index, label in enumerate((None, SelectedItemType.LEFT, None))
+    ]
+    session.add_all(triplets)
+    session.commit()
+    unlabeled_triplet, labeled_triplet, lost_triplet = triplets
+    missing_triplet_id = lost_triplet.id + 1000
+
+    results = crud.set_triplets_labels(
+        session,
+        [
+            schemas.TripletLabel(
+                triplet_id=triplet_id,
+                label=SelectedItemType.RIGHT,
+                lease_token=lease_token,
+            )
+            for triplet_id, lease_token in (
+                (unlabeled_triplet.id, unlabeled_triplet.lease_token),
+                (labeled_triplet.id, labeled_triplet.lease_token),
+                (lost_triplet.id, uuid.uuid4()),
+                (missing_triplet_id, uuid.uuid4()),
+            )
+        ],
+        "test-user",
+    )
+    statuses = {result.triplet_id: result.status for result in results}
+    assert statuses == {
+        unlabeled_triplet.id: LabelStatus.APPLIED,
+        labeled_triplet.id: LabelStatus.ALREADY_LABELED,
+        lost_triplet.id: LabelStatus.LEASE_LOST,
+        missing_triplet_id: LabelStatus.NOT_FOUND,
+    }
+    session.refresh(triplets[0])
+    assert triplets[0].label == SelectedItemType.RIGHT
+
+
+def test_user_gets_back_its_leased_triplet(session, item):
+    import pytest
+
+    from backend.triplets import crud
+    from backend.triplets.enums import LeaseAction, SelectedItemType
+    from backend.triplets.exceptions import TripletLeaseError
+    from backend.triplets.models import Triplet
+    from backend.triplets.schemas import TripletLease
+
+    session.add(
+        Triplet(
+            encoder_id="test-lease-encoder-id",
+            reference_id=item.id,
+            left_id=item.id,
+            right_id=item.id,
+        ),
+    )
+    session.commit()
+
+    t_triplet = crud.get_first_unlabeled_triplet(session, "test-lease-user")
+    t_reloaded_triplet = crud.get_first_unlabeled_triplet(session, "test-lease-user")
+    assert t_reloaded_triplet.id == t_triplet.id
+    assert t_reloaded_triplet.lease_token == t_triplet.lease_token
+
+    t_released_lease = crud.update_triplets_leases(
+        session,
+        [TripletLease(triplet_id=t_triplet.id, lease_token=t_triplet.lease_token)],
+        LeaseAction.RELEASE,
+    )
+    assert t_released_lease[0].applied
+
+    with pytest.raises(TripletLeaseError):
+        crud.set_triplet_label(
+            session,
+            t_triplet.id,
+            SelectedItemType.LEFT,
+            "test-lease-user",
+            t_triplet.lease_token,
+        )
+
+
+def test_triplets_stats_follow_label_writes(session, item):
+    from backend.triplets import crud
+    from backend.triplets.enums import SelectedItemType
+    from backend.triplets.models import Triplet
+
+    session.add(
+        Triplet(
+            encoder_id="test-stats-encoder-id",
+            reference_id=item.id,
+            left_id=item.id,
+            right_id=item.id,
+        ),
+    )
+    session.commit()
+    # The triplets added by the tests do not go through the counters
+    t_stats = crud.repair_triplet_counters(session)
+
+    t_triplet = crud.get_first_unlabeled_triplet(session, "test-stats-user")
+    crud.set_triplet_label(
+        session,
+        t_triplet.id,
+        SelectedItemType.LEFT,
+        "test-stats-user",
+        t_triplet.lease_token,
+    )
+    t_new_stats = crud.get_triplets_stats(session)
+    assert t_new_stats.labeled == t_stats.labeled + 1
+    assert t_new_stats.unlabeled == t_stats.unlabeled - 1
+
+
+def test_create_triplets(session, item):
+    import pandas as pd
+    import pytest
+
+    from backend.triplets import crud
+    from backend.triplets.models import Triplet
+    from backend.triplets.utils import TRIPLET_COLUMNS, prepare_triplets
+    from backend.upload.enums import IngestMethod
+
+    triplets = prepare_triplets(
+        pd.DataFrame(
+            {
+                "reference_id": [item.id] * 2,
+                "left_id": [item.id] * 2,
+                "right_id": [item.id] * 2,
+                "encoder_id": ["test-bulk-encoder-id-1", "test-bulk-encoder-id-2"],
+                "label": [None, "left"],
+            },
+        ),
+        TRIPLET_COLUMNS,
+    )
+    # The triplets are only inserted once, whatever the number of times they are uploaded
+    t_reports = [
+        crud.create_triplets(session, triplets, method) for method in IngestMethod
+    ]
+    assert [(report.inserted, report.skipped) for report in t_reports] == [
+        (2, 0),
+        *[(0, 2)] * (len(IngestMethod) - 1),
+    ]
+
+    t_triplets = (
+        session.query(Triplet)
+        .filter(Triplet.encoder_id.startswith("test-bulk-encoder-id"))
+        .all()
+    )
+    assert len(t_triplets) == 2
+    assert sum(triplet.label is not None for triplet in t_triplets) == 1
+
+    with pytest.raises(ValueError, match="Invalid labels"):
+        prepare_triplets(triplets.assign(label="up"), TRIPLET_COLUMNS)
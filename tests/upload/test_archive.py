@@ -0,0 +1,108 @@
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.storage import FilesStorage
+from backend.upload.archive import (
+    get_datapack_images,
+    iter_datapack_table,
+    open_datapack,
+    write_datapack_images,
+)
+from backend.upload.exceptions import DatapackError
+from tests.test_data import PNG
+
+
+def test_open_datapack(tmp_path):
+    datapack_path = tmp_path / "datapack.zip"
+    with zipfile.ZipFile(datapack_path, "w", zipfile.ZIP_DEFLATED) as datapack:
+        datapack.writestr("data/items.csv", "id,length,dataset\ntest-id,1.0,test\n")
+        datapack.writestr("data/images/test-id.png", PNG)
+        datapack.writestr("data/images/corrupt-id.png", b"image")
+    images_path = tmp_path / "images"
+    images_path.mkdir()
+    with open_datapack(datapack_path) as datapack, ThreadPoolExecutor(2) as executor:
+        (items,) = iter_datapack_table(datapack, "items", {"id": "string"})
+        assert items.id.tolist() == ["test-id"]
+        assert list(iter_datapack_table(datapack, "triplets", {})) == []
+        t_images, t_unchanged, t_errors = write_datapack_images(
+            datapack,
+            get_datapack_images(datapack),
+            FilesStorage(images_path, ImagesLayout.FLAT),
+            executor,
+        )
+    assert list(t_images) == ["test-id.png"]
+    assert t_images["test-id.png"].size == len(PNG)
+    assert (
+        t_images["test-id.png"].sha256
+        == hashlib.sha256((images_path / "test-id.png").read_bytes()).hexdigest()
+    )
+    assert t_unchanged == []
+    assert list(t_errors) == ["corrupt-id.png"]
+    # The corrupt image is not written
+    assert [path.name for path in images_path.iterdir()] == ["test-id.png"]
+
+    with zipfile.ZipFile(datapack_path, "w") as datapack:
+        datapack.writestr("../data/items.csv", "")
+    with pytest.raises(DatapackError, match="Invalid path"):
+        open_datapack(datapack_path)
+
+    with zipfile.ZipFile(datapack_path, "w", zipfile.ZIP_DEFLATED) as datapack:
+        datapack.writestr("data/images/bomb.png", bytes(10 * 1024 * 1024))
+    with pytest.raises(DatapackError, match="compression ratio"):
+        open_datapack(datapack_path)
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_datapack_formats(tmp_path, compression):
+    import io
+
+    import numpy as np
+    import pandas as pd
+
+    from backend.upload.archive import open_datapack_vectors
+
+    pytest.importorskip("pyarrow")
+    items = pd.DataFrame({"id": ["test-id-1", "test-id-2"], "length": [1.0, 2.0]})
+    parquet_buffer = io.BytesIO()
+    items.to_parquet(parquet_buffer)
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    vectors_buffer = io.BytesIO()
+    np.save(vectors_buffer, vectors)
+
+    datapack_path = tmp_path / "datapack.zip"
+    with zipfile.ZipFile(datapack_path, "w", compression) as datapack:
+        datapack.writestr("data/items.parquet", parquet_buffer.getvalue())
+        datapack.writestr("data/items.csv", "id\ntest-id-csv\n")
+        datapack.writestr("data/vectors.npy", vectors_buffer.getvalue())
+    with open_datapack(datapack_path) as datapack:
+        (t_items,) = iter_datapack_table(datapack, "items", {})
+        assert t_items.id.tolist() == items.id.tolist()
+        with open_datapack_vectors(datapack) as t_vectors:
+            assert (t_vectors.rows_count, t_vectors.dimension) == (2, 3)
+            assert t_vectors.read(1).tolist() == vectors[:1].tolist()
+            assert t_vectors.read(1).tolist() == vectors[1:].tolist()
+    # The compressed Parquet file is decompressed to a temporary file, which is removed
+    assert [path.name for path in tmp_path.iterdir()] == ["datapack.zip"]
+
+
+def test_save_upload(tmp_path):
+    import asyncio
+
+    from backend.upload.archive import save_upload
+    from backend.upload.exceptions import UploadTooLargeError
+
+    async def stream():
+        for chunk in [b"first", b"second"]:
+            yield chunk
+
+    upload_path = tmp_path / "upload.zip"
+    assert asyncio.run(save_upload(stream(), upload_path, 11)) == 11
+    assert upload_path.read_bytes() == b"firstsecond"
+    # The upload is stopped at the chunk exceeding the maximum size, and removed
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload(stream(), upload_path, 10))
+    assert not upload_path.exists()
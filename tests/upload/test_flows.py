@@ -0,0 +1,148 @@
+import zipfile
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.images_utils.crud import get_image
+from backend.images_utils.enums import ImagesLayout
+from backend.images_utils.storage import FilesStorage
+from backend.images_utils.utils import parse_image_name
+from backend.items.crud import get_item
+from backend.triplets.crud import delete_triplets
+from backend.triplets.models import Triplet
+from backend.upload import crud, flows
+from backend.upload.enums import UploadPhase
+from backend.upload.exceptions import DatapackValidationError
+from backend.upload.progress import UploadProgress
+from tests.test_data import PNG
+
+ITEMS = "id,length,dataset\nflow-a,1.0,test\nflow-b,2.0,test\nflow-c,3.0,test\n"
+TRIPLETS = "reference_id,left_id,right_id,encoder_id\nflow-a,flow-b,flow-c,encoder\n"
+
+
+def write_datapack(path, triplets=TRIPLETS, items=ITEMS, images=None):
+    images = {
+        f"{item_id}{suffix}.stp.png": PNG
+        for item_id in ["flow-a", "flow-b", "flow-c"]
+        for suffix in ["", "_canonical"]
+    } | (images or {})
+    with zipfile.ZipFile(path, "w") as datapack:
+        datapack.writestr("data/items.csv", items)
+        datapack.writestr("data/triplets.csv", triplets)
+        for name, content in images.items():
+            datapack.writestr(f"data/images/{name}", content)
+    return path
+
+
+# Uploads the datapack and returns the phases which were run and the triplets of its items in the database
+def upload(session, path):
+    job = crud.create_upload_job(session, path, "test-user")
+    flows.upload_data(path, session, UploadProgress(session, job.id))
+    crud.finish_upload_job(session, job.id)
+    session.expire_all()
+    return (
+        {phase.phase for phase in crud.get_upload_job(session, job.id).phases},
+        session.scalar(
+            select(func.count())
+            .select_from(Triplet)
+            .where(Triplet.reference_id.in_(["flow-a", "flow-b"])),
+        ),
+    )
+
+
+# The modification times of the stored images, in their files and in the manifest
+def get_images_mtimes(session, images_path):
+    session.expire_all()
+    return {
+        path.name: (
+            path.stat().st_mtime_ns,
+            get_image(session, *parse_image_name(path.name)).mtime,
+        )
+        for path in images_path.iterdir()
+    }
+
+
+def test_upload_data(session, tmp_path, monkeypatch):
+    storage = FilesStorage(tmp_path / "images", ImagesLayout.FLAT)
+    monkeypatch.setattr(flows, "images_storage", storage)
+    datapack_path = write_datapack(tmp_path / "datapack.zip")
+
+    t_phases, t_count = upload(session, datapack_path)
+    assert {UploadPhase.ITEMS, UploadPhase.TRIPLETS} <= t_phases
+    assert t_count == 1
+    images_mtimes = get_images_mtimes(session, tmp_path / "images")
+    assert len(images_mtimes) == 6
+
+    # The files and the images already written are skipped when the same datapack is uploaded again
+    t_phases, t_count = upload(session, datapack_path)
+    assert not {UploadPhase.ITEMS, UploadPhase.TRIPLETS} & t_phases
+    assert t_count == 1
+    assert get_images_mtimes(session, tmp_path / "images") == images_mtimes
+
+    # The deleted triplets are written again
+    delete_triplets(session)
+    t_phases, t_count = upload(session, datapack_path)
+    assert UploadPhase.TRIPLETS in t_phases
+    assert UploadPhase.ITEMS not in t_phases
+    assert t_count == 1
+
+    # A changed file or image is written again, the unchanged ones are still skipped
+    write_datapack(
+        datapack_path,
+        TRIPLETS + "flow-b,flow-a,flow-c,encoder\n",
+        images={"flow-a.stp.png": PNG + b"\0"},
+    )
+    t_phases, t_count = upload(session, datapack_path)
+    assert UploadPhase.TRIPLETS in t_phases
+    assert UploadPhase.ITEMS not in t_phases
+    assert t_count == 2
+    t_mtimes = get_images_mtimes(session, tmp_path / "images")
+    assert t_mtimes.pop("flow-a.stp.png") != images_mtimes.pop("flow-a.stp.png")
+    assert t_mtimes == images_mtimes
+    assert get_image(session, "flow-a").size == len(PNG) + 1
+
+
+def test_upload_data_invalid_length(session, tmp_path):
+    datapack_path = write_datapack(
+        tmp_path / "datapack.zip",
+        items=ITEMS.replace("flow-b,2.0", "flow-b,long"),
+    )
+    job = crud.create_upload_job(session, datapack_path, "test-user")
+    with pytest.raises(DatapackValidationError) as e:
+        flows.upload_data(datapack_path, session, UploadProgress(session, job.id))
+    crud.finish_upload_job(session, job.id, str(e.value))
+
+    # Only the invalid value is reported, the file is still read and its ids known
+    assert [
+        (problem.file, problem.row, problem.column, problem.value, problem.message)
+        for problem in e.value.problems
+    ] == [("items", 1, "length", "long", "Invalid length")]
+
+
+def test_upload_data_corrupt_image(session, tmp_path, monkeypatch):
+    storage = FilesStorage(tmp_path / "images", ImagesLayout.FLAT)
+    monkeypatch.setattr(flows, "images_storage", storage)
+    datapack_path = write_datapack(
+        tmp_path / "datapack.zip",
+        triplets=TRIPLETS.replace("flow-c", "flow-d"),
+        items=ITEMS + "flow-d,4.0,test\n",
+        images={
+            "flow-d.stp.png": PNG[:-1] + b"\0",
+            "flow-d_canonical.stp.png": b"GIF89a",
+        },
+    )
+    job = crud.create_upload_job(session, datapack_path, "test-user")
+    with pytest.raises(DatapackValidationError) as e:
+        flows.upload_data(datapack_path, session, UploadProgress(session, job.id))
+    crud.finish_upload_job(session, job.id, str(e.value))
+
+    assert sorted(
+        (problem.file, problem.value, problem.message) for problem in e.value.problems
+    ) == [
+        ("images", "flow-d.stp.png", "Invalid checksum of the PNG IEND chunk."),
+        ("images", "flow-d_canonical.stp.png", "Invalid PNG signature."),
+    ]
+    # The corrupt images are not written, unlike the rest of the datapack
+    assert not (tmp_path / "images" / "flow-d.stp.png").exists()
+    assert not (tmp_path / "images" / "flow-d_canonical.stp.png").exists()
+    assert get_item(session, "flow-d") is not None
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from starlette.datastructures import Headers
+
+from backend.upload.exceptions import UploadFormError
+from backend.upload.forms import iter_form_file
+
+BODY = (
+    b"--boundary\r\n"
+    b'Content-Disposition: form-data; name="comment"\r\n\r\n'
+    b"datapack\r\n"
+    b"--boundary\r\n"
+    b'Content-Disposition: form-data; name="file"; filename="datapack.zip"\r\n'
+    b"Content-Type: application/zip\r\n\r\n"
+    b"zip\r\ncontent\r\n"
+    b"--boundary--\r\n"
+)
+
+
+async def read_form_file(body, field_name="file", chunk_size=3):
+    async def stream():
+        for start in range(0, len(body), chunk_size):
+            yield body[start : start + chunk_size]
+
+    headers = Headers({"content-type": "multipart/form-data; boundary=boundary"})
+    return b"".join(
+        [chunk async for chunk in iter_form_file(headers, stream(), field_name)],
+    )
+
+
+def test_iter_form_file():
+    # The file is found whatever the way the body is split
+    assert asyncio.run(read_form_file(BODY)) == b"zip\r\ncontent"
+    assert asyncio.run(read_form_file(BODY, chunk_size=len(BODY))) == b"zip\r\ncontent"
+    with pytest.raises(UploadFormError, match="no comment field"):
+        asyncio.run(read_form_file(BODY, "comment"))
@@ -0,0 +1,26 @@
+import io
+
+import pytest
+
+from backend.core.database.bulk import iter_chunks, prefetch
+from backend.upload.enums import CsvEngine
+from backend.upload.readers import read_csv_chunks
+
+
+@pytest.mark.parametrize("engine", list(CsvEngine))
+def test_read_csv_chunks(engine):
+    if engine == CsvEngine.PYARROW:
+        pytest.importorskip("pyarrow")
+    file = io.BytesIO(b"id,length,dataset\n001,1.5,test\n002,2,\n003,3,test\n")
+    chunks = list(
+        read_csv_chunks(
+            file,
+            {"id": "string", "length": "float64", "dataset": "string", "other": "string"},
+            engine,
+            chunk_size=2,
+        ),
+    )
+    items = list(prefetch(iter_chunks(chunks, 2)))
+    assert [item_id for item in items for item_id in item.id] == ["001", "002", "003"]
+    assert items[0].length.dtype.kind == "f"
+    assert items[0].dataset.isna().tolist() == [False, True]
@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+import uuid
+
+import pytest
+
+from backend.upload.exceptions import (
+    UploadChecksumError,
+    UploadSessionIncompleteError,
+)
+from backend.upload.sessions import assemble_chunks, get_received_chunks, save_chunk
+
+
+async def _stream(data: bytes):
+    yield data
+
+
+def test_upload_session_chunks(tmp_path):
+    session_id = uuid.uuid4()
+    chunks = [b"first chunk", b"second chunk"]
+
+    with pytest.raises(UploadChecksumError):
+        asyncio.run(save_chunk(session_id, 1, _stream(chunks[1]), "00"))
+    asyncio.run(
+        save_chunk(
+            session_id,
+            1,
+            _stream(chunks[1]),
+            hashlib.sha256(chunks[1]).hexdigest(),
+        ),
+    )
+    assert get_received_chunks(session_id) == [1]
+    with pytest.raises(UploadSessionIncompleteError, match="Missing chunks: 0"):
+        assemble_chunks(session_id, 2, tmp_path / "datapack.zip")
+
+    asyncio.run(
+        save_chunk(
+            session_id,
+            0,
+            _stream(chunks[0]),
+            hashlib.sha256(chunks[0]).hexdigest(),
+        ),
+    )
+    assemble_chunks(
+        session_id,
+        2,
+        tmp_path / "datapack.zip",
+        hashlib.sha256(b"".join(chunks)).hexdigest(),
+    )
+    assert (tmp_path / "datapack.zip").read_bytes() == b"".join(chunks)
+    assert get_received_chunks(session_id) == []
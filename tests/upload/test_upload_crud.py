@@ -0,0 +1,125 @@
+from pathlib import Path
+
+from backend.upload import crud
+from backend.upload.enums import UploadJobStatus
+
+
+def test_upload_jobs(session):
+    first_job = crud.create_upload_job(session, Path("first.zip"), "test-user")
+    second_job = crud.create_upload_job(session, Path("second.zip"), "test-user")
+
+    t_job = crud.claim_next_upload_job(session, max_concurrent_uploads=1)
+    assert t_job.id == first_job.id
+    assert t_job.status == UploadJobStatus.RUNNING
+    assert t_job.attempts == 1
+    # The limit of concurrent uploads is reached
+    assert crud.claim_next_upload_job(session, max_concurrent_uploads=1) is None
+
+    crud.finish_upload_job(session, first_job.id)
+    t_job = crud.claim_next_upload_job(session, max_concurrent_uploads=1)
+    assert t_job.id == second_job.id
+
+    # The second job is interrupted, it is run again until it has no attempts left
+    assert crud.recover_upload_jobs(session, 0, max_attempts=2) == []
+    assert crud.get_upload_job(session, second_job.id).status == UploadJobStatus.QUEUED
+    crud.claim_next_upload_job(session, max_concurrent_uploads=1)
+    assert crud.recover_upload_jobs(session, 0, max_attempts=2) == ["second.zip"]
+    session.expire_all()
+    t_job = crud.get_upload_job(session, second_job.id)
+    assert t_job.status == UploadJobStatus.FAILED
+    assert t_job.error is not None
+    assert crud.get_upload_job(session, first_job.id).status == (
+        UploadJobStatus.SUCCEEDED
+    )
+
+
+def test_upload_jobs_restart(session, monkeypatch):
+    import asyncio
+
+    from backend.config.config import config
+    from backend.upload import jobs
+
+    job = crud.create_upload_job(session, Path("restart.zip"), "test-user")
+    crud.claim_next_upload_job(session, max_concurrent_uploads=1)
+
+    # The app restarts before the heartbeat of its running job is stale, the job looks alive
+    assert crud.recover_upload_jobs(session) == []
+    assert crud.claim_next_upload_job(session, max_concurrent_uploads=1) is None
+
+    # The pass scheduled at startup recovers the job once it is stale
+    monkeypatch.setattr(config, "upload_job_stale_timeout_in_seconds", 0)
+    monkeypatch.setattr(
+        jobs,
+        "submit_upload_jobs",
+        lambda: crud.recover_upload_jobs(session, 0),
+    )
+
+    async def restart():
+        jobs.schedule_upload_jobs_recovery()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(restart())
+    session.expire_all()
+    assert crud.get_upload_job(session, job.id).status == UploadJobStatus.QUEUED
+    t_job = crud.claim_next_upload_job(session, max_concurrent_uploads=1)
+    assert t_job.id == job.id
+    crud.finish_upload_job(session, job.id)
+
+
+def test_upload_progress(session):
+    import datetime
+
+    import pytest
+
+    from backend.upload.enums import UploadPhase
+    from backend.upload.progress import UploadProgress
+
+    job = crud.create_upload_job(session, Path("progress.zip"), "test-user")
+    progress = UploadProgress(session, job.id)
+    with progress.phase(UploadPhase.TRIPLETS, 4):
+        progress.advance(1)
+        session.commit()
+        session.expire_all()
+        (t_phase,) = crud.get_upload_job(session, job.id).phases
+        assert (t_phase.phase, t_phase.done_count) == (UploadPhase.TRIPLETS, 1)
+        assert t_phase.finished_at is None
+        # The first row took a second, the three other ones are expected to take three
+        t_phase.started_at = t_phase.updated_at - datetime.timedelta(seconds=1)
+        assert t_phase.rows_per_second == 1
+        assert t_phase.estimated_completion_at == (
+            t_phase.updated_at + datetime.timedelta(seconds=3)
+        )
+        session.expire(t_phase)
+        progress.advance(3)
+
+    session.expire_all()
+    (t_phase,) = crud.get_upload_job(session, job.id).phases
+    assert t_phase.done_count == 4
+    assert t_phase.estimated_completion_at == t_phase.finished_at
+
+    # A failed phase is left unfinished, and stops recording the advances
+    msg = "The phase failed."
+    with (
+        pytest.raises(ValueError, match=msg),
+        progress.phase(UploadPhase.VALIDATION_TRIPLETS),
+    ):
+        raise ValueError(msg)
+    assert progress.current_phase is None
+    session.expire_all()
+    t_phase = crud.get_upload_job(session, job.id).phases[-1]
+    assert t_phase.phase == UploadPhase.VALIDATION_TRIPLETS
+    assert t_phase.finished_at is None
+    crud.finish_upload_job(session, job.id)
+
+
+def test_datapack_files(session):
+    crud.add_datapack_file(session, "triplets", "test-sha256", 2)
+    # Recording the same file again does nothing
+    crud.add_datapack_file(session, "triplets", "test-sha256", 2)
+
+    t_files = crud.get_datapack_files(
+        session,
+        {"triplets": "test-sha256", "items": "test-sha256"},
+    )
+    assert list(t_files) == ["triplets"]
+    assert t_files["triplets"].rows_count == 2
@@ -0,0 +1,80 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from backend.images_utils.crud import upsert_images
+from backend.triplets.utils import TRIPLET_COLUMNS
+from backend.upload.exceptions import DatapackValidationError
+from backend.upload.validation import DatapackValidator
+
+
+def test_datapack_validator(session, item):
+    upsert_images(
+        session,
+        [
+            {
+                "item_id": "test-id",
+                "canonical": canonical,
+                "size": 0,
+                "mtime": datetime.datetime.now(datetime.timezone.utc),
+                "sha256": "",
+            }
+            for canonical in [False, True]
+        ],
+    )
+    validator = DatapackValidator(
+        [
+            "new-id.stp.png",
+            "new-id_canonical.stp.png",
+            "lonely-id.stp.png",
+        ],
+    )
+    validator.check_items(
+        "items",
+        pd.DataFrame({"id": ["new-id"], "length": [1.0], "dataset": ["test"]}),
+        0,
+    )
+    triplets = pd.DataFrame(
+        {
+            "reference_id": ["new-id", "test-id", "new-id"],
+            "left_id": ["test-id", "unknown-id", "test-id"],
+            "right_id": ["new-id", "new-id", "new-id"],
+            "encoder_id": ["encoder", "encoder", "encoder"],
+            "label": [None, "LEFT", "wrong"],
+        },
+    )
+    # The rows of the second chunk are counted after those of the first one
+    validator.check_triplets("triplets", triplets.iloc[:2], 0, TRIPLET_COLUMNS)
+    validator.check_triplets(
+        "triplets",
+        triplets.iloc[2:].reset_index(drop=True),
+        2,
+        TRIPLET_COLUMNS,
+    )
+    with pytest.raises(DatapackValidationError) as e:
+        validator.finish(session)
+
+    assert {
+        (problem.file, problem.row, problem.column, problem.value, problem.message)
+        for problem in e.value.problems
+    } == {
+        ("triplets", 2, "label", "wrong", "Invalid label"),
+        ("triplets", 2, None, None, "Duplicate triplet"),
+        ("triplets", 1, "left_id", "unknown-id", "Unknown item"),
+        ("triplets", 1, "left_id", "unknown-id", "Missing image"),
+        ("triplets", 1, "left_id", "unknown-id", "Missing canonical image"),
+        ("images", None, None, "lonely-id", "Missing canonical image"),
+    }
+
+    validator = DatapackValidator([], max_problems=1)
+    validator.check_items("items", pd.DataFrame({"id": [None, None]}), 0)
+    validator.check_items(
+        "items",
+        pd.DataFrame({"id": [None], "length": [None], "dataset": [None]}),
+        0,
+    )
+    with pytest.raises(DatapackValidationError) as e:
+        validator.finish(session)
+    assert e.value.problems_count == 1
+    assert e.value.problems[0].message == "Missing columns: length, dataset"